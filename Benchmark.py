@@ -0,0 +1,173 @@
+import argparse
+import json
+import sys
+import time
+import numpy as np
+import OrbitalElements
+import J2RelativeMotion
+import DragRelativeMotion
+import HeatMapEngine
+import StationKeeping
+import Instrumentation
+
+# the initial conditions tab defaults
+reference_orbit = OrbitalElements.OrbitalElements(6678136.6, 0.0001, 0.52, 0.0, 0.0, 0.0, J2RelativeMotion.mu)
+mean_state = [0.1, 0.1, 0.01, -0.02, 0.0, 0.01]
+nominal_formation = [1.41421, 14.1421, 1.41421, 0.0, 0.0, 0.0]
+variances = [0.1, 0.1, 0.1, 0.1, 0.1, 0.1]
+
+default_tolerance = 0.25  # slower or larger than the baseline by this fraction counts as a regression
+noise_floor = {"seconds": 0.002, "rhs_evaluations": 0, "peak_bytes": 65536}  # absolute slack per metric
+
+
+# ############################## BENCHMARK CASES ############################## #
+
+def propagator_case(type, end_seconds, method='analytic'):
+    times = np.arange(int(end_seconds) + 1, dtype=float)
+    return lambda: J2RelativeMotion.j2_sedwick_propagator(mean_state, reference_orbit, times, 1.0, type, 0.0, 30.0,
+                                                          False, method)
+
+
+def heatmap_case(num_axis_points, end_seconds, adaptive=False):
+    return lambda: HeatMapEngine.heat_map_xy(variances[3], variances[4], mean_state, reference_orbit, end_seconds,
+                                             1000, 3, 4, 0.0, 30.0, num_axis_points, adaptive=adaptive)
+
+
+def targeter_case(end_seconds):
+    times = np.linspace(0.0, end_seconds, int(end_seconds))
+    return lambda: J2RelativeMotion.j2_sedwick_target_trajectory(mean_state, nominal_formation, reference_orbit,
+                                                                 times, times[1] - times[0], end_seconds, 0.0, 30.0)
+
+
+def station_keeping_case(end_seconds, step):
+    return lambda: StationKeeping.simulate_station_keeping(mean_state, nominal_formation, reference_orbit, step,
+                                                           end_seconds, 0.0, 30.0)
+
+
+def drag_case(samples):
+    times = np.linspace(0.0, 10000.0, samples)
+    return lambda: DragRelativeMotion.drag_cw(mean_state, times, reference_orbit)
+
+
+def conversion_orbits(count):
+    rng = np.random.default_rng(0)
+    return [OrbitalElements.OrbitalElements(a, e, i, w, o, nu, J2RelativeMotion.mu) for a, e, i, w, o, nu in
+            zip(rng.uniform(6.7e6, 4.2e7, count), rng.uniform(0.001, 0.7, count), rng.uniform(0.01, 3.1, count),
+                *rng.uniform(0.0, 2 * np.pi, (3, count)))]
+
+
+def get_cartesian_case(count):
+    orbits = conversion_orbits(count)
+    return lambda: [orbit.get_cartesian() for orbit in orbits]
+
+
+def from_cartesian_case(count):
+    states = [orbit.get_cartesian() for orbit in conversion_orbits(count)]
+    return lambda: [OrbitalElements.from_cartesian(r, v, J2RelativeMotion.mu) for r, v in states]
+
+
+def element_set_case(count):
+    elements = OrbitalElements.OrbitalElementSet.from_orbits(conversion_orbits(count))
+    return lambda: OrbitalElements.from_cartesian_set(*elements.to_cartesian(), J2RelativeMotion.mu)
+
+
+# name -> zero-argument callable building the benchmark, so setup is not timed
+cases = {
+    "propagator_type_0": lambda: propagator_case(0, 10000),
+    "propagator_type_1": lambda: propagator_case(1, 10000),
+    "propagator_type_2": lambda: propagator_case(2, 10000),
+    "propagator_type_3": lambda: propagator_case(3, 10000),
+    "propagator_type_4": lambda: propagator_case(4, 10000),
+    "propagator_type_5": lambda: propagator_case(5, 10000),
+    "propagator_type_1_dopri5": lambda: propagator_case(1, 2000, 'dopri5'),
+    "propagator_type_1_screening": lambda: propagator_case(1, 2000, 'screening'),
+    "propagator_type_1_precise": lambda: propagator_case(1, 2000, 'precise'),
+    "heatmap_10_10000s": lambda: heatmap_case(10, 10000),
+    "heatmap_30_10000s": lambda: heatmap_case(30, 10000),
+    "heatmap_30_100000s": lambda: heatmap_case(30, 100000),
+    "heatmap_65_10000s_adaptive": lambda: heatmap_case(65, 10000, adaptive=True),
+    "targeter_10000s": lambda: targeter_case(10000),
+    "station_keeping_1day": lambda: station_keeping_case(86400, 10.0),
+    "drag_cw_10000": lambda: drag_case(10000),
+    "get_cartesian_1000": lambda: get_cartesian_case(1000),
+    "from_cartesian_1000": lambda: from_cartesian_case(1000),
+    "element_set_roundtrip_1000": lambda: element_set_case(1000),
+}
+
+
+# ############################## BENCHMARK RUNNER ############################## #
+
+def run_case(name, repeats=3):
+    # best wall time of several uninstrumented runs, then one instrumented run for RHS evaluations and peak memory
+    function = cases[name]()
+    seconds = []
+    for _ in range(repeats):
+        begin = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - begin)
+
+    Instrumentation.start()
+    try:
+        function()
+    finally:
+        counters = Instrumentation.stop()
+    return {"name": name, "seconds": min(seconds), "rhs_evaluations": counters.rhs_evaluations,
+            "peak_bytes": counters.peak_bytes, "phase_seconds": counters.phase_seconds}
+
+
+def compare(results, baseline, tolerance=default_tolerance):
+    # flag every metric that grew by more than tolerance against the baseline run of the same case
+    previous = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        if result["name"] not in previous:
+            continue
+        for metric in ("seconds", "rhs_evaluations", "peak_bytes"):
+            before = previous[result["name"]][metric]
+            if result[metric] > before * (1 + tolerance) + noise_floor[metric]:
+                regressions.append({"name": result["name"], "metric": metric, "baseline": before,
+                                    "current": result[metric]})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time STARMAP computations and compare them against a baseline.")
+    parser.add_argument("cases", nargs="*", help="names or name prefixes of the cases to run (default: all)")
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    parser.add_argument("-o", "--output", help="also write the results to this JSON file")
+    parser.add_argument("-b", "--baseline", help="JSON results of an earlier run on this machine to compare "
+                                                 "against, saved with --save-baseline")
+    parser.add_argument("-s", "--save-baseline", help="write the results as a new baseline to this file")
+    parser.add_argument("-t", "--tolerance", type=float, default=default_tolerance)
+    parser.add_argument("-l", "--list", action="store_true", help="list the cases and exit")
+    arguments = parser.parse_args(argv)
+
+    if arguments.list:
+        print("\n".join(cases))
+        return 0
+    names = [name for name in cases if not arguments.cases or any(name.startswith(prefix)
+                                                                  for prefix in arguments.cases)]
+    if not names:
+        parser.error("no cases match: " + ", ".join(arguments.cases))
+
+    report = {"python": sys.version.split()[0], "numpy": np.__version__, "repeats": arguments.repeats,
+              "results": []}
+    for name in names:
+        report["results"].append(run_case(name, arguments.repeats))
+        print(json.dumps(report["results"][-1]), file=sys.stderr)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            report["regressions"] = compare(report["results"], json.load(baseline_file), arguments.tolerance)
+    for path in (arguments.output, arguments.save_baseline):
+        if path:
+            with open(path, "w") as report_file:
+                json.dump(report, report_file, indent=2)
+    print(json.dumps(report, indent=2))
+    return 1 if report.get("regressions") else 0
+
+# ############################################################################# #
+
+
+if __name__ == '__main__':
+    sys.exit(main())
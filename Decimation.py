@@ -0,0 +1,70 @@
+import numpy as np
+
+default_point_budget = 4000  # points drawn per series, about what a canvas can resolve
+
+
+# ############################## LEVEL OF DETAIL ############################## #
+
+def decimate_indices(columns, budget=default_point_budget, keep=None):
+    # sorted indices of at most about budget samples of the equal-length columns: the first and last sample plus
+    # the minimum and maximum of every column in each bucket, so the envelope of the series is preserved. indices
+    # in keep (e.g. range transitions) are always included on top of the budget
+    columns = [np.asarray(column) for column in columns]
+    count = len(columns[0])
+    if count <= budget:
+        return np.arange(count)
+    size = -(-count // max(1, budget // (2 * len(columns))))
+    buckets = -(-count // size)
+    offsets = np.arange(buckets) * size
+    chosen = [np.array([0, count - 1])]
+    for column in columns:
+        padded = np.pad(column, (0, buckets * size - count), mode='edge').reshape(buckets, size)
+        chosen += [offsets + np.argmin(padded, axis=1), offsets + np.argmax(padded, axis=1)]
+    if keep is not None:
+        chosen.append(np.asarray(keep, dtype=int))
+    return np.unique(np.clip(np.concatenate(chosen), 0, count - 1))
+
+
+def transition_indices(mask):
+    # the samples on both sides of every change of a boolean series, e.g. entering or leaving the range
+    changes = np.flatnonzero(np.asarray(mask[1:]) != np.asarray(mask[:-1]))
+    return np.concatenate((changes, changes + 1))
+
+
+def gap_indices(t):
+    # the samples on both sides of every gap in a sampled time series, which is where a series split by
+    # J2RelativeMotion.split_by_range enters or leaves the range
+    t = np.asarray(t, dtype=float)
+    if len(t) < 3:
+        return np.arange(len(t))
+    spacing = np.diff(t)
+    gaps = np.flatnonzero(spacing > 1.5 * np.min(spacing))
+    return np.concatenate((gaps, gaps + 1))
+
+
+def view_indices(columns, limits, budget=default_point_budget, keep=None):
+    # decimate only the samples inside the box limits, one (low, high) per column, so zooming in brings back
+    # detail. returns the indices and, per consecutive pair, whether samples outside the view lie between them
+    columns = [np.asarray(column) for column in columns]
+    inside = np.ones(len(columns[0]), dtype=bool)
+    for column, (low, high) in zip(columns, limits):
+        inside &= (column >= min(low, high)) & (column <= max(low, high))
+    # one more sample either side, so lines still run to the edge of the view
+    visible = np.flatnonzero(inside | np.concatenate((inside[1:], [False])) | np.concatenate(([False], inside[:-1])))
+    if len(visible) == 0:
+        return visible, np.zeros(0, dtype=bool)
+    keep_positions = None
+    if keep is not None:
+        keep_positions = np.searchsorted(visible, keep)
+        keep_positions = keep_positions[(keep_positions < len(visible))]
+        keep_positions = keep_positions[np.isin(visible[keep_positions], keep)]
+    chosen = decimate_indices([column[visible] for column in columns], budget, keep_positions)
+    segments = np.cumsum(np.diff(visible, prepend=visible[0]) > 1)[chosen]
+    return visible[chosen], segments[1:] != segments[:-1]
+
+
+def with_breaks(values, breaks):
+    # NaN between samples separated by points outside the view, so a line is not drawn across the gap
+    return np.insert(np.asarray(values, dtype=float), np.flatnonzero(breaks) + 1, np.nan)
+
+# ########################################################################### #
@@ -0,0 +1,108 @@
+import os
+import numpy as np
+import DispersionEngine
+import DragRelativeMotion
+import GraphWidgets
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QFrame, QComboBox, QTableWidget, \
+    QTableWidgetItem, QLabel
+from PyQt5.QtCore import pyqtSlot
+from PyQt5 import QtWidgets
+
+
+# ############################## DISPERSION ANALYSIS ############################## #
+
+class Dispersion(QWidget):
+
+    def __init__(self):
+        super(QWidget, self).__init__()
+        self.layout = QVBoxLayout(self)
+
+        self.summary_label = QLabel("")
+        self.summary_table = QTableWidget()
+        self.summary_table.setColumnCount(6)
+        self.summary_table.setHorizontalHeaderLabels(["Metric", "Mean", "Mean CI", "5th Percentile", "Median",
+                                                      "95th Percentile"])
+        for column in range(6):
+            self.summary_table.horizontalHeader().setSectionResizeMode(column, QtWidgets.QHeaderView.Stretch)
+        self.distribution_plot = GraphWidgets.GraphView2D()
+
+        self.layout.addWidget(self.summary_label)
+        self.layout.addWidget(self.summary_table)
+        self.layout.addWidget(self.distribution_plot)
+
+        self.bottom_panel = QFrame()
+        self.bottom_layout = QHBoxLayout()
+        self.metric_menu = QComboBox()
+        self.metric_menu.addItems(["Time within Constraint", "First Exit Time", "Pass Count"])
+        self.metric_menu.activated.connect(self.when_metric_menu_activated)
+        self.bottom_layout.addWidget(self.metric_menu)
+        self.bottom_panel.setLayout(self.bottom_layout)
+        self.layout.addWidget(self.bottom_panel)
+
+        self.samples = 10000
+        self.distribution = "uniform"
+        self.seed = 0
+        self.num_workers = os.cpu_count()
+        self.model = "j2"
+        self.drag_alpha = DragRelativeMotion.default_alpha
+        self.confidence = DispersionEngine.default_confidence
+
+        self.mean_state = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        self.dispersions = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        self.reference_orbit = None
+        self.end_seconds = 10
+        self.result = None
+
+    def set_dispersion_parameters(self, mean_state, dispersions, reference_orbit, end_seconds):
+        self.mean_state = list(mean_state)
+        self.dispersions = list(dispersions)
+        self.reference_orbit = reference_orbit
+        self.end_seconds = end_seconds
+
+    def compute_dispersion(self, recorded_times, threshold_min, threshold_max, control=None):
+        # safe to run off the GUI thread, only reads the parameters set above
+        return DispersionEngine.dispersion_analysis(self.mean_state, self.dispersions, self.reference_orbit,
+                                                    self.end_seconds, recorded_times, threshold_min, threshold_max,
+                                                    self.samples, self.distribution, self.seed, self.num_workers,
+                                                    control, self.model, self.drag_alpha)
+
+    def show_dispersion(self, result):
+        self.result = result
+        summary = result.get_summary(self.confidence)
+        interval = summary["exit_probability_interval"]
+        self.summary_label.setText(str(summary["samples"]) + " samples (" + self.distribution + ") | P(exit before " +
+                                   str(self.end_seconds) + " s) = " + "%.4f" % summary["exit_probability"] +
+                                   " [" + "%.4f" % interval[0] + ", " + "%.4f" % interval[1] + "] at " +
+                                   str(int(self.confidence * 100)) + "% confidence")
+
+        rows = [("Time within Constraint (%)", summary["time_in_constraint"]),
+                ("First Exit Time (s)", summary["first_exit_time"]),
+                ("Pass Count", summary["pass_count"])]
+        self.summary_table.setRowCount(len(rows))
+        for row, (name, statistics) in enumerate(rows):
+            cells = [name, "%.4g" % statistics["mean"],
+                     "%.4g - %.4g" % tuple(statistics["mean_interval"])]
+            for percentile in DispersionEngine.percentiles:
+                cells.append("%.4g [%.4g, %.4g]" % ((statistics["p" + str(percentile)], ) +
+                                                    tuple(statistics["p" + str(percentile) + "_interval"])))
+            for column, text in enumerate(cells):
+                self.summary_table.setItem(row, column, QTableWidgetItem(text))
+
+        self.plot_distribution()
+
+    def plot_distribution(self):
+        # sorted values against their member rank, i.e. the inverse of the empirical distribution
+        values = [self.result.get_time_in_constraint(), self.result.get_first_exit_time(),
+                  self.result.get_pass_counts()][self.metric_menu.currentIndex()]
+        values = np.sort(values[~np.isnan(values)])
+        self.distribution_plot.update_graph([values, ],
+                                            "Dispersion of " + self.metric_menu.currentText() + " over " +
+                                            str(len(self.result)) + " samples",
+                                            ["Sample Rank", self.metric_menu.currentText()])
+
+    @pyqtSlot(int)
+    def when_metric_menu_activated(self, index):
+        if self.result is not None:
+            self.plot_distribution()
+
+# ################################################################################ #
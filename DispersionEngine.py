@@ -0,0 +1,158 @@
+import statistics
+import numpy as np
+import J2RelativeMotion
+import DragRelativeMotion
+import HeatMapEngine
+import Instrumentation
+
+distributions = ("uniform", "normal")
+default_confidence = 0.95
+percentiles = (5, 50, 95)
+
+
+# ############################## MONTE CARLO DISPERSION ############################## #
+
+def sample_states(mean_state, dispersions, samples, distribution="uniform", seed=0):
+    # "uniform" draws every component within mean +/- dispersion, the same bounds the heatmap axes span,
+    # "normal" reads the dispersions as 3-sigma bounds. sampling is seeded, so runs are reproducible
+    rng = np.random.default_rng(seed)
+    dispersions = np.asarray(dispersions[:6], dtype=float)
+    if distribution == "uniform":
+        offsets = rng.uniform(-1.0, 1.0, (samples, 6)) * dispersions
+    elif distribution == "normal":
+        offsets = rng.standard_normal((samples, 6)) * dispersions / 3
+    else:
+        raise ValueError("unknown dispersion distribution: " + str(distribution))
+    return np.asarray(mean_state[:6], dtype=float) + offsets
+
+
+def member_metrics(states, reference_orbit, times, step, thresh_min, thresh_max, model="j2",
+                   drag_alpha=DragRelativeMotion.default_alpha):
+    # (N, 3) time in constraint (% of samples, like the heatmap), first exit time (s, NaN when the member never
+    # leaves the range) and pass count for every row of states. like the threshold modes the initial state is
+    # skipped, so exits are resolved to the sample step
+    if model == "j2":
+        magnitudes = J2RelativeMotion.j2_sedwick_ensemble(states, reference_orbit, times, step, 4, thresh_min,
+                                                          thresh_max)
+    elif model == "drag":
+        magnitudes = DragRelativeMotion.drag_ensemble(states, reference_orbit, times, step, 4, thresh_min,
+                                                      thresh_max, drag_alpha)
+    else:
+        raise ValueError("unknown relative motion model: " + str(model))
+    with Instrumentation.phase("reduce"):
+        in_range = J2RelativeMotion.in_range_mask(magnitudes, thresh_min, thresh_max)
+        t = J2RelativeMotion.sample_times(times, step)
+        exited = ~np.all(in_range, axis=1)
+        first_exit = np.where(exited, t[1:][np.argmin(in_range, axis=1)] - t[0], np.nan)
+        padded = np.zeros((len(in_range), in_range.shape[1] + 1), dtype=np.int8)
+        padded[:, 1:] = in_range
+        passes = np.count_nonzero(np.diff(padded, axis=1) == 1, axis=1)
+        return np.column_stack((np.count_nonzero(in_range, axis=1) / len(times) * 100, first_exit, passes))
+
+
+def dispersion_metrics(states, reference_orbit, times, step, thresh_min, thresh_max, workers=1, control=None,
+                       model="j2", drag_alpha=DragRelativeMotion.default_alpha):
+    # member_metrics of an (N, 6) array, in chunks sized like the ensemble's so memory stays bounded
+    states = np.atleast_2d(np.asarray(states, dtype=float))
+    metrics = np.full((len(states), 3), np.nan)
+    chunk_size = max(1, J2RelativeMotion.ensemble_chunk_samples // max(1, len(times)))
+    chunks = HeatMapEngine.state_chunks(len(states), chunk_size)
+    return HeatMapEngine.map_chunks(member_metrics, states, chunks, metrics,
+                                    (reference_orbit, times, step, thresh_min, thresh_max, model, drag_alpha),
+                                    workers, control)
+
+
+# ############################## CONFIDENCE INTERVALS ############################## #
+
+def normal_quantile(confidence):
+    return statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def mean_interval(values, confidence=default_confidence):
+    # normal approximation, fine for the thousands of samples a dispersion run uses
+    if len(values) < 2:
+        return [float(np.mean(values)) if len(values) else np.nan] * 2
+    half = normal_quantile(confidence) * np.std(values, ddof=1) / np.sqrt(len(values))
+    return [float(np.mean(values) - half), float(np.mean(values) + half)]
+
+
+def percentile_interval(sorted_values, percentile, confidence=default_confidence):
+    # distribution-free interval from the order statistics around the percentile
+    count = len(sorted_values)
+    if count == 0:
+        return [np.nan, np.nan]
+    p = percentile / 100
+    half = normal_quantile(confidence) * np.sqrt(count * p * (1 - p))
+    lower = int(np.clip(np.floor(count * p - half), 0, count - 1))
+    upper = int(np.clip(np.ceil(count * p + half), 0, count - 1))
+    return [float(sorted_values[lower]), float(sorted_values[upper])]
+
+
+def proportion_interval(successes, count, confidence=default_confidence):
+    # Wilson score interval, which stays inside [0, 1] when nearly every member succeeds or fails
+    if count == 0:
+        return [np.nan, np.nan]
+    z = normal_quantile(confidence)
+    p = successes / count
+    centre = (p + z ** 2 / (2 * count)) / (1 + z ** 2 / count)
+    half = z * np.sqrt(p * (1 - p) / count + z ** 2 / (4 * count ** 2)) / (1 + z ** 2 / count)
+    return [float(max(0.0, centre - half)), float(min(1.0, centre + half))]
+
+
+def summarize(values, confidence=default_confidence):
+    values = np.sort(np.asarray(values, dtype=float)[~np.isnan(values)])
+    summary = {"samples": len(values), "mean": float(np.mean(values)) if len(values) else np.nan,
+               "mean_interval": mean_interval(values, confidence),
+               "std": float(np.std(values, ddof=1)) if len(values) > 1 else np.nan}
+    for percentile in percentiles:
+        summary["p" + str(percentile)] = float(np.percentile(values, percentile)) if len(values) else np.nan
+        summary["p" + str(percentile) + "_interval"] = percentile_interval(values, percentile, confidence)
+    return summary
+
+
+class DispersionResult:
+
+    def __init__(self, states, metrics, end_seconds):
+
+        self._states = states
+        self._metrics = metrics
+        self.end_seconds = end_seconds
+
+    def __len__(self):
+        return len(self._states)
+
+    def get_states(self):
+        return self._states
+
+    def get_time_in_constraint(self):
+        return self._metrics[:, 0]
+
+    def get_first_exit_time(self):
+        # NaN for members still in range at the end of the propagation
+        return self._metrics[:, 1]
+
+    def get_pass_counts(self):
+        return self._metrics[:, 2].astype(int)
+
+    def get_summary(self, confidence=default_confidence):
+        exits = int(np.count_nonzero(~np.isnan(self.get_first_exit_time())))
+        return {"samples": len(self), "confidence": confidence,
+                "time_in_constraint": summarize(self.get_time_in_constraint(), confidence),
+                "first_exit_time": summarize(self.get_first_exit_time(), confidence),
+                "exit_probability": exits / len(self) if len(self) else np.nan,
+                "exit_probability_interval": proportion_interval(exits, len(self), confidence),
+                "pass_count": summarize(self.get_pass_counts(), confidence)}
+
+
+def dispersion_analysis(mean_state, dispersions, reference_orbit, end_seconds, recorded_times, thresh_min,
+                        thresh_max, samples=10000, distribution="uniform", seed=0, workers=1, control=None,
+                        model="j2", drag_alpha=DragRelativeMotion.default_alpha):
+    # Monte Carlo over initial states drawn around mean_state, on the heatmap's time grid
+    with Instrumentation.phase("setup"):
+        states = sample_states(mean_state, dispersions, samples, distribution, seed)
+        times = np.linspace(0.0, end_seconds, recorded_times)
+    metrics = dispersion_metrics(states, reference_orbit, times, times[1] - times[0], thresh_min, thresh_max,
+                                 workers, control, model, drag_alpha)
+    return DispersionResult(states, metrics, end_seconds)
+
+# ################################################################################## #
@@ -1,36 +1,111 @@
 import numpy as np
 import OrbitalElements
+import J2RelativeMotion
+import Instrumentation
+
+r_e = 6378136.3
+mu = 3.986004415E14
+default_alpha = .2
+
+# orbit drag_cw used before the reference orbit could be chosen
+legacy_reference_orbit = OrbitalElements.OrbitalElements(r_e + 300000, 0.0, 28.5 * np.pi / 180, 0.0, 0.0, 0.0, mu)
 
 
 # ############################## CARTER-HUMI DRAG REOM ############################## #
 
-def st_drag_carter_humi(alpha, reference_orbit, mu, x0, t):  # semi-major of target satellite
+def st_drag_carter_humi_stack(alpha, reference_orbit, mu, t):  # semi-major of target satellite
+    # state transition matrices for every entry of t, built in one go as (T, 6, 6)
+    t = np.asarray(t, dtype=float)
     k = np.sqrt(1 - 12*alpha**2)
     n = np.sqrt(mu/reference_orbit.get_a()**3)
-    cw = [[1,     4*np.sin(k*t*n)/k**2 + (1 - 4/k**2)*t*n,  2*(1-4/k**2)*(np.sin(k*t*n)/k - t*n),  2*(1 - np.cos(n*t))/k, 0,            0],
-          [0,     4*(np.cos(k*t*n) - 1)/k**2 + 1,           2*(1-4/k**2)*(np.cos(k*t*n) - 1),      2*np.sin(k*n*t)/k,     0,            0],
-          [0,     2*(np.cos(k*t*n) - 1)/k**2,              (1 - 4/k**2)*np.cos(k*t*n) + 4/k**2,    np.sin(k*t*n)/k,       0,            0],
-          [0,     0,                                        0,                                     np.cos(k*n*t),         0,            0],
-          [0,     0,                                        0,                                     0,                     np.cos(n*t),  np.sin(t*n)],
-          [0,     0,                                        0,                                     0,                    -np.sin(t*n),  np.cos(n*t)]]
-    return np.matmul(cw, x0)
-
-
-def drag_cw(x0, times):
-    r_e = 6378136.3
-    mu = 3.986004415E14
-    reference_orbit = OrbitalElements.OrbitalElements(r_e + 300000, 0.0, 28.5 * np.pi / 180, 0.0, 0.0, 0.0, mu)
-    mu = 3.986004415E14
-    alpha = .2
-
-    xd = []
-    yd = []
-    zd = []
-
-    for i in range(len(times)):
-        state = st_drag_carter_humi(alpha, reference_orbit, mu, x0, times[i])
-        xd.append(state[0])
-        yd.append(state[1])
-        zd.append(state[2])
-
-    return [yd, xd, zd]
+    sin_knt, cos_knt = np.sin(k*n*t), np.cos(k*n*t)
+    sin_nt, cos_nt = np.sin(n*t), np.cos(n*t)
+
+    cw = np.zeros(t.shape + (6, 6))
+    cw[..., 0, 0] = 1
+    cw[..., 0, 1] = 4*sin_knt/k**2 + (1 - 4/k**2)*t*n
+    cw[..., 0, 2] = 2*(1 - 4/k**2)*(sin_knt/k - t*n)
+    cw[..., 0, 3] = 2*(1 - cos_nt)/k
+    cw[..., 1, 1] = 4*(cos_knt - 1)/k**2 + 1
+    cw[..., 1, 2] = 2*(1 - 4/k**2)*(cos_knt - 1)
+    cw[..., 1, 3] = 2*sin_knt/k
+    cw[..., 2, 1] = 2*(cos_knt - 1)/k**2
+    cw[..., 2, 2] = (1 - 4/k**2)*cos_knt + 4/k**2
+    cw[..., 2, 3] = sin_knt/k
+    cw[..., 3, 3] = cos_knt
+    cw[..., 4, 4] = cos_nt
+    cw[..., 4, 5] = sin_nt
+    cw[..., 5, 4] = -sin_nt
+    cw[..., 5, 5] = cos_nt
+    return cw
+
+
+def st_drag_carter_humi(alpha, reference_orbit, mu, x0, t):
+    return np.matmul(st_drag_carter_humi_stack(alpha, reference_orbit, mu, t), x0)
+
+
+def carter_humi_basis(n):
+    # takes [x, y, z, xd, yd, zd] (radial, in-track, cross-track, as J2RelativeMotion uses) to the state the
+    # Carter-Humi STM acts on: in-track position and rate, radial position and rate with the opposite sign,
+    # cross-track position and rate, the rates per radian of the mean motion n
+    basis = np.zeros((6, 6))
+    basis[0, 1] = 1.0
+    basis[1, 4] = 1.0 / n
+    basis[2, 0] = -1.0
+    basis[3, 3] = -1.0 / n
+    basis[4, 2] = 1.0
+    basis[5, 5] = 1.0 / n
+    return basis
+
+
+def drag_stm_stack(alpha, reference_orbit, t):
+    # st_drag_carter_humi_stack acting on and returning [x, y, z, xd, yd, zd] states, as (T, 6, 6)
+    basis = carter_humi_basis(np.sqrt(reference_orbit.mu / reference_orbit.get_a() ** 3))
+    return np.linalg.inv(basis) @ st_drag_carter_humi_stack(alpha, reference_orbit, reference_orbit.mu, t) @ basis
+
+
+def drag_propagate_batch(states_0, times, reference_orbit, alpha=default_alpha):
+    # (N, 6) initial [x, y, z, xd, yd, zd] states propagated to every entry of times, as (N, T, 6)
+    stm = drag_stm_stack(alpha, reference_orbit, times)
+    return np.einsum('tij,nj->nti', stm, np.atleast_2d(np.asarray(states_0, dtype=float)))
+
+
+def drag_ensemble(states_0, reference_orbit, time, step, type, thresh_min, thresh_max, alpha=default_alpha,
+                  chunk_size=None):
+    # the drag counterpart of J2RelativeMotion.j2_sedwick_ensemble for types 0 (trajectories),
+    # 1 (in-range counts) and 4 (magnitudes), sharing one STM stack across all members
+    states_0 = np.atleast_2d(np.asarray(states_0, dtype=float))
+    t = J2RelativeMotion.sample_times(time, step)
+    tau = t - t[0]
+    if type == 0:
+        return drag_propagate_batch(states_0, tau, reference_orbit, alpha)
+    if type not in (1, 4):
+        raise ValueError("unknown propagation type: " + str(type))
+
+    with Instrumentation.phase("setup"):
+        stm = drag_stm_stack(alpha, reference_orbit, tau[1:])
+    if chunk_size is None:
+        chunk_size = max(1, J2RelativeMotion.ensemble_chunk_samples // max(1, len(t)))
+    reductions = []
+    for first in range(0, len(states_0), chunk_size):
+        with Instrumentation.phase("propagate"):
+            result = np.einsum('tij,nj->nti', stm, states_0[first:first + chunk_size])
+        with Instrumentation.phase("reduce"):
+            magnitudes = J2RelativeMotion.range_magnitudes(result)
+            if type == 1:
+                reductions.append(np.count_nonzero(J2RelativeMotion.in_range_mask(magnitudes, thresh_min,
+                                                                                  thresh_max), axis=1))
+            else:
+                reductions.append(magnitudes)
+    if not reductions:
+        return np.zeros((0,) if type == 1 else (0, len(t) - 1))
+    return np.concatenate(reductions)
+
+
+def drag_cw(x0, times, reference_orbit=None, alpha=default_alpha):
+    # the original interface: x0 and the result in the STM's own ordering
+    if reference_orbit is None:
+        reference_orbit = legacy_reference_orbit
+    states = st_drag_carter_humi(alpha, reference_orbit, reference_orbit.mu, np.asarray(x0, dtype=float),
+                                 np.asarray(times, dtype=float))
+    return [states[:, 1], states[:, 0], states[:, 2]]
@@ -3,20 +3,36 @@ from PyQt5 import QtGui
 from PyQt5.QtWidgets import QMainWindow, QApplication, QPushButton, QWidget,QVBoxLayout
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 from itertools import cycle
 from mpl_toolkits import mplot3d
 from mpl_toolkits.mplot3d import Axes3D
 import matplotlib
+import matplotlib.style
 from matplotlib import cm
-plt.style.use("seaborn")
-matplotlib.rcParams.update({'font.size': 8})
+import numpy as np
+import Decimation
+
+style_applied = False
+
+
+def apply_style():
+    # deferred until the first graph is built, so importing this module stays cheap
+    global style_applied
+    if style_applied:
+        return
+    style_applied = True
+    try:
+        matplotlib.style.use("seaborn")
+    except OSError:
+        matplotlib.style.use("seaborn-v0_8")  # matplotlib >= 3.6 renamed the seaborn styles
+    matplotlib.rcParams.update({'font.size': 8})
 
 
 class GraphView2D(QWidget):
     def __init__(self, parent=None):
         super(QWidget, self).__init__(parent)
+        apply_style()
         self.dpi = 100
         self.fig = Figure((5.0, 3.0), dpi=self.dpi, facecolor=(1, 1, 1), edgecolor=(0, 0, 0))
         self.axes = self.fig.add_subplot(111)
@@ -31,26 +47,59 @@ class GraphView2D(QWidget):
         self.font = QtGui.QFont()
         self.font.setPointSize(1)
         self.canvas.show()
+        self.series = []
+        self.refine_pending = False
 
-    def update_graph(self, data, title, axis_labels):
+    def update_graph(self, data, title, axis_labels, keep=None):
+        # keep: per series, sample indices that survive decimation (e.g. range transitions)
         self.axes.clear()
         colors = cycle(
             ["C0", "C1", "C2", "C3", "C4", "C5", "C6", "C7", "C8", "C9"])
+        self.series = [np.asarray(values, dtype=float) for values in data]
+        self.series_keep = keep if keep is not None else [None] * len(data)
+        self.lines = []
         for item in range(len(data)):
-            self.axes.plot(data[item], color=next(colors))
+            indices = self.decimated(item, 0, len(self.series[item]))
+            self.lines += self.axes.plot(indices, self.series[item][indices], color=next(colors))
         # self.axes.legend(frameon=True)
         # self.axes.legend(loc="best")
         self.axes.set_title(title)
         self.axes.set_xlabel(axis_labels[0])
         self.axes.set_ylabel(axis_labels[1])
         self.axes.grid(linestyle='--')
+        self.axes.callbacks.connect('xlim_changed', lambda axes: self.schedule_refine())
         self.canvas.draw()
 
+    def decimated(self, item, first, last):
+        keep = self.series_keep[item]
+        if keep is not None:
+            keep = np.asarray(keep)
+            keep = keep[(keep >= first) & (keep < last)] - first
+        return first + Decimation.decimate_indices([self.series[item][first:last]], keep=keep)
+
+    def schedule_refine(self):
+        # limits change many times while panning, so the series are decimated once the event loop is idle
+        if not self.refine_pending:
+            self.refine_pending = True
+            QtCore.QTimer.singleShot(0, self.refine_detail)
+
+    def refine_detail(self):
+        # decimate again over the visible samples only, so zooming in brings back the full detail
+        self.refine_pending = False
+        low, high = sorted(self.axes.get_xlim())
+        for item, line in enumerate(self.lines):
+            first = int(np.clip(np.floor(low), 0, len(self.series[item])))
+            last = int(np.clip(np.ceil(high) + 1, first, len(self.series[item])))
+            indices = self.decimated(item, first, last)
+            line.set_data(indices, self.series[item][indices])
+        self.canvas.draw_idle()
+
 
 class GraphView3D(QWidget):
 
     def __init__(self, parent=None):
         super(QWidget, self).__init__(parent)
+        apply_style()
         self.dpi = 100
         self.fig = Figure((5.0, 3.0), dpi=self.dpi, facecolor=(1, 1, 1), edgecolor=(0, 0, 0))
         self.axes = self.fig.add_subplot(111, projection='3d')
@@ -66,45 +115,91 @@ class GraphView3D(QWidget):
         self.font.setPointSize(1)
         self.canvas.show()
         self.axes.mouse_init()
+        self.series = []
+        self.refine_pending = False
 
-    def update_graph(self, data, title, axis_labels):
+    def update_graph(self, data, title, axis_labels, keep=None):
+        # keep: per series, sample indices that survive decimation (e.g. range transitions)
         self.axes.cla()
         self.axes.mouse_init()
         colors = cycle(["C0", "C1", "C2", "C3", "C4", "C5", "C6", "C7", "C8", "C9"])
+        self.set_series(data, keep)
+        self.artists = []
         for item in range(len(data)):
-            self.axes.plot3D(data[item][0], data[item][1], data[item][2], color=next(colors))  #, label=labels[item])
+            indices = Decimation.decimate_indices(self.series[item], keep=self.series_keep[item])
+            self.artists += self.axes.plot3D(*[column[indices] for column in self.series[item]],
+                                             color=next(colors))  #, label=labels[item])
         # self.axes.legend(loc="best")
         self.axes.set_title(title)
         self.axes.set_xlabel(axis_labels[0])
         self.axes.set_ylabel(axis_labels[1])
         self.axes.set_zlabel(axis_labels[2])
         self.axes.view_init(-90, 90)
+        self.watch_limits()
         self.canvas.draw()
 
-    def update_scatter(self, data, title, labels, axis_labels):
+    def update_scatter(self, data, title, labels, axis_labels, keep=None):
         self.axes.cla()
         self.axes.clear()
         self.axes.mouse_init()
         colors = cycle(["C0", "C1", "C2", "C3", "C4", "C5", "C6", "C7", "C8", "C9"])
+        self.set_series(data, keep)
+        self.artists = []
         for item in range(len(data)):
-            self.axes.scatter(data[item][0], data[item][1], data[item][2], color=next(colors), label=labels[item], s=1)
+            indices = Decimation.decimate_indices(self.series[item], keep=self.series_keep[item])
+            self.artists.append(self.axes.scatter(*[column[indices] for column in self.series[item]],
+                                                  color=next(colors), label=labels[item], s=1))
         self.axes.legend(loc="best")
         self.axes.set_title(title)
         self.axes.set_xlabel(axis_labels[0])
         self.axes.set_ylabel(axis_labels[1])
         self.axes.set_zlabel(axis_labels[2])
         self.axes.view_init(-90, 90)
+        self.watch_limits()
         self.canvas.draw()
 
+    def set_series(self, data, keep):
+        self.series = [[np.asarray(column, dtype=float) for column in item] for item in data]
+        self.series_keep = keep if keep is not None else [None] * len(data)
+
+    def watch_limits(self):
+        for limits in ('xlim_changed', 'ylim_changed', 'zlim_changed'):
+            self.axes.callbacks.connect(limits, lambda axes: self.schedule_refine())
+
+    def schedule_refine(self):
+        # zooming sets all three limits, so the series are decimated once the event loop is idle
+        if not self.refine_pending:
+            self.refine_pending = True
+            QtCore.QTimer.singleShot(0, self.refine_detail)
+
+    def refine_detail(self):
+        # decimate again over the samples inside the visible box, so zooming in brings back the full detail
+        self.refine_pending = False
+        self.axes.set_autoscale_on(False)  # redrawn artists must not move the limits they were decimated for
+        limits = [self.axes.get_xlim3d(), self.axes.get_ylim3d(), self.axes.get_zlim3d()]
+        for item, artist in enumerate(self.artists):
+            indices, breaks = Decimation.view_indices(self.series[item], limits, keep=self.series_keep[item])
+            if hasattr(artist, "set_data_3d"):
+                artist.set_data_3d(*[Decimation.with_breaks(column[indices], breaks)
+                                     for column in self.series[item]])
+            else:
+                # scatter offsets cannot be replaced through public API, so the collection is drawn again
+                artist.remove()
+                self.artists[item] = self.axes.scatter(*[column[indices] for column in self.series[item]],
+                                                       color=artist.get_facecolor()[:1], label=artist.get_label(),
+                                                       s=1)
+        self.canvas.draw_idle()
+
 
 class GraphViewHeatMap(QWidget):
 
     def __init__(self, parent=None):
         super(QWidget, self).__init__(parent)
+        apply_style()
 
         self.dpi = 100
         self.fig = Figure((5.0, 3.0), dpi=self.dpi, facecolor=(1, 1, 1), edgecolor=(0, 0, 0))
-        self.axes = self.fig.add_subplot(111, projection='3d')
+        self.axes = self.fig.add_subplot(111)
         self.canvas = FigureCanvas(self.fig)
         self.canvas.setParent(self)
         self.toolbar = NavigationToolbar(self.canvas, self)
@@ -116,9 +211,14 @@ class GraphViewHeatMap(QWidget):
         self.font = QtGui.QFont()
         self.font.setPointSize(1)
         self.canvas.show()
-        self.axes.mouse_init()
+
+        self.image = None  # raster of the last map, reused while the grid stays the same
+        self.colorbar = None
+        self.cmap = matplotlib.colormaps["YlGnBu"].with_extremes(bad=(0.9, 0.9, 0.9))  # cells not computed yet
 
     def update_graph(self, map_x, map_y, data, title, axis_labels):
+        # 3D surface of data[j][i] over the meshgrid map_x, map_y
+        self.image = None
         self.fig.clf()
         self.axes = self.fig.add_subplot(111, projection='3d')
         surf = self.axes.plot_surface(map_x, map_y, data, cmap=cm.YlGnBu,
@@ -127,6 +227,36 @@ class GraphViewHeatMap(QWidget):
         self.axes.set_xlabel(axis_labels[0])
         self.axes.set_ylabel(axis_labels[1])
         self.axes.set_zlabel(axis_labels[2])
-        self.fig.colorbar(surf, shrink=0.5, aspect=5)
+        self.colorbar = self.fig.colorbar(surf, shrink=0.5, aspect=5)
         self.axes.mouse_init()
         self.canvas.draw()
+
+    def update_raster(self, x_values, y_values, data, title, axis_labels):
+        # data[i][j] at (x_values[i], y_values[j]) as an image on evenly spaced axes. NaN cells are drawn grey, and
+        # a map on the same grid only replaces the pixel data, so progressive fills do not rebuild the figure
+        data = np.ma.masked_invalid(np.asarray(data, dtype=float).T)
+        extent = raster_extent(x_values) + raster_extent(y_values)
+        if self.image is None or self.image.get_array().shape != data.shape or list(self.image.get_extent()) != extent:
+            self.fig.clf()
+            self.axes = self.fig.add_subplot(111)
+            self.image = self.axes.imshow(data, origin='lower', extent=extent, aspect='auto', cmap=self.cmap,
+                                          interpolation='nearest')
+            self.colorbar = self.fig.colorbar(self.image, ax=self.axes)
+            self.axes.grid(False)
+        else:
+            self.image.set_data(data)
+        if data.count():
+            self.image.set_clim(data.min(), max(data.max(), data.min() + 1e-12))
+        self.colorbar.set_label(axis_labels[2])
+        self.axes.set_title(title)
+        self.axes.set_xlabel(axis_labels[0])
+        self.axes.set_ylabel(axis_labels[1])
+        self.canvas.draw()
+
+
+def raster_extent(values):
+    # edges of evenly spaced cells centred on values
+    values = np.asarray(values, dtype=float)
+    half = (values[-1] - values[0]) / (2 * (len(values) - 1)) if len(values) > 1 else 0.0
+    half = half or 0.5  # a single or degenerate axis still gets a visible cell
+    return [float(values[0] - half), float(values[-1] + half)]
@@ -1,9 +1,13 @@
+import os
+import time
 import OrbitalElements
-import J2RelativeMotion
+import HeatMapEngine
+import DragRelativeMotion
 import GraphWidgets
+import SensitivityEngine
 import numpy as np
 from PyQt5.QtWidgets import QMainWindow, QApplication, QPushButton, QWidget, QAction, \
-    QTabWidget, QVBoxLayout, QLineEdit, QHBoxLayout, QLabel, QGridLayout, QFrame, QComboBox
+    QTabWidget, QVBoxLayout, QLineEdit, QHBoxLayout, QLabel, QGridLayout, QFrame, QComboBox, QCheckBox
 from PyQt5.QtCore import pyqtSlot
 
 
@@ -27,14 +31,28 @@ class HeatMap(QWidget):
         self.x_property = "Unfilled"
 
         self.num_axis_points = 10
+        self.num_workers = os.cpu_count()
+        self.adaptive = False
+        self.max_evaluations = None
+        self.model = "j2"
+        self.drag_alpha = DragRelativeMotion.default_alpha
         self.y_axis = 1
         self.y_units = " N/A "
         self.y_property = "Unfilled"
 
         self.current_trajectory = [0.0, 0.0, 0.1, 0.0, 0.0, 0.1]
+        self.mean_state = list(self.current_trajectory)
         self.end_seconds = 10
         self.reference_orbit = None
 
+        self.partial_draw_interval = 0.5  # seconds between surface repaints of a map still being computed
+        self.raster_partial_draw_interval = 0.1  # the raster only swaps pixel data, so it can follow more closely
+        self.last_partial_draw = 0.0
+        self.surface_view = False
+        self.last_map = None
+        self.sensitivity = None  # SensitivityEngine.SensitivityResult whose 2-D marginals are shown
+        self.marginal_pairs = []
+
         self.bottom_panel = QFrame()
         self.bottom_layout = QHBoxLayout()
 
@@ -42,7 +60,16 @@ class HeatMap(QWidget):
         self.valuable_trajectory_list = []
         self.valuable_trajectory_dropdown.activated.connect(self.choose_trajectory_to_propagate)
 
+        self.surface_view_checkbox = QCheckBox("3D surface")
+        self.surface_view_checkbox.toggled.connect(self.when_surface_view_toggled)
+
+        self.marginal_pair_dropdown = QComboBox()
+        self.marginal_pair_dropdown.activated.connect(self.when_marginal_pair_chosen)
+        self.marginal_pair_dropdown.hide()
+
         self.bottom_layout.addWidget(self.valuable_trajectory_dropdown)
+        self.bottom_layout.addWidget(self.marginal_pair_dropdown)
+        self.bottom_layout.addWidget(self.surface_view_checkbox)
         self.bottom_panel.setLayout(self.bottom_layout)
 
         self.layout.addWidget(self.bottom_panel)
@@ -52,12 +79,56 @@ class HeatMap(QWidget):
         self.current_trajectory[self.x_axis] = self.maximum_time_x_axis_values[text]
         self.current_trajectory[self.y_axis] = self.maximum_time_y_axis_values[text]
 
+    @pyqtSlot(bool)
+    def when_surface_view_toggled(self, checked):
+        self.surface_view = checked
+        if self.last_map is not None:
+            self.plot_heat_map(*self.last_map)
+
+    def show_sensitivity(self, result, reference_orbit, end_seconds):
+        # list the marginals of every pair of swept axes, most influential pair first, and show that one
+        self.sensitivity = result
+        self.reference_orbit = reference_orbit
+        self.end_seconds = end_seconds
+        index = dict(zip(result.get_axes(), result.get_indices()))
+        self.marginal_pairs = result.get_pairs()
+        self.marginal_pair_dropdown.clear()
+        self.marginal_pair_dropdown.addItems([SensitivityEngine.axis_names[x_axis] + " x " +
+                                              SensitivityEngine.axis_names[y_axis] + " (S = %.2f, %.2f)" %
+                                              (index[x_axis], index[y_axis]) for x_axis, y_axis in self.marginal_pairs])
+        self.marginal_pair_dropdown.show()
+        if self.marginal_pairs:
+            self.show_marginal(0)
+
+    def clear_sensitivity(self):
+        self.sensitivity = None
+        self.marginal_pairs = []
+        self.marginal_pair_dropdown.hide()
+
+    @pyqtSlot(int)
+    def when_marginal_pair_chosen(self, index):
+        self.show_marginal(index)
+
+    def show_marginal(self, index):
+        x_axis, y_axis = self.marginal_pairs[index]
+        self.set_heat_map_parameters(self.sensitivity.mean_state, self.reference_orbit, self.end_seconds,
+                                     x_axis, y_axis)
+        self.show_heat_map(*self.sensitivity.get_marginal(x_axis, y_axis))
+
     def heat_map_xy(self, x_variance, y_variance, mean_state,
                     reference_orbit, end_seconds, recorded_times,
                     x_axis, y_axis, threshold_min, threshold_max):
 
+        self.set_heat_map_parameters(mean_state, reference_orbit, end_seconds, x_axis, y_axis)
+        x_values, y_values, success_level = self.compute_heat_map(x_variance, y_variance, recorded_times,
+                                                                  threshold_min, threshold_max)
+        self.show_heat_map(x_values, y_values, success_level)
+
+    def set_heat_map_parameters(self, mean_state, reference_orbit, end_seconds, x_axis, y_axis):
+
         self.end_seconds = end_seconds
-        self.current_trajectory = mean_state
+        self.mean_state = list(mean_state)
+        self.current_trajectory = list(mean_state)
         self.reference_orbit = reference_orbit
 
         self.x_axis = x_axis
@@ -96,40 +167,57 @@ class HeatMap(QWidget):
             else:
                 self.y_property = " Cross-Track: "
 
-        x_values_list = np.linspace(-x_variance+mean_state[self.x_axis],
-                                    x_variance+mean_state[self.x_axis],
-                                    self.num_axis_points).tolist()
-        y_values_list = np.linspace(-y_variance+mean_state[self.y_axis],
-                                    y_variance+mean_state[self.y_axis],
-                                    self.num_axis_points).tolist()
+    def get_heat_map_axes(self, x_variance, y_variance):
+        return HeatMapEngine.heat_map_axes(x_variance, y_variance, self.mean_state, self.x_axis, self.y_axis,
+                                           self.num_axis_points, self.adaptive)
 
-        success_level = np.zeros([self.num_axis_points, self.num_axis_points])
-        times = np.linspace(0.0, self.end_seconds, recorded_times)
+    def compute_heat_map(self, x_variance, y_variance, recorded_times, threshold_min, threshold_max, control=None):
+        # safe to run off the GUI thread, only reads the parameters set above
+        return HeatMapEngine.heat_map_xy(x_variance, y_variance, self.mean_state, self.reference_orbit,
+                                         self.end_seconds, recorded_times, self.x_axis, self.y_axis,
+                                         threshold_min, threshold_max, self.num_axis_points, self.num_workers,
+                                         self.adaptive, self.max_evaluations, control, self.model, self.drag_alpha)
 
-        step = times[1] - times[0]
-
-        for i in range(self.num_axis_points):
-
-            for j in range(self.num_axis_points):
-
-                mean_state[self.x_axis] = x_values_list[i]
-                mean_state[self.y_axis] = y_values_list[j]
-
-                success_level[i][j] = J2RelativeMotion.j2_sedwick_propagator(mean_state, reference_orbit, times, step,
-                                                                             1, threshold_min, threshold_max, False)\
-                                                                             / recorded_times * 100
-
-        map_x, map_y = np.array(np.meshgrid(x_values_list, y_values_list))
-        max_x, max_y = np.where(np.asarray(success_level) == np.asarray(success_level).max())
+    def plot_heat_map(self, x_values, y_values, success_level):
+        self.last_map = (x_values, y_values, success_level)
 
         axis_labels = [self.x_property + "Variance" + self.x_units,
                        self.y_property + " Variance" + self.y_units,
                        "% of Time within Constraint"]
         title = "Relative Motion Heatmap for " + str(self.end_seconds) + " seconds"
-
-        self.heatmap_plot.update_graph(map_x, map_y, success_level, title, axis_labels)
+        if self.sensitivity is not None:
+            title = "Marginal of " + str(len(self.sensitivity)) + " " + self.sensitivity.sampler + " samples over " + \
+                    str(self.end_seconds) + " seconds"
+
+        if not self.surface_view:
+            self.heatmap_plot.update_raster(x_values, y_values, success_level, title, axis_labels)
+            return
+        # success_level is x major while meshgrid rows follow y, hence the transpose
+        map_x, map_y = np.array(np.meshgrid(x_values, y_values))
+        self.heatmap_plot.update_graph(map_x, map_y, np.nan_to_num(np.asarray(success_level)).T, title, axis_labels)
+
+    def show_partial_heat_map(self, x_values, y_values, success_level):
+        # cells still being computed are NaN (grey in the raster, zero on the surface); redraws are throttled to
+        # keep the GUI responsive
+        now = time.monotonic()
+        interval = self.partial_draw_interval if self.surface_view else self.raster_partial_draw_interval
+        if now - self.last_partial_draw >= interval:
+            self.last_partial_draw = now
+            self.plot_heat_map(x_values, y_values, success_level)
+
+    def show_heat_map(self, x_values, y_values, success_level):
+        x_values_list = np.asarray(x_values).tolist()
+        y_values_list = np.asarray(y_values).tolist()
+
+        # marginals and partial maps can hold NaN cells
+        max_x, max_y = np.where(np.asarray(success_level) == np.nanmax(success_level))
+
+        self.plot_heat_map(x_values, y_values, success_level)
 
         self.valuable_trajectory_list = []
+        self.maximum_time_x_axis_values = []
+        self.maximum_time_y_axis_values = []
+        self.maximum_times = []
 
         for i in range(len(max_x)):
             self.maximum_time_x_axis_values.append(x_values_list[max_x[i]])
@@ -139,7 +227,9 @@ class HeatMap(QWidget):
                                                  self.y_property + str(y_values_list[max_y[i]]) + self.y_units + " | " +
                                                  " Time: " + str(success_level[max_x[i]][max_y[i]]))
 
-        self.current_trajectory = mean_state
+        self.current_trajectory = list(self.mean_state)
+        self.current_trajectory[self.x_axis] = self.maximum_time_x_axis_values[0]
+        self.current_trajectory[self.y_axis] = self.maximum_time_y_axis_values[0]
 
         self.valuable_trajectory_dropdown.clear()
         self.valuable_trajectory_dropdown.addItems(self.valuable_trajectory_list)
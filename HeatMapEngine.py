@@ -0,0 +1,275 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import J2RelativeMotion
+import DragRelativeMotion
+import JobControl
+import Instrumentation
+
+cells_per_chunk = 4096  # most grid cells handed to a worker at a time, fewer for long time grids
+adaptive_base_points = 9  # coarse grid the adaptive heatmap starts from
+
+
+# ############################## HEAT MAP ENGINE ############################## #
+
+def heat_map_axis_values(variance, mean_value, num_axis_points):
+    return np.linspace(-variance + mean_value, variance + mean_value, num_axis_points)
+
+
+def heat_map_states(x_values, y_values, mean_state, x_axis, y_axis):
+    # one initial state per grid cell, x major, so row i of the map holds x_values[i]
+    grid_states = np.tile(np.asarray(mean_state, dtype=float), (len(x_values) * len(y_values), 1))
+    grid_states[:, x_axis] = np.repeat(x_values, len(y_values))
+    grid_states[:, y_axis] = np.tile(y_values, len(x_values))
+    return grid_states
+
+
+def evaluate_states(states, reference_orbit, times, step, thresh_min, thresh_max, model="j2",
+                    drag_alpha=DragRelativeMotion.default_alpha):
+    # model is "j2" (Sedwick) or "drag" (Carter-Humi with drag parameter drag_alpha)
+    if model == "j2":
+        counts = J2RelativeMotion.j2_sedwick_ensemble(states, reference_orbit, times, step, 1, thresh_min, thresh_max)
+    elif model == "drag":
+        counts = DragRelativeMotion.drag_ensemble(states, reference_orbit, times, step, 1, thresh_min, thresh_max,
+                                                  drag_alpha)
+    else:
+        raise ValueError("unknown relative motion model: " + str(model))
+    return counts / len(times) * 100
+
+
+def state_chunks(num_states, chunk_size):
+    # chunking depends only on the problem size, so results do not depend on the worker count
+    return [(first, min(first + chunk_size, num_states)) for first in range(0, num_states, chunk_size)]
+
+
+def chunk_cells(num_times):
+    # cells per chunk, so one chunk propagates at most the ensemble's sample budget (cells x time samples)
+    return max(1, min(cells_per_chunk, J2RelativeMotion.ensemble_chunk_samples // max(1, num_times)))
+
+
+def open_pool(workers):
+    # one process pool for a whole heatmap, so refinement rounds do not each start their own.
+    # None when the cells are evaluated in this process
+    if workers is None:
+        workers = os.cpu_count()
+    return ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+
+def map_chunks(function, states, chunks, output, args, workers=1, control=None, completed=None, pool=None):
+    # output[first:last] = function(states[first:last], *args) for every (first, last) chunk, in this process or
+    # on worker processes. completed(done) follows every finished chunk (on a pool they finish in any order),
+    # by default reporting the fraction done to control. a pool from open_pool is used as is and left open,
+    # otherwise one is started for this call
+    if completed is None:
+        def completed(done):
+            JobControl.report(control, done / len(chunks))
+    if workers is None:
+        workers = os.cpu_count()
+    workers = min(workers, len(chunks))
+
+    if workers <= 1:
+        for done, (first, last) in enumerate(chunks):
+            JobControl.check(control)
+            output[first:last] = function(states[first:last], *args)
+            completed(done + 1)
+        return output
+
+    # worker processes keep their own counters, the time spent waiting on them is counted as propagation here
+    own_pool = pool is None
+    if own_pool:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    futures = {}
+    try:
+        with Instrumentation.phase("propagate"):
+            for first, last in chunks:
+                futures[pool.submit(function, states[first:last], *args)] = (first, last)
+            for done, future in enumerate(as_completed(futures)):
+                first, last = futures[future]
+                output[first:last] = future.result()
+                completed(done + 1)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        if own_pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    if own_pool:
+        pool.shutdown()
+    return output
+
+
+def success_level_states(states, reference_orbit, times, step, thresh_min, thresh_max, workers=1, chunk_size=None,
+                         control=None, partial_shape=None, model="j2", drag_alpha=DragRelativeMotion.default_alpha,
+                         pool=None):
+    # percentage of samples within [thresh_min, thresh_max] for every row of an (N, 6) array of states.
+    # cells not yet evaluated are NaN in the partial results handed to control, reshaped to partial_shape
+    states = np.atleast_2d(np.asarray(states, dtype=float))
+    success_level = np.full(len(states), np.nan)
+    chunks = state_chunks(len(states), chunk_size or chunk_cells(len(times)))
+
+    def completed(done):
+        JobControl.report(control, done / len(chunks),
+                          success_level.reshape(partial_shape) if partial_shape is not None else success_level)
+
+    return map_chunks(evaluate_states, states, chunks, success_level,
+                      (reference_orbit, times, step, thresh_min, thresh_max, model, drag_alpha), workers, control,
+                      completed, pool)
+
+
+def success_level_grid(x_values, y_values, mean_state, x_axis, y_axis, reference_orbit, times, step,
+                       thresh_min, thresh_max, workers=1, control=None, model="j2",
+                       drag_alpha=DragRelativeMotion.default_alpha, pool=None):
+    # percentage of samples within [thresh_min, thresh_max] for every (x, y) cell, handed out in whole rows
+    # unless a single row is already over the sample budget
+    with Instrumentation.phase("setup"):
+        grid_states = heat_map_states(x_values, y_values, mean_state, x_axis, y_axis)
+    chunk_size = chunk_cells(len(times))
+    if chunk_size >= len(y_values):
+        chunk_size -= chunk_size % max(1, len(y_values))
+    success_level = success_level_states(grid_states, reference_orbit, times, step, thresh_min, thresh_max,
+                                         workers, chunk_size, control, (len(x_values), len(y_values)), model,
+                                         drag_alpha, pool)
+    return success_level.reshape(len(x_values), len(y_values))
+
+
+def adaptive_lattice_size(base_points, num_axis_points):
+    # smallest (base_points - 1) * 2^depth + 1 lattice reaching the requested resolution
+    depth = 0
+    while (base_points - 1) * 2 ** depth + 1 < num_axis_points:
+        depth += 1
+    return (base_points - 1) * 2 ** depth + 1
+
+
+def adaptive_success_level(x_values, y_values, mean_state, x_axis, y_axis, reference_orbit, times, step,
+                           thresh_min, thresh_max, workers=1, base_points=9, max_evaluations=None,
+                           variation_tolerance=2.0, near_max_tolerance=1.0, control=None, model="j2",
+                           drag_alpha=DragRelativeMotion.default_alpha, pool=None):
+    # quadtree sampling of the (x, y) lattice: start from a base_points x base_points grid and split
+    # cells whose corners differ by more than variation_tolerance or lie within near_max_tolerance
+    # of the best value found so far. cells stop splitting at the lattice spacing or once
+    # max_evaluations propagations have been spent. unevaluated lattice points are filled by bilinear
+    # interpolation inside their leaf cell. returns the map and the number of propagations
+    x_values = np.asarray(x_values, dtype=float)
+    y_values = np.asarray(y_values, dtype=float)
+    size = len(x_values)
+    if len(y_values) != size or (size - 1) % (base_points - 1) != 0:
+        raise ValueError("adaptive heatmaps need a square lattice of (base_points - 1) * 2^k + 1 points")
+    if max_evaluations is None:
+        max_evaluations = size * size
+
+    success_level = np.full((size, size), np.nan)
+
+    def evaluate(points):
+        points = sorted(set(point for point in points if np.isnan(success_level[point])))
+        if points:
+            rows, columns = np.array(points).T
+            states = np.tile(np.asarray(mean_state, dtype=float), (len(points), 1))
+            states[:, x_axis] = x_values[rows]
+            states[:, y_axis] = y_values[columns]
+            # cancellable and reporting progress within the round, however many cells it evaluates
+            round_control = JobControl.stage(control, min(1.0, evaluations / max_evaluations),
+                                             min(1.0, (evaluations + len(points)) / max_evaluations))
+            success_level[rows, columns] = success_level_states(states, reference_orbit, times, step,
+                                                                thresh_min, thresh_max, workers,
+                                                                control=round_control, model=model,
+                                                                drag_alpha=drag_alpha, pool=pool)
+        JobControl.report(control, min(1.0, (evaluations + len(points)) / max_evaluations), success_level)
+        return len(points)
+
+    def corners(cell):
+        i, j, span = cell
+        return success_level[[i, i, i + span, i + span], [j, j + span, j, j + span]]
+
+    def children(cell):
+        i, j, span = cell
+        half = span // 2
+        return [(i, j, half), (i + half, j, half), (i, j + half, half), (i + half, j + half, half)]
+
+    def new_points(cell):
+        i, j, span = cell
+        half = span // 2
+        return [(i + half, j), (i, j + half), (i + half, j + half), (i + span, j + half), (i + half, j + span)]
+
+    base_span = (size - 1) // (base_points - 1)
+    evaluations = 0
+    evaluations = evaluate([(i, j) for i in range(0, size, base_span) for j in range(0, size, base_span)])
+    leaves = [(i, j, base_span) for i in range(0, size - 1, base_span) for j in range(0, size - 1, base_span)]
+
+    while True:
+        best = np.nanmax(success_level)
+        candidates = []
+        for cell in leaves:
+            if cell[2] < 2:
+                continue
+            values = corners(cell)
+            variation = values.max() - values.min()
+            near_max = values.max() >= best - near_max_tolerance
+            if variation > variation_tolerance or near_max:
+                candidates.append((-(variation + near_max * variation_tolerance), cell))
+        if not candidates:
+            break
+
+        # most promising cells first, as many as the remaining budget allows
+        candidates.sort()
+        split = []
+        pending = set()
+        for _, cell in candidates:
+            cost = len(set(point for point in new_points(cell) if np.isnan(success_level[point])) - pending)
+            if evaluations + len(pending) + cost > max_evaluations:
+                break
+            pending.update(point for point in new_points(cell) if np.isnan(success_level[point]))
+            split.append(cell)
+        if not split:
+            break
+
+        evaluations += evaluate(pending)
+        split = set(split)
+        leaves = [child for cell in leaves for child in (children(cell) if cell in split else [cell])]
+
+    for i, j, span in leaves:
+        block = success_level[i:i + span + 1, j:j + span + 1]
+        missing = np.isnan(block)
+        if missing.any():
+            u, v = np.meshgrid(np.linspace(0, 1, span + 1), np.linspace(0, 1, span + 1), indexing='ij')
+            c00, c01, c10, c11 = corners((i, j, span))
+            bilinear = c00 * (1 - u) * (1 - v) + c01 * (1 - u) * v + c10 * u * (1 - v) + c11 * u * v
+            block[missing] = bilinear[missing]
+
+    return success_level, evaluations
+
+
+def heat_map_axes(x_variance, y_variance, mean_state, x_axis, y_axis, num_axis_points, adaptive=False):
+    # with adaptive set, num_axis_points is rounded up to the next quadtree lattice size
+    if adaptive:
+        num_axis_points = adaptive_lattice_size(adaptive_base_points, num_axis_points)
+    return heat_map_axis_values(x_variance, mean_state[x_axis], num_axis_points), \
+        heat_map_axis_values(y_variance, mean_state[y_axis], num_axis_points)
+
+
+def heat_map_xy(x_variance, y_variance, mean_state, reference_orbit, end_seconds, recorded_times,
+                x_axis, y_axis, threshold_min, threshold_max, num_axis_points, workers=1,
+                adaptive=False, max_evaluations=None, control=None, model="j2",
+                drag_alpha=DragRelativeMotion.default_alpha):
+    x_values, y_values = heat_map_axes(x_variance, y_variance, mean_state, x_axis, y_axis, num_axis_points, adaptive)
+    times = np.linspace(0.0, end_seconds, recorded_times)
+    pool = open_pool(workers)
+    try:
+        if adaptive:
+            success_level, _ = adaptive_success_level(x_values, y_values, mean_state, x_axis, y_axis,
+                                                      reference_orbit, times, times[1] - times[0], threshold_min,
+                                                      threshold_max, workers, adaptive_base_points, max_evaluations,
+                                                      control=control, model=model, drag_alpha=drag_alpha,
+                                                      pool=pool)
+        else:
+            success_level = success_level_grid(x_values, y_values, mean_state, x_axis, y_axis, reference_orbit,
+                                               times, times[1] - times[0], threshold_min, threshold_max, workers,
+                                               control, model, drag_alpha, pool)
+    except BaseException:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    if pool is not None:
+        pool.shutdown()
+    return x_values, y_values, success_level
+
+# ############################################################################# #
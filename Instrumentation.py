@@ -0,0 +1,122 @@
+import contextlib
+import threading
+import time
+import tracemalloc
+
+# ############################## JOB INSTRUMENTATION ############################## #
+
+enabled = False  # instrument background jobs started from the GUI
+active = None  # counters of the job being instrumented, hot paths check this before recording anything
+
+phases = ("setup", "propagate", "reduce", "render")
+disabled_phase = contextlib.nullcontext()
+
+
+class JobCounters:
+
+    def __init__(self, track_memory=True):
+
+        self.rhs_evaluations = 0
+        self.accepted_steps = 0
+        self.rejected_steps = 0
+        self.phase_seconds = dict.fromkeys(phases, 0.0)
+        self.peak_bytes = None
+        self.wall_seconds = None
+        self.track_memory = track_memory
+        self._begin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stacks = threading.local()  # open phases per thread, so partial draws and propagation do not mix
+
+    def add_integrator_steps(self, rhs_evaluations, accepted=0, rejected=0):
+        with self._lock:
+            self.rhs_evaluations += int(rhs_evaluations)
+            self.accepted_steps += int(accepted)
+            self.rejected_steps += int(rejected)
+
+    def enter_phase(self, name):
+        stack = self._stack()
+        now = time.perf_counter()
+        if stack:
+            self._add_phase_time(stack[-1][0], now - stack[-1][1])
+        stack.append([name, now])
+
+    def exit_phase(self):
+        stack = self._stack()
+        now = time.perf_counter()
+        name, begin = stack.pop()
+        self._add_phase_time(name, now - begin)
+        if stack:
+            stack[-1][1] = now  # the enclosing phase resumes, so nested time is only counted once
+
+    def _stack(self):
+        if not hasattr(self._stacks, "phases"):
+            self._stacks.phases = []
+        return self._stacks.phases
+
+    def _add_phase_time(self, name, seconds):
+        with self._lock:
+            self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + seconds
+
+    def get_summary(self):
+        return {"wall_seconds": self.wall_seconds, "phase_seconds": dict(self.phase_seconds),
+                "rhs_evaluations": self.rhs_evaluations, "accepted_steps": self.accepted_steps,
+                "rejected_steps": self.rejected_steps, "peak_bytes": self.peak_bytes}
+
+    def format(self):
+        text = str(round(self.wall_seconds or time.perf_counter() - self._begin, 2)) + " s ("
+        text += ", ".join(name + " " + str(round(seconds, 2)) for name, seconds in self.phase_seconds.items()
+                          if seconds >= 0.005) + ")"
+        if self.rhs_evaluations:
+            text += " | RHS " + str(self.rhs_evaluations)
+        if self.accepted_steps or self.rejected_steps:
+            text += ", steps " + str(self.accepted_steps) + " accepted / " + str(self.rejected_steps) + " rejected"
+        if self.peak_bytes is not None:
+            text += " | peak " + str(round(self.peak_bytes / 2 ** 20, 1)) + " MiB"
+        return text
+
+
+def start(track_memory=True):
+    # begin recording into fresh counters, peak memory is traced with tracemalloc when track_memory is set
+    global active
+    active = JobCounters(track_memory)
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif track_memory:
+        tracemalloc.reset_peak()
+    return active
+
+
+def stop():
+    # stop recording and return the finished counters, or None when nothing was being recorded
+    global active
+    counters, active = active, None
+    if counters is None:
+        return None
+    counters.wall_seconds = time.perf_counter() - counters._begin
+    if counters.track_memory and tracemalloc.is_tracing():
+        counters.peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return counters
+
+
+@contextlib.contextmanager
+def _timed_phase(counters, name):
+    counters.enter_phase(name)
+    try:
+        yield
+    finally:
+        counters.exit_phase()
+
+
+def phase(name):
+    # with phase("propagate"): ... attributes the enclosed time to name while a job is instrumented
+    if active is None:
+        return disabled_phase
+    return _timed_phase(active, name)
+
+
+def record_solver_steps(rhs_evaluations, accepted, rejected):
+    if active is not None:
+        active.add_integrator_steps(rhs_evaluations, accepted, rejected)
+
+# ################################################################################ #
@@ -1,247 +1,589 @@
+import functools
 import numpy as np
-import scipy as sp
-from scipy import integrate
 import TargetingUtils
-from mpmath import *
+import Instrumentation
+import JobControl
+
+# scipy.integrate is slow to import and only needed by the numerical paths,
+# so it is imported where it is used
 
 r_e = 6378136.3
 j2 = 1.082E-3
 mu = 3.986004415E14
 
-# ######################## TARGETING SEDWICK J2 REOM ######################### #
-
-
-def sedwick_eom_st(t, delta_state, A, n, c, l, q, phi):
-    state_size = len(delta_state)  # 1: implies x ODEs
-    dx_dt = np.zeros((1, state_size))
-    S_T = TargetingUtils.recompose(delta_state)
-    S_T_dt = np.matmul(A, S_T).tolist()
-
-    dx_dt[0][0] = delta_state[3]
-    dx_dt[0][1] = delta_state[4]
-    dx_dt[0][2] = delta_state[5]
-    dx_dt[0][3] = 2 * n * c * delta_state[4] + (5 * c ** 2 - 2) * n ** 2 * delta_state[0]
-    dx_dt[0][4] = -2 * n * c * delta_state[3]
-    dx_dt[0][5] = -q ** 2 * delta_state[2] + 2 * l * q * np.cos(q * t + phi)
-
-    dx_dt[0][6] = S_T_dt[0][0]
-    dx_dt[0][7] = S_T_dt[0][1]
-    dx_dt[0][8] = S_T_dt[0][2]
-    dx_dt[0][9] = S_T_dt[0][3]
-    dx_dt[0][10] = S_T_dt[0][4]
-    dx_dt[0][11] = S_T_dt[0][5]
-    dx_dt[0][12] = S_T_dt[1][0]
-    dx_dt[0][13] = S_T_dt[1][1]
-    dx_dt[0][14] = S_T_dt[1][2]
-    dx_dt[0][15] = S_T_dt[1][3]
-    dx_dt[0][16] = S_T_dt[1][4]
-    dx_dt[0][17] = S_T_dt[1][5]
-    dx_dt[0][18] = S_T_dt[2][0]
-    dx_dt[0][19] = S_T_dt[2][1]
-    dx_dt[0][20] = S_T_dt[2][2]
-    dx_dt[0][21] = S_T_dt[2][3]
-    dx_dt[0][22] = S_T_dt[2][4]
-    dx_dt[0][23] = S_T_dt[2][5]
-    dx_dt[0][24] = S_T_dt[3][0]
-    dx_dt[0][25] = S_T_dt[3][1]
-    dx_dt[0][26] = S_T_dt[3][2]
-    dx_dt[0][27] = S_T_dt[3][3]
-    dx_dt[0][28] = S_T_dt[3][4]
-    dx_dt[0][29] = S_T_dt[3][5]
-    dx_dt[0][30] = S_T_dt[4][0]
-    dx_dt[0][31] = S_T_dt[4][1]
-    dx_dt[0][32] = S_T_dt[4][2]
-    dx_dt[0][33] = S_T_dt[4][3]
-    dx_dt[0][34] = S_T_dt[4][4]
-    dx_dt[0][35] = S_T_dt[4][5]
-    dx_dt[0][36] = S_T_dt[5][0]
-    dx_dt[0][37] = S_T_dt[5][1]
-    dx_dt[0][38] = S_T_dt[5][2]
-    dx_dt[0][39] = S_T_dt[5][3]
-    dx_dt[0][40] = S_T_dt[5][4]
-    dx_dt[0][41] = S_T_dt[5][5]
-    return dx_dt
+ensemble_chunk_samples = 2 ** 20  # samples per member chunk when reducing ensembles
+stream_chunk_samples = 2 ** 16  # samples per chunk when streaming long horizons
+plane_angle_tolerance = 1e-12  # rad, node and plane angles below this are treated as zero
 
 # ############################## SEDWICK J2 REOM ############################## #
 
-def sedwick_eom(t, delta_state, n, c, l, q, phi):
-    state_size = len(delta_state)  # 1: implies x ODEs
-    dx_dt = np.zeros((1, state_size))
-    dx_dt[0][0] = delta_state[3]
-    dx_dt[0][1] = delta_state[4]
-    dx_dt[0][2] = delta_state[5]
-    dx_dt[0][3] = 2 * n * c * delta_state[4] + (5 * c ** 2 - 2) * n ** 2 * delta_state[0]
-    dx_dt[0][4] = -2 * n * c * delta_state[3]
-    dx_dt[0][5] = -q ** 2 * delta_state[2] + 2 * l * q * np.cos(q * t + phi)
-    return dx_dt
-
-
-def evaluate_j2_constants(reference_orbit, delta_state_0):
-    # calculate j2 parameter effects, assuming that the reference
-    # orbit is the same as satellite 1's circularized orbit.
-    s = 3 * j2 * r_e ** 2 / (8 * reference_orbit.get_a() ** 2) * (1 + 3 * np.cos(2 * reference_orbit.get_i()))
+# solve_ivp solver (a Dormand-Prince pair), rtol and atol (meters, meters/second) of each numerical method.
+# the fidelity presets trade accuracy for speed, 'dopri5' and 'dop853' keep the original tight tolerances
+numerical_methods = {'screening': ('RK45', 1e-6, 1e-3), 'standard': ('DOP853', 1e-9, 1e-6),
+                     'precise': ('DOP853', 1e-12, 1e-12), 'dopri5': ('RK45', 1e-12, 1e-12),
+                     'dop853': ('DOP853', 1e-12, 1e-12)}
+fidelity_presets = ('analytic', 'screening', 'standard', 'precise')  # 'analytic' is the exact closed form
+
+
+def sedwick_system_matrix(n, c, q):
+    # the linear part of the Sedwick EOM, d(delta_state)/dt = A delta_state + forcing(t)
+    system = np.zeros((6, 6))
+    system[0, 3] = system[1, 4] = system[2, 5] = 1.0
+    system[3, 0] = (5 * c ** 2 - 2) * n ** 2
+    system[3, 4] = 2 * n * c
+    system[4, 3] = -2 * n * c
+    system[5, 2] = -q ** 2
+    return system
+
+
+def sedwick_eom(n, c, l, q, phi):
+    # right-hand side f(t, delta_state) for the numerical solvers, the only allocation per call is the
+    # product, which the solver may keep (e.g. as the first stage of the next step)
+    system = sedwick_system_matrix(n, c, q)
+    forcing = 2 * l * q
+
+    def rhs(t, delta_state):
+        dx_dt = system @ delta_state
+        dx_dt[5] += forcing * np.cos(q * t + phi)
+        return dx_dt
+    return rhs
+
+
+def j2_orbit_terms(a, i):
+    # terms that depend only on the reference orbit: c, n, k and the reference RAAN rate.
+    # a and i may be scalars or arrays
+    s = 3 * j2 * r_e ** 2 / (8 * a ** 2) * (1 + 3 * np.cos(2 * i))
     c = np.sqrt(s + 1)
-    n = np.sqrt(mu / reference_orbit.get_a() ** 3)
-    k = n * c + 3 * n * j2 * r_e ** 2 / (2 * reference_orbit.get_a() ** 2) * np.cos(reference_orbit.get_i()) ** 2
-
-    i_sat2 = reference_orbit.get_i() - delta_state_0[5] / (k * reference_orbit.get_a())
+    n = np.sqrt(mu / a ** 3)
+    k = n * c + 3 * n * j2 * r_e ** 2 / (2 * a ** 2) * np.cos(i) ** 2
+    d_RAAN_sat1_0 = -3 * n * j2 * r_e ** 2 / (2 * a ** 2) * np.cos(i)
+    return c, n, k, d_RAAN_sat1_0
 
-    delta_RAAN_0 = delta_state_0[2] / (reference_orbit.get_a() * np.sin(reference_orbit.get_i()))
-    gamma_0 = float(acot((cot(i_sat2) * np.sin(reference_orbit.get_i()) - np.cos(reference_orbit.get_i()) * np.cos(
-        delta_RAAN_0)) / np.sin(delta_RAAN_0)))
-    phi_0 = np.arccos(
-        np.cos(reference_orbit.get_i()) * np.cos(i_sat2) + np.sin(reference_orbit.get_i()) * np.sin(i_sat2) * np.cos(
-            delta_RAAN_0))
 
-    d_RAAN_sat1_0 = -3 * n * j2 * r_e ** 2 / (2 * reference_orbit.get_a() ** 2) * np.cos(reference_orbit.get_i())
-    d_RAAN_sat2_0 = -3 * n * j2 * r_e ** 2 / (2 * reference_orbit.get_a() ** 2) * np.cos(i_sat2)
+def reference_orbit_arrays(reference_orbit):
+    # a and i of one reference orbit as scalars, or of an OrbitalElementSet or sequence of orbits as (N,) arrays
+    if hasattr(reference_orbit, "get_a"):
+        return reference_orbit.get_a(), reference_orbit.get_i()
+    return np.array([orbit.get_a() for orbit in reference_orbit]), np.array([orbit.get_i() for orbit in reference_orbit])
 
-    q = n * c - (np.sin(gamma_0) * np.cos(gamma_0) * (1 / np.tan(delta_RAAN_0)) - np.sin(gamma_0) ** 2 * np.cos(
-        reference_orbit.get_i())) * (d_RAAN_sat1_0 - d_RAAN_sat2_0) - d_RAAN_sat1_0 * np.cos(reference_orbit.get_i())
-    l = -reference_orbit.get_a() * (
-    np.sin(reference_orbit.get_i()) * np.sin(i_sat2) * np.sin(delta_RAAN_0) / np.sin(phi_0)) * (
-        d_RAAN_sat1_0 - d_RAAN_sat2_0)
 
-    m = reference_orbit.get_a() * phi_0
-    phi = delta_state_0[2] / m
+def evaluate_j2_constants(reference_orbit, delta_state_0):
+    # calculate j2 parameter effects, assuming that the reference
+    # orbit is the same as satellite 1's circularized orbit.
+    n, c, l, q, phi = evaluate_j2_constants_batch(reference_orbit, [delta_state_0[:6]])
+    return float(n), float(c), float(l[0]), float(q[0]), float(phi[0])
+
+
+def evaluate_j2_constants_batch(reference_orbit, delta_states_0):
+    # evaluate_j2_constants for an (N, 6) array of initial states. with a single reference orbit n and c are
+    # returned as scalars, with N orbits (one per state) as (N,) arrays; l, q, phi are (N,) arrays.
+    # only z_0 and zd_0 enter l, q and phi, the orbit-only terms are computed once per orbit
+    delta_states_0 = np.atleast_2d(np.asarray(delta_states_0, dtype=float))
+    a, i = reference_orbit_arrays(reference_orbit)
+    if np.ndim(a) == 0 and len(delta_states_0) > 1 and np.all(delta_states_0[:, 2] == delta_states_0[0, 2]) and \
+            np.all(delta_states_0[:, 5] == delta_states_0[0, 5]):
+        # sweeps over in-plane components share a single set of constants
+        n, c, l, q, phi = evaluate_j2_constants_batch(reference_orbit, delta_states_0[:1])
+        return n, c, np.repeat(l, len(delta_states_0)), np.repeat(q, len(delta_states_0)), \
+            np.repeat(phi, len(delta_states_0))
+    c, n, k, _ = j2_orbit_terms(a, i)
+
+    i_sat2 = i - delta_states_0[:, 5] / (k * a)
+    delta_RAAN_0 = delta_states_0[:, 2] / (a * np.sin(i))
+    sin_i, cos_i = np.sin(i), np.cos(i)
+    sin_i2, cos_i2 = np.sin(i_sat2), np.cos(i_sat2)
+    sin_RAAN, cos_RAAN = np.sin(delta_RAAN_0), np.cos(delta_RAAN_0)
+    K = 3 * n * j2 * r_e ** 2 / (2 * a ** 2)
+    d_RAAN = K * (cos_i2 - cos_i)  # d_RAAN_sat1_0 - d_RAAN_sat2_0
+
+    # gamma_0 = acot(x / y) only enters through sin(gamma) cos(gamma) and sin^2(gamma), which do not depend on
+    # the quadrant, so they follow from x and y directly
+    x = sin_i * cos_i2 / sin_i2 - cos_i * cos_RAAN
+    hypot_squared = x ** 2 + sin_RAAN ** 2
+    # haversine form of the angle between the orbit planes, arccos of the cosine rule loses it for close orbits
+    phi_0 = 2 * np.arcsin(np.sqrt(np.sin((i - i_sat2) / 2) ** 2 + sin_i * sin_i2 * np.sin(delta_RAAN_0 / 2) ** 2))
+
+    # as delta_RAAN_0 -> 0 the orbits share a node: sin(gamma) cos(gamma) / tan(delta_RAAN) tends to
+    # sin(i_sat2) / sin(i - i_sat2) and gamma and l tend to 0. for coplanar orbits the RAAN rates agree too, and
+    # the coupling term tends to 3 n j2 r_e^2 / (2 a^2) sin^2(i); z stays 0 there, this just keeps q continuous.
+    # the limits are taken below a tolerance, as squares of tiny z_0 or zd_0 underflow to 0 before the angles do
+    nodal = np.abs(delta_RAAN_0) < plane_angle_tolerance
+    coplanar = nodal & (phi_0 < plane_angle_tolerance)
+    safe_hypot_squared = np.where(nodal, 1.0, hypot_squared)
+    safe_gap = np.where(i_sat2 == i, 1.0, np.sin(i - i_sat2))
+    safe_phi_0 = np.where(coplanar, 1.0, phi_0)
+    safe_sin_phi_0 = np.where(coplanar, 1.0, np.sin(phi_0))  # phi_0 comes from the haversine, so it is accurate
+    coupling = np.where(nodal, sin_i2 / safe_gap,
+                        (x * cos_RAAN - sin_RAAN ** 2 * cos_i) / safe_hypot_squared) * d_RAAN
+    coupling = np.where(coplanar, K * sin_i ** 2, coupling)
+
+    q = n * c - coupling + K * cos_i ** 2
+    l = -a * (sin_i * sin_i2 * sin_RAAN / safe_sin_phi_0) * d_RAAN
+    phi = np.where(coplanar, 0.0, delta_states_0[:, 2] / (a * safe_phi_0))
 
     return n, c, l, q, phi
 
 
-def j2_sedwick_propagator(delta_state_0, reference_orbit, time, step, type, thresh_min, thresh_max, target_status):
-    n, c, l, q, phi = evaluate_j2_constants(reference_orbit, delta_state_0)
-    sc = sp.integrate.ode(lambda t, x: sedwick_eom(t, x, n, c, l, q, phi)).set_integrator('dopri5', atol=1e-12,
-                                                                                          rtol=1e-12)
-    sc.set_initial_value(delta_state_0, time[0])
-    t = np.zeros((len(time), len(delta_state_0)))
-    result = np.zeros((len(time), len(delta_state_0)))
-    t[0] = time[0]
-    result[0][:] = delta_state_0
-    step_count = 1
+def sedwick_closed_form(t, delta_state_0, n, c, l, q, phi, t_0=0.0):
+    # exact solution of sedwick_eom from delta_state_0 at t_0, one row per entry of t
+    return sedwick_closed_form_batch(t, [delta_state_0[:6]], n, c, l, q, phi, t_0=t_0)[0]
+
+
+def sedwick_closed_form_batch(t, delta_states_0, n, c, l, q, phi, t_0=0.0):
+    # exact solution of sedwick_eom for an (N, 6) array of initial states, returned as (N, T, 6).
+    # the in-plane motion is an oscillator at w = n * sqrt(2 - c^2) plus along-track drift, the
+    # cross-track motion is a resonantly forced oscillator at q. n, c, l, q, phi and t_0 may be
+    # scalars or (N,) arrays
+    tau = np.asarray(t, dtype=float)[np.newaxis, :] - np.reshape(t_0, (-1, 1))
+    delta_states_0 = np.asarray(delta_states_0, dtype=float)
+    x_0, y_0, z_0, xd_0, yd_0, zd_0 = [delta_states_0[:, [index]] for index in range(6)]
+    n, c, l, q, phi, t_0 = [np.reshape(value, (-1, 1)) for value in (n, c, l, q, phi, t_0)]
+
+    w = n * np.sqrt(2 - c ** 2)
+    k = 2 * n * c
+    drift = yd_0 + k * x_0  # y' + 2nc * x is conserved
+    x_p = k * drift / w ** 2
+    cos_wt = np.cos(w * tau)
+    sin_wt = np.sin(w * tau)
+
+    theta = q * (tau + t_0) + phi
+    z_h = zd_0 - l * np.sin(q * t_0 + phi)
+    cos_qt = np.cos(q * tau)
+    sin_qt = np.sin(q * tau)
+
+    result = np.empty((len(delta_states_0), tau.shape[1], 6))
+    result[..., 0] = x_p + (x_0 - x_p) * cos_wt + xd_0 / w * sin_wt
+    result[..., 1] = y_0 + (drift - k * x_p) * tau - k * (x_0 - x_p) / w * sin_wt + k * xd_0 / w ** 2 * (cos_wt - 1)
+    result[..., 2] = z_0 * cos_qt + z_h / q * sin_qt + l * tau * np.sin(theta)
+    result[..., 3] = xd_0 * cos_wt - (x_0 - x_p) * w * sin_wt
+    result[..., 4] = drift - k * result[..., 0]
+    result[..., 5] = z_h * cos_qt - z_0 * q * sin_qt + l * np.sin(theta) + l * q * tau * np.cos(theta)
+    return result
+
+
+def sedwick_stm(t, n, c, q):
+    # state transition matrices of the Sedwick equations from 0 to each entry of t, as (T, 6, 6).
+    # the system matrix is constant, so column j is the unforced closed-form response to unit state j
+    columns = sedwick_closed_form_batch(t, np.identity(6), n, c, 0.0, q, 0.0)
+    return columns.transpose(1, 2, 0)
+
+
+@functools.lru_cache(maxsize=256)
+def sedwick_stm_at(t, n, c, q):
+    # cached single STM, targeting revisits the same epochs with the same constants
+    stm = sedwick_stm([t], n, c, q)[0]
+    stm.setflags(write=False)
+    return stm
+
+
+def sedwick_integrate(delta_state_0, t, n, c, l, q, phi, method='dopri5'):
+    # one adaptive solver run over [t[0], t[-1]] evaluated at every sample of t. the solver is stepped here, as
+    # solve_ivp would, so its steps can be counted, and fills the samples inside each step from its dense output
+    import scipy.integrate
+    result = np.empty((len(t), 6))
+    result[0] = delta_state_0[:6]
+    if len(t) < 2:
+        return result
+    solver_name, rtol, atol = numerical_methods[method]
+    solver = getattr(scipy.integrate, solver_name)(sedwick_eom(n, c, l, q, phi), t[0], result[0], t[-1],
+                                                   rtol=rtol, atol=atol)
+    first = 1
+    accepted = dense_outputs = 0
+    while first < len(t):
+        message = solver.step()
+        if solver.status == 'failed':
+            raise RuntimeError("numerical propagation failed: " + str(message))
+        accepted += 1
+        last = int(np.searchsorted(t, solver.t, side='right'))
+        if last > first:
+            result[first:last] = solver.dense_output()(t[first:last]).T
+            dense_outputs += 1
+            first = last
+
+    # every step attempt costs n_stages evaluations after the two spent on the initial derivative and step size,
+    # and DOP853 evaluates its extra interpolation stages for every dense output
+    attempts = (solver.nfev - 2 - dense_outputs * len(getattr(solver, 'A_EXTRA', ()))) // solver.n_stages
+    Instrumentation.record_solver_steps(solver.nfev, accepted, attempts - accepted)
+    return result
+
+
+def propagation_error(t, states, delta_state_0, constants, t_0=None):
+    # a-posteriori error of a numerical run: the largest position difference (m) from the closed form, which
+    # solves the same equations exactly. delta_state_0 holds at t_0, t[0] by default
+    if len(t) == 0:
+        return 0.0
+    n, c, l, q, phi = constants
+    exact = sedwick_closed_form(t, delta_state_0, n, c, l, q, phi, t_0=t[0] if t_0 is None else t_0)
+    return float(np.max(np.linalg.norm(states[:, :3] - exact[:, :3], axis=1)))
+
+
+def sample_times(time, step):
+    return time[0] + step * np.arange(len(time))
+
+
+def range_magnitudes(result):
+    return np.sqrt(result[..., 0] ** 2 + result[..., 1] ** 2 + result[..., 2] ** 2)
+
+
+def in_range_mask(magnitudes, thresh_min, thresh_max):
+    return (magnitudes > thresh_min) & (magnitudes < thresh_max)
+
+
+def pass_lengths_from_mask(in_range):
+    # a pass of k consecutive in-range samples has length k - 1 steps
+    return pass_lengths_from_masks([in_range])[0]
+
+
+def pass_lengths_from_masks(in_range):
+    # pass lengths of every row of an (N, T) in-range mask, as N lists
+    in_range = np.asarray(in_range, dtype=np.int8)
+    padded = np.zeros((in_range.shape[0], in_range.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = in_range
+    edges = np.diff(padded.ravel())
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = ends - starts - 1
+    splits = np.searchsorted(starts, np.arange(1, in_range.shape[0]) * padded.shape[1])
+    return [row.tolist() for row in np.split(lengths, splits)]
+
+
+def split_by_range(t, result, magnitudes, thresh_min, thresh_max):
+    out_of_range = (magnitudes > thresh_max) | (magnitudes < thresh_min)
+    in_range = ~out_of_range
+    return t[in_range].tolist(), [result[in_range, 0], result[in_range, 1], result[in_range, 2]], \
+           t[out_of_range].tolist(), [result[out_of_range, 0], result[out_of_range, 1], result[out_of_range, 2]]
+
+
+def bisect_times(predicate, lower, upper, tolerance):
+    # vectorised bisection for the instants where a boolean predicate of time flips inside [lower, upper]
+    lower = np.array(lower, dtype=float)
+    upper = np.array(upper, dtype=float)
+    if len(lower) == 0:
+        return lower
+    at_lower = predicate(lower)
+    for _ in range(int(np.ceil(np.log2(max(np.max(upper - lower), tolerance) / tolerance)))):
+        middle = (lower + upper) / 2
+        same = predicate(middle) == at_lower
+        lower = np.where(same, middle, lower)
+        upper = np.where(same, upper, middle)
+    return (lower + upper) / 2
+
+
+def range_pass_times(t, result, delta_state_0, constants, thresh_min, thresh_max, tolerance=1e-6):
+    # start and end times of every pass inside the (thresh_min, thresh_max) shell, found by root finding on the
+    # closed form between samples rather than by counting samples. range extrema between samples are located
+    # first (where r.v changes sign), so a pass shorter than the output step is still found as long as the step
+    # is below half the shortest oscillation period. passes are clipped to [t[0], t[-1]]
+    n, c, l, q, phi = constants
+
+    def states_at(times):
+        return sedwick_closed_form(times, delta_state_0, n, c, l, q, phi, t_0=t[0])
+
+    def approaching(times):
+        states = states_at(times)
+        return np.sum(states[:, :3] * states[:, 3:], axis=1) < 0
+
+    def outside(threshold):
+        return lambda times: range_magnitudes(states_at(times)) > threshold
+
+    radial_rate = np.sum(result[:, :3] * result[:, 3:], axis=1) < 0
+    turns = np.flatnonzero(radial_rate[:-1] != radial_rate[1:])
+    extrema = bisect_times(approaching, t[turns], t[turns + 1], tolerance)
+    order = np.argsort(np.concatenate((t, extrema)), kind='stable')
+    nodes = np.concatenate((t, extrema))[order]
+    magnitudes = np.concatenate((range_magnitudes(result), range_magnitudes(states_at(extrema))))[order]
+
+    # the range is monotonic between nodes, so each threshold is crossed at most once per interval
+    crossings = []
+    for threshold in (thresh_min, thresh_max):
+        above = magnitudes > threshold
+        flips = np.flatnonzero(above[:-1] != above[1:])
+        crossings.append(bisect_times(outside(threshold), nodes[flips], nodes[flips + 1], tolerance))
+    crossings = np.sort(np.concatenate(crossings))
+
+    # every crossing toggles whether the deputy is in range
+    inside_at_start = bool(in_range_mask(magnitudes[0], thresh_min, thresh_max))
+    edges = np.concatenate(([t[0]] if inside_at_start else [], crossings))
+    if len(edges) % 2:
+        edges = np.append(edges, t[-1])
+    return edges[0::2], edges[1::2]
+
+
+def j2_sedwick_trajectory(delta_state_0, reference_orbit, time, step, method='analytic'):
+    # sample times and the (T, 6) propagated states, including the initial state
+    with Instrumentation.phase("setup"):
+        constants = evaluate_j2_constants(reference_orbit, delta_state_0)
+        t = sample_times(time, step)
+    with Instrumentation.phase("propagate"):
+        return t, sedwick_resume(delta_state_0, t, constants, method)
+
+
+def sedwick_resume(delta_state, t, constants, method='analytic'):
+    # propagate delta_state, known at t[0], to every sample of t using the J2 constants of the
+    # trajectory's original initial state
+    n, c, l, q, phi = constants
+    if method == 'analytic':
+        return sedwick_closed_form(t, delta_state, n, c, l, q, phi, t_0=t[0])
+    elif method in numerical_methods:
+        return sedwick_integrate(delta_state, t, n, c, l, q, phi, method)
+    raise ValueError("unknown propagation method: " + str(method))
+
+
+def j2_sedwick_stream(delta_state_0, reference_orbit, t_0, step, num_samples, chunk_samples=None,
+                      method='analytic'):
+    # yield (t, states) chunks of at most chunk_samples of the num_samples samples t_0 + step * k, so only one
+    # chunk is held at a time. the closed form restarts every chunk from delta_state_0, the numerical
+    # method continues from the last state of the previous chunk
+    if chunk_samples is None:
+        chunk_samples = stream_chunk_samples
+    with Instrumentation.phase("setup"):
+        constants = evaluate_j2_constants(reference_orbit, delta_state_0)
+    state = np.asarray(delta_state_0[:6], dtype=float)
+    for first in range(0, num_samples, chunk_samples):
+        t = t_0 + step * np.arange(first, min(first + chunk_samples, num_samples))
+        with Instrumentation.phase("propagate"):
+            if method == 'analytic':
+                n, c, l, q, phi = constants
+                states = sedwick_closed_form(t, delta_state_0, n, c, l, q, phi, t_0=t_0)
+            elif first == 0:
+                states = sedwick_resume(state, t, constants, method)
+            else:
+                # restart from the previous chunk's last sample and drop it again
+                states = sedwick_resume(state, np.concatenate(([t[0] - step], t)), constants, method)[1:]
+        state = states[-1]
+        yield t, states
+
+
+class RangeReduction:
+
+    # online reductions of a streamed trajectory, matching j2_sedwick_propagator's threshold modes:
+    # in-range count (type 1), pass lengths in samples (type 3) and range statistics. with the reference
+    # (delta_state_0, constants, t_0) of a numerical run, the propagation_error of every chunk is tracked too
+
+    def __init__(self, thresh_min, thresh_max, reference=None):
+
+        self.thresh_min = thresh_min
+        self.thresh_max = thresh_max
+        self.samples = 0
+        self.in_range_count = 0
+        self.min_range = np.inf
+        self.min_range_time = None
+        self.max_range = -np.inf
+        self.max_range_time = None
+        self.range_sum = 0.0
+        self.position_error = 0.0  # stays 0 for the closed form, which is the reference itself
+        self._reference = reference
+        self._pass_lengths = []
+        self._open_run = 0  # in-range samples at the end of the chunks seen so far
+
+    def update(self, t, states):
+        with Instrumentation.phase("reduce"):
+            magnitudes = range_magnitudes(states)
+            in_range = in_range_mask(magnitudes, self.thresh_min, self.thresh_max)
+            self.samples += len(magnitudes)
+            self.in_range_count += int(np.count_nonzero(in_range))
+            self.range_sum += float(np.sum(magnitudes))
+            lowest, highest = np.argmin(magnitudes), np.argmax(magnitudes)
+            if magnitudes[lowest] < self.min_range:
+                self.min_range, self.min_range_time = float(magnitudes[lowest]), float(t[lowest])
+            if magnitudes[highest] > self.max_range:
+                self.max_range, self.max_range_time = float(magnitudes[highest]), float(t[highest])
+
+            # runs of in-range samples, the first one continuing any run left open by the previous chunk
+            edges = np.diff(np.concatenate(([0], in_range.astype(np.int8), [0])))
+            starts = np.flatnonzero(edges == 1)
+            ends = np.flatnonzero(edges == -1)
+            runs = ends - starts
+            if len(runs) and starts[0] == 0:
+                runs[0] += self._open_run
+            elif self._open_run:
+                self._pass_lengths.append(self._open_run - 1)
+            if len(runs) and ends[-1] == len(in_range):
+                self._open_run = int(runs[-1])
+                runs = runs[:-1]
+            else:
+                self._open_run = 0
+            self._pass_lengths.extend((runs - 1).tolist())
+
+            if self._reference is not None:
+                self.position_error = max(self.position_error, propagation_error(t, states, *self._reference))
+
+    def get_pass_lengths(self):
+        # a pass still in range at the last sample counts as ending there
+        return self._pass_lengths + ([self._open_run - 1] if self._open_run else [])
+
+    def get_mean_range(self):
+        return self.range_sum / self.samples if self.samples else np.nan
+
+    def get_summary(self):
+        return {"samples": self.samples, "samples_in_range": self.in_range_count,
+                "passes": len(self.get_pass_lengths()), "pass_lengths": self.get_pass_lengths(),
+                "min_range": self.min_range, "min_range_time": self.min_range_time,
+                "max_range": self.max_range, "max_range_time": self.max_range_time,
+                "mean_range": self.get_mean_range(), "position_error": self.position_error}
+
+
+def j2_sedwick_stream_reduce(delta_state_0, reference_orbit, t_0, step, num_samples, thresh_min, thresh_max,
+                             chunk_samples=None, method='analytic', control=None):
+    # RangeReduction over samples 1 .. num_samples - 1, skipping the initial state like the threshold modes,
+    # in memory independent of the horizon
+    reference = None
+    if method != 'analytic':
+        reference = (delta_state_0, evaluate_j2_constants(reference_orbit, delta_state_0), t_0)
+    reduction = RangeReduction(thresh_min, thresh_max, reference)
+    for t, states in j2_sedwick_stream(delta_state_0, reference_orbit, t_0, step, num_samples, chunk_samples,
+                                       method):
+        if t[0] == t_0:
+            t, states = t[1:], states[1:]
+        if len(t):
+            reduction.update(t, states)
+        JobControl.report(control, (t[-1] - t_0) / (step * max(1, num_samples - 1)) if len(t) else 1.0)
+    return reduction
+
+
+def j2_sedwick_propagator(delta_state_0, reference_orbit, time, step, type, thresh_min, thresh_max, target_status,
+                          method='analytic'):
+    if type in (1, 3):
+        # only a count or the pass lengths are needed, so the trajectory is streamed rather than held
+        reduction = j2_sedwick_stream_reduce(delta_state_0, reference_orbit, time[0], step, len(time), thresh_min,
+                                             thresh_max, method=method)
+        return reduction.in_range_count if type == 1 else reduction.get_pass_lengths()
+
+    t, result = j2_sedwick_trajectory(delta_state_0, reference_orbit, time, step, method)
 
     if type == 0:
-        while sc.successful() and step_count < len(t):
-            sc.integrate(sc.t + step)
-            t[step_count] = sc.t
-            result[step_count][:] = sc.y
-            step_count += 1
-
         return [result[:, 0], result[:, 1], result[:, 2]]
 
-    elif type == 1:  # if we are counting how many fit within a threshold rather than simply propagating
-
-        success_count = 0
-        while sc.successful() and step_count < len(t):
-            sc.integrate(sc.t + step)
-            t[step_count] = sc.t
-            result[step_count][:] = sc.y
-            step_count += 1
-            if (np.sqrt(sc.y[0] ** 2 + sc.y[1] ** 2 + sc.y[2] ** 2) > thresh_min) & (
-                        np.sqrt(sc.y[0] ** 2 + sc.y[1] ** 2 + sc.y[2] ** 2) < thresh_max):
-                success_count += 1
-
-        return success_count
-
-    elif type == 2:
-        result_in_range = [[], [], [], [], [], []]
-        t_in_range = []
-        result_out_of_range = [[], [], [], [], [], []]
-        t_out_of_range = []
-        while sc.successful() and step_count < len(t):
-            sc.integrate(sc.t + step)
-            t[step_count] = sc.t
-            step_count += 1
-            if (np.sqrt(sc.y[0] ** 2 + sc.y[1] ** 2 + sc.y[2] ** 2) > thresh_max) | \
-                    (np.sqrt(sc.y[0] ** 2 + sc.y[1] ** 2 + sc.y[2] ** 2) < thresh_min):
-                for i in range(len(sc.y)):
-                    result_out_of_range[i].append(sc.y[i])
-                t_out_of_range.append(sc.t)
-            else:
-                for i in range(len(sc.y)):
-                    result_in_range[i].append(sc.y[i])
-                t_in_range.append(sc.t)
-
-        return t_in_range, [result_in_range[0], result_in_range[1], result_in_range[2]], \
-               t_out_of_range, [result_out_of_range[0], result_out_of_range[1], result_out_of_range[2]]
-
-    elif type == 3:  # to get amounts of time for each pass
-        pass_lengths = []
-        pass_on = False
-        while sc.successful() and step_count < len(t):
-            sc.integrate(sc.t + step)
-            t[step_count] = sc.t
-            result[step_count][:] = sc.y
-            step_count += 1
-            if (np.sqrt(sc.y[0] ** 2 + sc.y[1] ** 2 + sc.y[2] ** 2) > thresh_min) & (
-                        np.sqrt(sc.y[0] ** 2 + sc.y[1] ** 2 + sc.y[2] ** 2) < thresh_max):
-                if not pass_on:
-                    pass_on = True
-                    pass_lengths.append(0)
-                else:
-                    pass_lengths[-1] += 1
-            else:
-                pass_on = False
-
-        return pass_lengths
+    with Instrumentation.phase("reduce"):
+        if type == 5:  # exact pass start and end times in seconds
+            starts, ends = range_pass_times(t, result, delta_state_0,
+                                            evaluate_j2_constants(reference_orbit, delta_state_0),
+                                            thresh_min, thresh_max)
+            return starts.tolist(), ends.tolist()
+
+        # the threshold modes only look at the propagated samples, not the initial state
+        t = t[1:]
+        result = result[1:]
+        magnitudes = range_magnitudes(result)
+
+        if type == 2:
+            return split_by_range(t, result, magnitudes, thresh_min, thresh_max)
+
+        elif type == 4:
+            return magnitudes.tolist()
+
+
+def j2_sedwick_ensemble(delta_states_0, reference_orbit, time, step, type, thresh_min, thresh_max,
+                        chunk_size=None):
+    # propagate an (N, 6) array of initial states over a shared reference orbit and time grid.
+    # type 0 returns the (N, T, 6) trajectories, the other types reduce each member like
+    # j2_sedwick_propagator: 1 in-range counts (N,), 2 in-range masks (N, T - 1),
+    # 3 a list of pass length lists, 4 magnitudes (N, T - 1)
+    with Instrumentation.phase("setup"):
+        delta_states_0 = np.atleast_2d(np.asarray(delta_states_0, dtype=float))
+        n, c, l, q, phi = evaluate_j2_constants_batch(reference_orbit, delta_states_0)
+        t = sample_times(time, step)
+    members = len(delta_states_0)
 
-    elif type == 4:
-        magnitudes = []
-        while sc.successful() and step_count < len(t):
-            sc.integrate(sc.t + step)
-            step_count += 1
-            magnitudes.append(np.sqrt(sc.y[0] ** 2 + sc.y[1] ** 2 + sc.y[2] ** 2))
+    if type == 0:
+        with Instrumentation.phase("propagate"):
+            return sedwick_closed_form_batch(t, delta_states_0, n, c, l, q, phi, t_0=t[0])
+
+    if chunk_size is None:
+        chunk_size = max(1, ensemble_chunk_samples // max(1, len(t)))
+
+    reductions = []
+    for first in range(0, members, chunk_size):
+        last = min(first + chunk_size, members)
+        with Instrumentation.phase("propagate"):
+            # n and c are per member only when the reference orbits are an OrbitalElementSet
+            result = sedwick_closed_form_batch(t[1:], delta_states_0[first:last],
+                                               n[first:last] if np.ndim(n) > 0 else n,
+                                               c[first:last] if np.ndim(c) > 0 else c, l[first:last],
+                                               q[first:last], phi[first:last], t_0=t[0])
+        with Instrumentation.phase("reduce"):
+            magnitudes = range_magnitudes(result)
+
+            if type == 1:
+                reductions.append(np.count_nonzero(in_range_mask(magnitudes, thresh_min, thresh_max), axis=1))
+            elif type == 2:
+                # inclusive at both thresholds, like split_by_range
+                reductions.append(~((magnitudes > thresh_max) | (magnitudes < thresh_min)))
+            elif type == 3:
+                reductions.extend(pass_lengths_from_masks(in_range_mask(magnitudes, thresh_min, thresh_max)))
+            elif type == 4:
+                reductions.append(magnitudes)
+            else:
+                raise ValueError("unknown propagation type: " + str(type))
 
-        return magnitudes
+    if type == 3:
+        return reductions
+    if not reductions:
+        return np.zeros((0,) if type == 1 else (0, len(t) - 1))
+    return np.concatenate(reductions)
 
 
 def j2_sedwick_targeter(delta_state_0, nominal_formation, reference_orbit, time, step, end_seconds, thresh_min,
                         thresh_max, target_status):
-
+    # propagate the flat state (6 states followed by the 6x6 STM) until the range exceeds thresh_max,
+    # then solve for the velocity that reaches the nominal formation position at that epoch
     n, c, l, q, phi = evaluate_j2_constants(reference_orbit, delta_state_0)
 
-    # Jacobian matrix
-    A = np.zeros(shape=(6, 6))
-    A[0][3] = 1
-    A[1][4] = 1
-    A[2][5] = 1
-    A[3][0] = (5 * c ** 2 - 2) * n ** 2  # 24th element
-    A[3][4] = 2 * n * c  # 28th element
-    A[4][3] = -2 * n * c  # 33rd element
-    A[5][2] = -q ** 2  # 38th element
-
-    sc = sp.integrate.ode(lambda t, x: sedwick_eom_st(t, x, A, n, c, l, q, phi)).set_integrator('dopri5', atol=1e-12,
-                                                                                          rtol=1e-12)
-    sc.set_initial_value(delta_state_0, time[0])
-
-    results = [[], [], [], [], [], []]
-    t = []
+    num_samples = max(1, int(np.ceil(end_seconds / step - 1e-9)))
+    t = time[0] + step * np.arange(1, num_samples + 1)
+    states = sedwick_closed_form(t, delta_state_0, n, c, l, q, phi, t_0=time[0])
 
     dv = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
-
-    stable = True
-    current_time = 0
     target_status = True
 
-    while sc.successful() and stable and current_time < end_seconds:
-        sc.integrate(sc.t + step)
-        current_time = current_time + step
-        t.append(current_time)
-        results[0].append(sc.y[0])
-        results[1].append(sc.y[1])
-        results[2].append(sc.y[2])
-        results[3].append(sc.y[3])
-        results[4].append(sc.y[4])
-        results[5].append(sc.y[5])
-        if np.sqrt((sc.y[0]**2 + sc.y[1]**2 + sc.y[2]**2)) > thresh_max:  # do targeting!
-            S_T_vv_inv = np.linalg.inv(TargetingUtils.get_S_T_vv(sc.y))
-            S_T_rv_inv = np.linalg.inv(TargetingUtils.get_S_T_rv(sc.y))
-            # determine a maneuver to put the spacecraft back on track :)
-            dv1 = np.matmul(S_T_rv_inv, np.asarray([nominal_formation[0], nominal_formation[1], nominal_formation[2]]))
-            dv2 = np.matmul(S_T_vv_inv, np.asarray([nominal_formation[3], nominal_formation[4], nominal_formation[5]]))
-            dv = [0, 0, 0, dv1[0, 0], dv1[0, 1], dv1[0, 2]]
-            target_status = False
-            stable = False
-
+    exceeded = np.flatnonzero(range_magnitudes(states) > thresh_max)
+    if len(exceeded):  # do targeting!
+        states = states[:exceeded[0] + 1]
+        S_T = np.matmul(sedwick_stm_at(float(t[exceeded[0]] - time[0]), n, c, q),
+                        TargetingUtils.recompose(delta_state_0))
+        # determine a maneuver to put the spacecraft back on track :)
+        dv1 = np.linalg.solve(TargetingUtils.get_S_T_rv(S_T), np.asarray(nominal_formation[:3], dtype=float))
+        dv = [0, 0, 0, dv1[0], dv1[1], dv1[2]]
+        target_status = False
+
+    current_time = step * len(states)
+    results = [states[:, 0], states[:, 1], states[:, 2], states[:, 3], states[:, 4], states[:, 5]]
     return dv, results, current_time, target_status
 
+
+def j2_sedwick_target_trajectory(state, desired_state, reference_orbit, time, step, end_seconds, thresh_min,
+                                 thresh_max, max_maneuvers=10, control=None):
+    # repeatedly target from t=0 until a run stays within thresh_max, returning the flat state (with STM)
+    # of the longest run, its six state histories and how long it stayed in range
+    targeted_state = list(state[:6]) + np.identity(6).ravel().tolist()
+
+    end_times = []
+    targeted_state_history = []
+    trajectory_history = []
+    maneuver = 0
+    while True:
+        if control is not None:
+            control.check()
+        dv, results, current_time, target_status = j2_sedwick_targeter(targeted_state, desired_state, reference_orbit,
+                                                                       time, step, end_seconds, thresh_min,
+                                                                       thresh_max, False)
+        end_times.append(current_time)
+        targeted_state_history.append(list(targeted_state))
+        trajectory_history.append(results)
+
+        maneuver = maneuver + 1
+        if control is not None:
+            control.report(min(1.0, max(current_time / end_seconds, maneuver / (max_maneuvers + 1))))
+
+        if target_status or maneuver > max_maneuvers:
+            break
+
+        # using the dv we've completed, we can now alter the initial state and try again
+        targeted_state[3] = dv[3]
+        targeted_state[4] = dv[4]
+        targeted_state[5] = dv[5]
+
+    best_run = int(np.argmax(end_times))
+    return targeted_state_history[best_run], trajectory_history[best_run], end_times[best_run]
+
 # ############################################################################ #
@@ -0,0 +1,66 @@
+# ############################## JOB PROGRESS AND CANCELLATION ############################## #
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobControl:
+
+    def __init__(self, progress_callback=None, partial_callback=None):
+
+        self.progress_callback = progress_callback  # called with the completed fraction
+        self.partial_callback = partial_callback  # called with partial results as they become available
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def check(self):
+        if self._cancelled:
+            raise JobCancelled()
+
+    def report(self, fraction, partial=None):
+        self.check()
+        if self.progress_callback is not None:
+            self.progress_callback(fraction)
+        if partial is not None and self.partial_callback is not None:
+            self.partial_callback(partial)
+
+
+class StageControl(JobControl):
+
+    # one stage of a job, covering [start, end] of its progress. cancelling the job cancels the stage, and the
+    # stage's partial results are not passed on since they are not in the job's layout
+
+    def __init__(self, job_control, start, end):
+
+        super(StageControl, self).__init__(lambda fraction: job_control.report(start + (end - start) * fraction))
+        self.job_control = job_control
+
+    def cancel(self):
+        self.job_control.cancel()
+
+    def is_cancelled(self):
+        return self.job_control.is_cancelled()
+
+    def check(self):
+        self.job_control.check()
+
+
+def stage(control, start, end):
+    return None if control is None else StageControl(control, start, end)
+
+
+def check(control):
+    if control is not None:
+        control.check()
+
+
+def report(control, fraction, partial=None):
+    if control is not None:
+        control.report(fraction, partial)
+
+# ######################################################################################### #
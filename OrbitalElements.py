@@ -118,3 +118,102 @@ def from_cartesian(r, v, mu):
         nu = 2 * np.pi - nu
 
     return OrbitalElements(a, e, i, w, o, nu, mu)
+
+
+class OrbitalElementSet:
+
+    # many orbits as parallel arrays, one entry per orbit
+    __slots__ = ('_a', '_e', '_i', '_w', '_o', '_nu', 'mu')
+
+    def __init__(self, a, e, i, w, _o, _nu, mu):
+
+        self._a, self._e, self._i, self._w, self._o, self._nu = np.broadcast_arrays(
+            *[np.array(value, dtype=float, ndmin=1) for value in (a, e, i, w, _o, _nu)])
+        self.mu = mu
+
+    @staticmethod
+    def from_orbits(orbits):
+        orbits = list(orbits)
+        return OrbitalElementSet(*[[getattr(orbit, name)() for orbit in orbits]
+                                   for name in ('get_a', 'get_e', 'get_i', 'get_w', 'get_o', 'get_nu')],
+                                 orbits[0].mu)
+
+    def __len__(self):
+        return len(self._a)
+
+    def get_orbit(self, index):
+        return OrbitalElements(float(self._a[index]), float(self._e[index]), float(self._i[index]),
+                               float(self._w[index]), float(self._o[index]), float(self._nu[index]), self.mu)
+
+    def get_a(self):
+        return self._a
+
+    def get_e(self):
+        return self._e
+
+    def get_i(self):
+        return self._i
+
+    def get_w(self):
+        return self._w
+
+    def get_o(self):
+        return self._o
+
+    def get_nu(self):
+        return self._nu
+
+    def to_cartesian(self):
+        # (N, 3) positions and velocities. like get_cartesian, circular orbits ignore w and
+        # equatorial orbits ignore the RAAN
+        p = self._a * (1 - self._e ** 2)
+        r_scalar = p / (1 + self._e * np.cos(self._nu))
+        v_scalar = np.sqrt(self.mu / p)
+        r_perifocal = np.stack((r_scalar * np.cos(self._nu), r_scalar * np.sin(self._nu), np.zeros(len(self))), axis=1)
+        v_perifocal = np.stack((-v_scalar * np.sin(self._nu), v_scalar * (self._e + np.cos(self._nu)),
+                                np.zeros(len(self))), axis=1)
+
+        w = np.where(self._e == 0, 0.0, self._w)
+        o = np.where(self._i == 0, 0.0, self._o)
+        r_313_transform = np.matmul(Transformation.t_3_array(-o),
+                                    np.matmul(Transformation.t_1_array(-self._i), Transformation.t_3_array(-w)))
+        return np.einsum('nij,nj->ni', r_313_transform, r_perifocal), \
+            np.einsum('nij,nj->ni', r_313_transform, v_perifocal)
+
+
+def from_cartesian_set(r, v, mu, tolerance=1e-11):
+    # from_cartesian for (N, 3) positions and velocities. orbits with e or sin(i) below tolerance take
+    # the conventions of to_cartesian: w = 0 for circular orbits, measuring nu from the line of nodes,
+    # and RAAN = 0 for equatorial orbits, measuring w (or nu when also circular) from the x axis
+    r = np.atleast_2d(np.asarray(r, dtype=float))
+    v = np.atleast_2d(np.asarray(v, dtype=float))
+    r_norm = np.linalg.norm(r, axis=1)
+
+    a = - mu / (2 * (np.sum(v * v, axis=1) / 2 - mu / r_norm))
+    h = np.cross(r, v)
+    h_norm = np.linalg.norm(h, axis=1)
+    n = np.stack((-h[:, 1], h[:, 0], np.zeros(len(h))), axis=1)  # z cross h
+    n_norm = np.linalg.norm(n, axis=1)
+    e_vec = np.cross(v, h) / mu - r / r_norm[:, np.newaxis]
+    e = np.linalg.norm(e_vec, axis=1)
+    i = np.arccos(np.clip(h[:, 2] / h_norm, -1.0, 1.0))
+
+    circular = e < tolerance
+    equatorial = n_norm < tolerance * h_norm
+    safe_n = np.where(equatorial, 1.0, n_norm)[:, np.newaxis]
+    safe_e = np.where(circular, 1.0, e)[:, np.newaxis]
+    # in-plane reference direction: the line of nodes, or the x axis for equatorial orbits
+    node = np.where(equatorial[:, np.newaxis], [1.0, 0.0, 0.0], n / safe_n)
+    h_hat = h / h_norm[:, np.newaxis]
+
+    def angle_from(reference, vector):
+        # angle from reference to vector, positive about the angular momentum, in [0, 2 pi)
+        return np.arctan2(np.sum(h_hat * np.cross(reference, vector), axis=1),
+                          np.sum(reference * vector, axis=1)) % (2 * np.pi)
+
+    o = np.where(equatorial, 0.0, np.arctan2(n[:, 1], n[:, 0]) % (2 * np.pi))
+    w = np.where(circular, 0.0, angle_from(node, e_vec / safe_e))
+    periapse = np.where(circular[:, np.newaxis], node, e_vec / safe_e)
+    nu = angle_from(periapse, r / r_norm[:, np.newaxis])
+
+    return OrbitalElementSet(a, e, i, w, o, nu, mu)
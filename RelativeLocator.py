@@ -1,16 +1,41 @@
 import OrbitalElements
-import J2RelativeMotion
+import Trajectory
+import TrajectoryStore
 import GraphWidgets
+import Decimation
 import numpy as np
 from PyQt5.QtWidgets import QMainWindow, QApplication, QPushButton, QWidget, QAction, \
     QTabWidget, QVBoxLayout, QLineEdit, QHBoxLayout, QLabel, QGridLayout, QFrame, QComboBox, \
-    QTableWidget, QTableWidgetItem
+    QTableWidget, QTableWidgetItem, QFileDialog
 from PyQt5.QtCore import pyqtSlot, Qt
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 
 # ############################## RELATIVE TRAJECTORY GENERATOR ############################## #
 
+def compute_trajectory(state, end_seconds, reference_orbit, thresh_min, thresh_max, step=1.0, control=None,
+                       method='analytic'):
+    # propagation and derived views, safe to run off the GUI thread.
+    # a fixed step keeps longer horizons on the same grid, so cached trajectories can be extended
+    times = np.arange(int(end_seconds / step) + 1) * step
+    trajectory = Trajectory.Trajectory(state, reference_orbit, times, step, thresh_min, thresh_max, method=method)
+    for derive in (trajectory.get_regions, trajectory.get_pass_times, trajectory.get_propagation_error):
+        if control is not None:
+            control.check()
+        derive()
+    return trajectory
+
+
+store_window_samples = 2 ** 20  # samples of a trajectory store shown at once
+
+
+def propagation_text(trajectory):
+    if trajectory.method == 'analytic':
+        return "Propagation: analytic (exact)"
+    return "Propagation: " + trajectory.method + ", max. position error " + \
+           "%.2g" % trajectory.get_propagation_error() + " m"
+
+
 class RelativeLocator(QWidget):
 
     def __init__(self):
@@ -34,10 +59,12 @@ class RelativeLocator(QWidget):
         self.display_pass_times.setLayout(self.display_pass_times_layout)
 
         # set column count
-        self.display_pass_times_table.setColumnCount(2)
-        self.display_pass_times_table.setVerticalHeaderLabels(["Pass Number", "Pass Duration"])
-        self.display_pass_times_table.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
-        self.display_pass_times_table.horizontalHeader().setSectionResizeMode(1, QtWidgets.QHeaderView.Stretch)
+        self.display_pass_times_table.setColumnCount(4)
+        self.display_pass_times_table.setHorizontalHeaderLabels(["Pass Number", "Start (s)", "End (s)",
+                                                                 "Pass Duration (s)"])
+        for column in range(4):
+            self.display_pass_times_table.horizontalHeader().setSectionResizeMode(column,
+                                                                                  QtWidgets.QHeaderView.Stretch)
 
         self.layout.addWidget(self.plot_regions)
         self.layout.addWidget(self.plot_trajectory)
@@ -59,11 +86,16 @@ class RelativeLocator(QWidget):
         self.display_pass_times_button.clicked.connect(self.when_display_pass_times_button_clicked)
         self.display_magnitude_button = QPushButton("show distance magnitude")
         self.display_magnitude_button.clicked.connect(self.when_plot_magnitude_button_clicked)
+        self.open_store_button = QPushButton("open trajectory store")
+        self.open_store_button.clicked.connect(self.when_open_store_button_clicked)
 
         self.bottom_layout.addWidget(self.plot_regions_button)
         self.bottom_layout.addWidget(self.plot_trajectory_button)
         self.bottom_layout.addWidget(self.display_pass_times_button)
         self.bottom_layout.addWidget(self.display_magnitude_button)
+        self.bottom_layout.addWidget(self.open_store_button)
+        self.propagation_label = QLabel("")
+        self.bottom_layout.addWidget(self.propagation_label)
 
         self.enter_trajectory = QLineEdit("")  # enter in format "0.0, 0.0, 0.0, 0.0, 0.0, 0.0"
 
@@ -75,9 +107,11 @@ class RelativeLocator(QWidget):
         self.thresh_max = 10
         self.state = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
         self.end_seconds = 20000
-        self.resolution = self.end_seconds
-        self.times = np.linspace(0.0, self.end_seconds, int(self.resolution))
-        self.trajectory = [[], [], []]
+        self.step = 1.0
+        self.method = 'analytic'  # one of J2RelativeMotion.fidelity_presets
+        self.resolution = int(self.end_seconds / self.step) + 1
+        self.times = np.arange(self.resolution) * self.step
+        self.trajectory = None
         self.reference_orbit = None
 
     def when_display_pass_times_switch_button_clicked(self):
@@ -112,54 +146,73 @@ class RelativeLocator(QWidget):
         self.display_pass_times.hide()
         self.plot_trajectory_magnitude.show()
 
+    def when_open_store_button_clicked(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Open trajectory store", "", "Trajectory stores (*.trj)")
+        if path:
+            self.show_store_window(TrajectoryStore.TrajectoryStore(path))
+
+    def show_store_window(self, store, start_time=None):
+        # only the window is read from the mapped file, however long the stored run is
+        first, _ = store.sample_range(start_time)
+        end_time = store.get_time(min(first + store_window_samples, len(store)) - 1)
+        self.step = store.get_step()
+        self.show_trajectory(store.get_trajectory(start_time, end_time), end_time)
+
     def specify_trajectory(self, state, end_seconds, reference_orbit, thresh_min, thresh_max):
-        self.reference_orbit = reference_orbit
-        self.state = state
-        self.thresh_min = thresh_min
-        self.thresh_max = thresh_max
+        self.show_trajectory(compute_trajectory(state, end_seconds, reference_orbit, thresh_min, thresh_max,
+                                                self.step, method=self.method),
+                             end_seconds)
+
+    def show_trajectory(self, trajectory, end_seconds):
+        self.trajectory = trajectory
+        self.reference_orbit = trajectory.reference_orbit
+        self.state = trajectory.state
+        self.thresh_min = trajectory.thresh_min
+        self.thresh_max = trajectory.thresh_max
         self.end_seconds = end_seconds
-        self.resolution = self.end_seconds
-        self.times = np.linspace(0.0, self.end_seconds, int(self.resolution))
+        self.times = trajectory.get_t()
+        self.resolution = len(self.times)
+        self.propagation_label.setText(propagation_text(trajectory))
         self.populate_region_graph()
         self.populate_trajectory_graph()
         self.populate_time_graph()
         self.populate_magnitude_graph()
 
     def populate_region_graph(self):
-        t_in, data_in, t_out, data_out = J2RelativeMotion.j2_sedwick_propagator(self.state, self.reference_orbit,
-                                                                                self.times,
-                                                                                self.times[1] - self.times[0],
-                                                                                2, self.thresh_min, self.thresh_max, False)
+        t_in, data_in, t_out, data_out = self.trajectory.get_regions()
         data = [data_in, data_out]
         self.plot_regions.update_scatter(data,
                                     "Relative Motion for " + str(self.end_seconds) + " seconds | Trajectory: " + str(self.state),
                                     ["Within Range", "Out of Range"],
-                                    ["Radial (m)", "In-Track (m)", "Cross-Track (m)"])
+                                    ["Radial (m)", "In-Track (m)", "Cross-Track (m)"],
+                                    [Decimation.gap_indices(t_in), Decimation.gap_indices(t_out)])
 
     def populate_trajectory_graph(self):
 
         print(self.state)
 
-        trajectory = J2RelativeMotion.j2_sedwick_propagator(self.state, self.reference_orbit,
-                                                            self.times, self.times[1] - self.times[0],
-                                                            0, self.thresh_min, self.thresh_max, False)
+        trajectory = self.trajectory.get_positions()
+
+        # the magnitudes skip the initial state, hence the shift
+        transitions = Decimation.transition_indices(self.trajectory.get_in_range()) + 1
 
         self.plot_trajectory.update_graph([trajectory, ],
                                   "Relative Motion for " + str(self.end_seconds) + " seconds | Trajectory: " + str(self.state),
-                                  ["Radial (m)", "In-Track (m)", "Cross-Track (m)"])
+                                  ["Radial (m)", "In-Track (m)", "Cross-Track (m)"], [transitions])
 
     def populate_time_graph(self):
 
-        times = J2RelativeMotion.j2_sedwick_propagator(self.state, self.reference_orbit,
-                                                       self.times, self.times[1] - self.times[0],
-                                                       3, self.thresh_min, self.thresh_max, False)
+        starts, ends = self.trajectory.get_pass_times()
+        times = ends - starts
 
         # set row count
         self.display_pass_times_table.setRowCount(len(times))
 
         for i in range(len(times)):
-            self.display_pass_times_table.setItem(i, 1, QTableWidgetItem(str(times[i])))
             self.display_pass_times_table.setItem(i, 0, QTableWidgetItem(str(i)))
+            self.display_pass_times_table.setItem(i, 1, QTableWidgetItem("%.3f" % starts[i]))
+            self.display_pass_times_table.setItem(i, 2, QTableWidgetItem("%.3f" % ends[i]))
+            self.display_pass_times_table.setItem(i, 3, QTableWidgetItem("%.3f" % times[i]))
 
         self.display_pass_times_graph.update_graph([times, ],
                                     "Opportunities for " + str(self.end_seconds)[:8] + " seconds | Trajectory: " +
@@ -169,14 +222,13 @@ class RelativeLocator(QWidget):
                                     ["Pass Number", "Amount of Time (s)"])
 
     def populate_magnitude_graph(self):
-        magnitudes = J2RelativeMotion.j2_sedwick_propagator(self.state, self.reference_orbit,
-                                                       self.times, self.times[1] - self.times[0],
-                                                       4, self.thresh_min, self.thresh_max, False)
+        magnitudes = self.trajectory.get_magnitudes()
 
         self.plot_trajectory_magnitude.update_graph([magnitudes, ],
                                     "Distance Magnitude for " + str(self.end_seconds)[:8] + " seconds | Trajectory: " +
                                     str(self.state[0])[:7] + ", " + str(self.state[1])[:7] + ", " +
                                     str(self.state[2])[:7] + ", " + str(self.state[3])[:7] + ", " +
                                     str(self.state[4])[:7] + ", " + str(self.state[5])[:7] + ", ",
-                                    ["Time (s)", "Distance (m)"])
+                                    ["Time (s)", "Distance (m)"],
+                                    [Decimation.transition_indices(self.trajectory.get_in_range())])
 
@@ -0,0 +1,152 @@
+import itertools
+import numpy as np
+import DragRelativeMotion
+import HeatMapEngine
+import Instrumentation
+
+samplers = ("sobol", "lhs")
+axis_names = ["Radial Position", "In-Track Position", "Cross-Track Position",
+              "Radial Velocity", "In-Track Velocity", "Cross-Track Velocity"]
+
+
+# ############################## SPACE-FILLING SENSITIVITY SWEEP ############################## #
+
+def sample_unit(dimensions, samples, sampler="sobol", seed=0):
+    # (samples, dimensions) points of a scrambled Sobol sequence or a Latin hypercube in [0, 1)
+    from scipy.stats import qmc  # scipy is slow to import and only needed here
+    if sampler == "sobol":
+        # balanced only in powers of two, so the sample count is rounded up
+        return qmc.Sobol(dimensions, scramble=True, seed=seed).random_base2(int(np.ceil(np.log2(max(2, samples)))))
+    if sampler == "lhs":
+        return qmc.LatinHypercube(dimensions, seed=seed).random(samples)
+    raise ValueError("unknown sampler: " + str(sampler))
+
+
+def sweep_states(mean_state, dispersions, axes, unit):
+    # mean_state with every swept component spread over mean +/- dispersion, the heatmap axis bounds
+    states = np.tile(np.asarray(mean_state[:6], dtype=float), (len(unit), 1))
+    for column, axis in enumerate(axes):
+        states[:, axis] += dispersions[axis] * (2 * unit[:, column] - 1)
+    return states
+
+
+def main_effect_bins(samples):
+    return int(np.clip(np.sqrt(samples) / 2, 2, 64))
+
+
+def marginal_bins(samples):
+    # about eight samples per cell of a 2-D marginal
+    return int(np.clip(np.sqrt(samples / 8), 2, 64))
+
+
+def main_effect_index(unit_column, values, bins, bias_correction=True):
+    # share of the variance of values explained by one input alone (first-order index), estimated from the
+    # bin means along that input. with bias_correction (epsilon-squared) the spread the other inputs add to the
+    # bin means of a random design is removed; a Sobol design balances them within each bin already
+    cells = np.minimum((unit_column * bins).astype(int), bins - 1)
+    counts = np.bincount(cells, minlength=bins)
+    means = np.bincount(cells, weights=values, minlength=bins) / np.maximum(counts, 1)
+    between = float(np.sum(counts * (means - np.mean(values)) ** 2))
+    within = float(np.sum((values - means[cells]) ** 2))
+    occupied = int(np.count_nonzero(counts))
+    if between + within == 0 or len(values) <= occupied:
+        return 0.0
+    if bias_correction:
+        between -= (occupied - 1) * within / (len(values) - occupied)
+    return float(np.clip(between / (between + within), 0.0, 1.0))
+
+
+def marginal_grid(unit_x, unit_y, values, bins):
+    # mean of values over the samples falling in each of bins x bins cells, x major like the heatmap.
+    # cells without samples are NaN
+    cells_x = np.minimum((unit_x * bins).astype(int), bins - 1)
+    cells_y = np.minimum((unit_y * bins).astype(int), bins - 1)
+    cells = cells_x * bins + cells_y
+    counts = np.bincount(cells, minlength=bins * bins)
+    sums = np.bincount(cells, weights=values, minlength=bins * bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums / counts).reshape(bins, bins)
+
+
+class SensitivityResult:
+
+    def __init__(self, mean_state, dispersions, axes, unit, states, success_level, sampler="sobol"):
+
+        self.mean_state = list(mean_state)
+        self.dispersions = list(dispersions)
+        self.sampler = sampler
+        self._axes = list(axes)
+        self._unit = unit
+        self._states = states
+        self._success_level = success_level
+        self._indices = None
+
+    def __len__(self):
+        return len(self._states)
+
+    def get_axes(self):
+        return self._axes
+
+    def get_states(self):
+        return self._states
+
+    def get_success_level(self):
+        return self._success_level
+
+    def get_indices(self, bins=None):
+        # first-order sensitivity index of every swept axis, in the order of get_axes
+        if bins is not None:
+            return [main_effect_index(self._unit[:, column], self._success_level, bins, self.sampler != "sobol")
+                    for column in range(len(self._axes))]
+        if self._indices is None:
+            self._indices = self.get_indices(main_effect_bins(len(self)))
+        return self._indices
+
+    def get_ranking(self):
+        # swept axes from the most to the least influential
+        indices = self.get_indices()
+        return [self._axes[column] for column in np.argsort(indices, kind='stable')[::-1]]
+
+    def get_pairs(self):
+        # every pair of swept axes, the pair with the largest combined index first
+        index = dict(zip(self._axes, self.get_indices()))
+        return sorted(itertools.combinations(self._axes, 2), key=lambda pair: -(index[pair[0]] + index[pair[1]]))
+
+    def get_marginal(self, x_axis, y_axis, bins=None):
+        # (x_values, y_values, success_level) averaged over the other swept axes, in the layout heat_map_xy returns
+        if bins is None:
+            bins = marginal_bins(len(self))
+        values = []
+        for axis in (x_axis, y_axis):
+            centres = (np.arange(bins) + 0.5) / bins
+            values.append(self.mean_state[axis] + self.dispersions[axis] * (2 * centres - 1))
+        grid = marginal_grid(self._unit[:, self._axes.index(x_axis)], self._unit[:, self._axes.index(y_axis)],
+                             self._success_level, bins)
+        return values[0], values[1], grid
+
+    def get_summary(self):
+        return {"samples": len(self), "sampler": self.sampler, "axes": self._axes,
+                "axis_names": [axis_names[axis] for axis in self._axes],
+                "indices": self.get_indices(), "ranking": self.get_ranking(),
+                "mean_success_level": float(np.mean(self._success_level)),
+                "std_success_level": float(np.std(self._success_level))}
+
+
+def sensitivity_sweep(mean_state, dispersions, axes, reference_orbit, end_seconds, recorded_times, thresh_min,
+                      thresh_max, samples=1024, sampler="sobol", seed=0, workers=1, control=None, model="j2",
+                      drag_alpha=DragRelativeMotion.default_alpha):
+    # success level (% of samples within the thresholds, as in the heatmap) over a space-filling design of the
+    # swept axes, evaluated in parallel by the heatmap engine
+    axes = sorted(set(int(axis) for axis in axes))
+    if not axes or axes[0] < 0 or axes[-1] > 5:
+        raise ValueError("sweep axes must be a non-empty subset of 0 .. 5")
+    with Instrumentation.phase("setup"):
+        unit = sample_unit(len(axes), samples, sampler, seed)
+        states = sweep_states(mean_state, dispersions, axes, unit)
+        times = np.linspace(0.0, end_seconds, recorded_times)
+    success_level = HeatMapEngine.success_level_states(states, reference_orbit, times, times[1] - times[0],
+                                                       thresh_min, thresh_max, workers, None, control, None, model,
+                                                       drag_alpha)
+    return SensitivityResult(mean_state, dispersions, axes, unit, states, success_level, sampler)
+
+# ############################################################################################ #
@@ -1,16 +1,21 @@
+import time
+startup_begin = time.perf_counter()
+
+import os
 import sys
 import numpy as np
 from PyQt5.QtWidgets import QMainWindow, QApplication, QPushButton, QWidget, QAction, \
-    QTabWidget, QVBoxLayout, QLineEdit, QHBoxLayout, QLabel, QGridLayout, QFrame, QComboBox
+    QTabWidget, QVBoxLayout, QLineEdit, QHBoxLayout, QLabel, QGridLayout, QFrame, QComboBox, QProgressBar, \
+    QCheckBox
 from PyQt5.QtGui import QIcon, QFont
 from PyQt5.QtCore import pyqtSlot, Qt
 from PyQt5 import QtGui
 import OrbitalElements
-import HeatMap
-import RelativeLocator
-import GraphWidgets
 import random
-import Targeter
+import Workers
+import Instrumentation
+
+# HeatMap, RelativeLocator, Targeter and Dispersion pull in matplotlib, so they are imported when their tab is first built
 
 
 class App(QMainWindow):
@@ -28,7 +33,14 @@ class App(QMainWindow):
         self.table_widget = StarMapGUI(self)
         self.setCentralWidget(self.table_widget)
 
+        self.statusBar().addWidget(self.table_widget.job_status, 1)
+        self.statusBar().addPermanentWidget(self.table_widget.job_progress)
+        self.statusBar().addPermanentWidget(self.table_widget.cancel_job_button)
+        self.statusBar().addPermanentWidget(self.table_widget.instrument_jobs)
+
         self.show()
+        self.startup_seconds = time.perf_counter() - startup_begin
+        self.table_widget.job_status.setText("Ready (started in " + str(round(self.startup_seconds, 2)) + " s)")
 
 
 class StarMapGUI(QWidget):
@@ -41,19 +53,17 @@ class StarMapGUI(QWidget):
         self.tabs = QTabWidget()
         # Initial Conditions Tab
         self.ic_tab = QWidget()
-        # HeatMap Tab
-        self.heatmap_tab = HeatMap.HeatMap()
-        self.select_heatmap_trajectory_button = QPushButton("Send to Relative Trajectory Tab")
-        self.heatmap_tab.bottom_layout.addWidget(self.select_heatmap_trajectory_button)
-        self.select_heatmap_trajectory_button.clicked.connect(self.when_heatmap_to_relloc_button_clicked)
-
-        self.target_tab = Targeter.Targeter()
-        self.select_targeted_trajectory_button = QPushButton("Send to Relative Trajectory Tab")
-        self.target_tab.bottom_layout.addWidget(self.select_targeted_trajectory_button)
-        self.select_targeted_trajectory_button.clicked.connect(self.when_targeted_trajectory_to_relloc_button_clicked)
-
-        # Relative Location Tab
-        self.relloc_tab = RelativeLocator.RelativeLocator()
+        # HeatMap, Targeter, Relative Location and Dispersion tabs are built on first use, see get_tab
+        self.tab_containers = {}
+        self.built_tabs = {}
+        self.tab_builders = {1: self.build_heatmap_tab, 2: self.build_target_tab, 3: self.build_relloc_tab,
+                             4: self.build_dispersion_tab}
+        for index in self.tab_builders:
+            container = QWidget()
+            container_layout = QVBoxLayout(container)
+            container_layout.setContentsMargins(0, 0, 0, 0)
+            self.tab_containers[index] = container
+        self.tabs.currentChanged.connect(self.get_tab)
         # Size tabs
         self.tabs.resize(600, 400)
 
@@ -93,8 +103,18 @@ class StarMapGUI(QWidget):
         self.values_record = QLineEdit("1000")
 
         self.resolution = QLineEdit("3")
+        self.worker_count = QLineEdit(str(os.cpu_count()))
         self.heatmap_drop_down_menu_x_axis = QComboBox(self)
         self.heatmap_drop_down_menu_y_axis = QComboBox(self)
+        self.heatmap_sampling_menu = QComboBox(self)
+        self.heatmap_model_menu = QComboBox(self)
+        self.drag_alpha = QLineEdit("0.2")
+        self.dispersion_samples = QLineEdit("10000")
+        self.dispersion_distribution_menu = QComboBox(self)
+        self.sweep_axes = QLineEdit("0, 1, 2, 3, 4, 5")  # state components swept, 0-2 position, 3-5 velocity
+        self.sweep_samples = QLineEdit("1024")
+        self.sweep_sampling_menu = QComboBox(self)
+        self.fidelity_menu = QComboBox(self)  # J2RelativeMotion.fidelity_presets, in order
 
         self.heatmap_x_axis = 3
         self.heatmap_y_axis = 4
@@ -104,9 +124,10 @@ class StarMapGUI(QWidget):
 
         # Add tabs
         self.tabs.addTab(self.ic_tab, "Initial Conditions")
-        self.tabs.addTab(self.heatmap_tab, "Initial State HeatMap")
-        self.tabs.addTab(self.target_tab, "Targeted Trajectory")
-        self.tabs.addTab(self.relloc_tab, "Relative Trajectory")
+        self.tabs.addTab(self.tab_containers[1], "Initial State HeatMap")
+        self.tabs.addTab(self.tab_containers[2], "Targeted Trajectory")
+        self.tabs.addTab(self.tab_containers[3], "Relative Trajectory")
+        self.tabs.addTab(self.tab_containers[4], "Dispersion Analysis")
 
         self.start_button_heatmap = QPushButton("Get HeatMap From Entered Conditions")
         self.start_button_heatmap.clicked.connect(self.when_start_button_heatmap_clicked)
@@ -117,6 +138,25 @@ class StarMapGUI(QWidget):
         self.select_target_trajectory_button = QPushButton("Target a Trajectory From Entered Conditions")
         self.select_target_trajectory_button.clicked.connect(self.when_start_button_target_clicked)
 
+        self.start_button_dispersion = QPushButton("Run Dispersion Analysis From Entered Conditions")
+        self.start_button_dispersion.clicked.connect(self.when_start_button_dispersion_clicked)
+
+        self.start_button_sensitivity = QPushButton("Run Sensitivity Sweep From Entered Conditions")
+        self.start_button_sensitivity.clicked.connect(self.when_start_button_sensitivity_clicked)
+
+        # Background job status, shown in the main window's status bar
+        self.job = None
+        self.job_status = QLabel("Ready")
+        self.job_progress = QProgressBar()
+        self.job_progress.setRange(0, 100)
+        self.job_progress.hide()
+        self.cancel_job_button = QPushButton("Cancel")
+        self.cancel_job_button.clicked.connect(self.when_cancel_job_button_clicked)
+        self.cancel_job_button.hide()
+        self.instrument_jobs = QCheckBox("Instrument jobs")
+        self.instrument_jobs.toggled.connect(self.when_instrument_jobs_toggled)
+        self.last_job_counters = None  # Instrumentation.JobCounters of the last instrumented job
+
         # Add tabs to widget
         self.layout.addWidget(self.tabs)
         self.setLayout(self.layout)
@@ -135,9 +175,60 @@ class StarMapGUI(QWidget):
         total_layout.addWidget(self.start_button_heatmap)
         total_layout.addWidget(self.select_relloc_trajectory_button)
         total_layout.addWidget(self.select_target_trajectory_button)
+        total_layout.addWidget(self.start_button_dispersion)
+        total_layout.addWidget(self.start_button_sensitivity)
 
         self.ic_tab.setLayout(total_layout)
 
+    def get_tab(self, index):
+        if index not in self.tab_builders:
+            return None
+        if index not in self.built_tabs:
+            tab = self.tab_builders[index]()
+            self.tab_containers[index].layout().addWidget(tab)
+            self.built_tabs[index] = tab
+        return self.built_tabs[index]
+
+    @property
+    def heatmap_tab(self):
+        return self.get_tab(1)
+
+    @property
+    def target_tab(self):
+        return self.get_tab(2)
+
+    @property
+    def relloc_tab(self):
+        return self.get_tab(3)
+
+    @property
+    def dispersion_tab(self):
+        return self.get_tab(4)
+
+    def build_heatmap_tab(self):
+        import HeatMap
+        heatmap_tab = HeatMap.HeatMap()
+        self.select_heatmap_trajectory_button = QPushButton("Send to Relative Trajectory Tab")
+        heatmap_tab.bottom_layout.addWidget(self.select_heatmap_trajectory_button)
+        self.select_heatmap_trajectory_button.clicked.connect(self.when_heatmap_to_relloc_button_clicked)
+        return heatmap_tab
+
+    def build_target_tab(self):
+        import Targeter
+        target_tab = Targeter.Targeter()
+        self.select_targeted_trajectory_button = QPushButton("Send to Relative Trajectory Tab")
+        target_tab.bottom_layout.addWidget(self.select_targeted_trajectory_button)
+        self.select_targeted_trajectory_button.clicked.connect(self.when_targeted_trajectory_to_relloc_button_clicked)
+        return target_tab
+
+    def build_relloc_tab(self):
+        import RelativeLocator
+        return RelativeLocator.RelativeLocator()
+
+    def build_dispersion_tab(self):
+        import Dispersion
+        return Dispersion.Dispersion()
+
     def get_app_title_message(self):
         # title_string = ['<b> im gonna FREAK IT </b>', '<b> first... i park my car </b>',
         #                 '<b> im going FERAL </b>', '<b> me when I get you </b>', '<b> ;) </b>',
@@ -239,15 +330,53 @@ class StarMapGUI(QWidget):
         ic_layout.addWidget(QLabel("Heat Map Resolution"), 14, 0)
         ic_layout.addWidget(self.resolution, 14, 1)
 
-        ic_layout.addWidget(QLabel("<b>Targeted</b>"), 15, 2)
-        ic_layout.addWidget(QLabel("<b>State</b>"), 15, 3)
+        ic_layout.addWidget(QLabel("Worker processes"), 14, 3)
+        ic_layout.addWidget(self.worker_count, 14, 4)
+
+        ic_layout.addWidget(QLabel("Heat Map Sampling"), 15, 0)
+        self.heatmap_sampling_menu.addItems(["Uniform Grid", "Adaptive Refinement"])
+        ic_layout.addWidget(self.heatmap_sampling_menu, 15, 1)
+
+        ic_layout.addWidget(QLabel("Heat Map Model"), 15, 3)
+        self.heatmap_model_menu.addItems(["J2 (Sedwick)", "Drag (Carter-Humi)"])
+        ic_layout.addWidget(self.heatmap_model_menu, 15, 4)
 
-        ic_layout.addWidget(self.targeted_x, 16, 0)
-        ic_layout.addWidget(self.targeted_y, 16, 1)
-        ic_layout.addWidget(self.targeted_z, 16, 2)
-        ic_layout.addWidget(self.targeted_xd, 16, 3)
-        ic_layout.addWidget(self.targeted_yd, 16, 4)
-        ic_layout.addWidget(self.targeted_zd, 16, 5)
+        ic_layout.addWidget(QLabel("Trajectory Fidelity"), 16, 0)
+        self.fidelity_menu.addItems(["Analytic (exact)", "Screening", "Standard", "Precise"])
+        ic_layout.addWidget(self.fidelity_menu, 16, 1)
+
+        ic_layout.addWidget(QLabel("Drag Parameter (alpha)"), 16, 3)
+        ic_layout.addWidget(self.drag_alpha, 16, 4)
+
+        ic_layout.addWidget(QLabel("<b>Dispersion</b>"), 17, 2)
+        ic_layout.addWidget(QLabel("<b>Properties</b>"), 17, 3)
+
+        ic_layout.addWidget(QLabel("Monte Carlo Samples"), 18, 0)
+        ic_layout.addWidget(self.dispersion_samples, 18, 1)
+
+        ic_layout.addWidget(QLabel("Sampling Distribution"), 18, 3)
+        self.dispersion_distribution_menu.addItems(["Uniform within +/-", "Normal, +/- as 3 sigma"])
+        ic_layout.addWidget(self.dispersion_distribution_menu, 18, 4)
+
+        ic_layout.addWidget(QLabel("Sweep Axes (0-5)"), 19, 0)
+        ic_layout.addWidget(self.sweep_axes, 19, 1)
+
+        ic_layout.addWidget(QLabel("Sweep Samples"), 19, 3)
+        ic_layout.addWidget(self.sweep_samples, 19, 4)
+
+        ic_layout.addWidget(QLabel("Sweep Sampling"), 20, 0)
+        self.sweep_sampling_menu.addItems(["Sobol", "Latin Hypercube"])
+        ic_layout.addWidget(self.sweep_sampling_menu, 20, 1)
+
+        ic_layout.addWidget(QLabel("<b>Targeted</b>"), 21, 2)
+        ic_layout.addWidget(QLabel("<b>State</b>"), 21, 3)
+
+        ic_layout.addWidget(self.targeted_x, 22, 0)
+        ic_layout.addWidget(self.targeted_y, 22, 1)
+        ic_layout.addWidget(self.targeted_z, 22, 2)
+        ic_layout.addWidget(self.targeted_xd, 22, 3)
+        ic_layout.addWidget(self.targeted_yd, 22, 4)
+        ic_layout.addWidget(self.targeted_zd, 22, 5)
 
         self.reforbit_frame.setLayout(ic_layout)
 
@@ -312,46 +441,165 @@ class StarMapGUI(QWidget):
 
         end_seconds = int(self.propagation_time.text())
         recorded_times = int(self.values_record.text())
-        self.heatmap_tab.num_axis_points = int(self.resolution.text())
         return mean_state, variances, end_seconds, recorded_times
 
+    def start_job(self, description, job, when_finished, when_partial=None):
+        # run job(control) on a background thread and hand its result to when_finished on the GUI thread
+        if self.job is not None:
+            self.job_status.setText("Busy: " + self.job_description + " is still running")
+            return
+        self.job = Workers.BackgroundJob(job, self)
+        self.job_description = description
+        self.job.progress.connect(lambda fraction: self.job_progress.setValue(int(fraction * 100)))
+        if when_partial is not None:
+            self.job.partial.connect(lambda partial: self.render(when_partial, partial))
+        self.job.finished.connect(lambda result: self.render(when_finished, result))
+        self.job.finished.connect(lambda result: self.job_status.setText(description + " finished"))
+        self.job.failed.connect(lambda message: self.job_status.setText(description + " failed: " + message))
+        self.job.cancelled.connect(lambda: self.job_status.setText(description + " cancelled"))
+        self.job.done.connect(self.when_job_done)
+
+        self.job_status.setText(description + "...")
+        self.job_progress.setValue(0)
+        self.job_progress.show()
+        self.cancel_job_button.show()
+        if Instrumentation.enabled:
+            Instrumentation.start()
+        self.job.start()
+
+    def render(self, show, result):
+        with Instrumentation.phase("render"):
+            show(result)
+
+    def when_job_done(self):
+        self.job = None
+        self.job_progress.hide()
+        self.cancel_job_button.hide()
+        counters = Instrumentation.stop()
+        if counters is not None:
+            self.last_job_counters = counters
+            self.job_status.setText(self.job_status.text() + " | " + counters.format())
+
+    @pyqtSlot(bool)
+    def when_instrument_jobs_toggled(self, checked):
+        Instrumentation.enabled = checked
+
+    @pyqtSlot()
+    def when_cancel_job_button_clicked(self):
+        if self.job is not None:
+            self.job_status.setText("Cancelling " + self.job_description + "...")
+            self.job.cancel()
+
+    def start_trajectory_job(self, state, end_seconds):
+        thresh_min = self.minimum_distance_threshold_value
+        thresh_max = self.maximum_distance_threshold_value
+        reference_orbit = self.reference_orbit
+        step = self.relloc_tab.step
+        import J2RelativeMotion
+        import RelativeLocator
+        self.relloc_tab.method = J2RelativeMotion.fidelity_presets[self.fidelity_menu.currentIndex()]
+        method = self.relloc_tab.method
+        self.start_job("Relative trajectory",
+                       lambda control: RelativeLocator.compute_trajectory(state, end_seconds, reference_orbit,
+                                                                          thresh_min, thresh_max, step, control,
+                                                                          method),
+                       lambda trajectory: self.relloc_tab.show_trajectory(trajectory, end_seconds))
+
     @pyqtSlot()
     def when_start_relloc_button_clicked(self):
         mean_state, variances, end_seconds, recorded_times = self.get_initial_info()
-        self.relloc_tab.specify_trajectory(mean_state, end_seconds, self.reference_orbit,
-                                                        self.minimum_distance_threshold_value,
-                                                        self.maximum_distance_threshold_value)
+        self.start_trajectory_job(mean_state, end_seconds)
 
     @pyqtSlot()
     def when_start_button_heatmap_clicked(self):
         mean_state, variances, end_seconds, recorded_times = self.get_initial_info()
-        self.heatmap_tab.heat_map_xy(variances[self.heatmap_x_axis], variances[self.heatmap_y_axis], mean_state,
-                                     self.reference_orbit, end_seconds,
-                                     recorded_times, self.heatmap_x_axis, self.heatmap_y_axis,
-                                     self.minimum_distance_threshold_value, self.maximum_distance_threshold_value)
+        if self.job is not None:
+            self.job_status.setText("Busy: " + self.job_description + " is still running")
+            return
+        self.heatmap_tab.clear_sensitivity()
+        self.heatmap_tab.num_axis_points = int(self.resolution.text())
+        self.heatmap_tab.num_workers = max(1, int(self.worker_count.text()))
+        self.heatmap_tab.adaptive = self.heatmap_sampling_menu.currentIndex() == 1
+        self.heatmap_tab.model = ["j2", "drag"][self.heatmap_model_menu.currentIndex()]
+        self.heatmap_tab.drag_alpha = float(self.drag_alpha.text())
+        x_variance = variances[self.heatmap_x_axis]
+        y_variance = variances[self.heatmap_y_axis]
+        thresh_min = self.minimum_distance_threshold_value
+        thresh_max = self.maximum_distance_threshold_value
+        self.heatmap_tab.set_heat_map_parameters(mean_state, self.reference_orbit, end_seconds,
+                                                 self.heatmap_x_axis, self.heatmap_y_axis)
+        x_values, y_values = self.heatmap_tab.get_heat_map_axes(x_variance, y_variance)
+        self.start_job("Heat map",
+                       lambda control: self.heatmap_tab.compute_heat_map(x_variance, y_variance, recorded_times,
+                                                                         thresh_min, thresh_max, control),
+                       lambda result: self.heatmap_tab.show_heat_map(*result),
+                       lambda partial: self.heatmap_tab.show_partial_heat_map(x_values, y_values, partial))
 
     @pyqtSlot()
     def when_start_button_target_clicked(self):
         desired_trajectory = self.get_target()
         mean_state, variances, end_seconds, recorded_times = self.get_initial_info()
-        self.target_tab.specify_trajectory(mean_state, desired_trajectory, end_seconds, self.reference_orbit,
-                                           self.minimum_distance_threshold_value, self.maximum_distance_threshold_value)
+        if self.job is not None:
+            self.job_status.setText("Busy: " + self.job_description + " is still running")
+            return
+        self.target_tab.set_trajectory_parameters(mean_state, desired_trajectory, end_seconds, self.reference_orbit,
+                                                  self.minimum_distance_threshold_value,
+                                                  self.maximum_distance_threshold_value)
+        self.start_job("Targeting", self.target_tab.compute_targeted_trajectory,
+                       self.target_tab.show_targeted_trajectory)
+
+    @pyqtSlot()
+    def when_start_button_dispersion_clicked(self):
+        # the +/- fields are the 6-D dispersion; the heatmap model and worker settings apply here as well
+        mean_state, variances, end_seconds, recorded_times = self.get_initial_info()
+        if self.job is not None:
+            self.job_status.setText("Busy: " + self.job_description + " is still running")
+            return
+        self.dispersion_tab.samples = max(1, int(self.dispersion_samples.text()))
+        self.dispersion_tab.distribution = ["uniform", "normal"][self.dispersion_distribution_menu.currentIndex()]
+        self.dispersion_tab.num_workers = max(1, int(self.worker_count.text()))
+        self.dispersion_tab.model = ["j2", "drag"][self.heatmap_model_menu.currentIndex()]
+        self.dispersion_tab.drag_alpha = float(self.drag_alpha.text())
+        thresh_min = self.minimum_distance_threshold_value
+        thresh_max = self.maximum_distance_threshold_value
+        self.dispersion_tab.set_dispersion_parameters(mean_state, variances, self.reference_orbit, end_seconds)
+        self.start_job("Dispersion analysis",
+                       lambda control: self.dispersion_tab.compute_dispersion(recorded_times, thresh_min, thresh_max,
+                                                                              control),
+                       self.dispersion_tab.show_dispersion)
+
+    @pyqtSlot()
+    def when_start_button_sensitivity_clicked(self):
+        # space-filling sweep over the chosen axes within their +/- fields, marginals go to the heatmap tab
+        mean_state, variances, end_seconds, recorded_times = self.get_initial_info()
+        if self.job is not None:
+            self.job_status.setText("Busy: " + self.job_description + " is still running")
+            return
+        axes = [int(axis) for axis in self.sweep_axes.text().replace(",", " ").split()]
+        samples = max(2, int(self.sweep_samples.text()))
+        sampler = ["sobol", "lhs"][self.sweep_sampling_menu.currentIndex()]
+        workers = max(1, int(self.worker_count.text()))
+        model = ["j2", "drag"][self.heatmap_model_menu.currentIndex()]
+        drag_alpha = float(self.drag_alpha.text())
+        thresh_min = self.minimum_distance_threshold_value
+        thresh_max = self.maximum_distance_threshold_value
+        reference_orbit = self.reference_orbit
+        import SensitivityEngine
+        self.start_job("Sensitivity sweep",
+                       lambda control: SensitivityEngine.sensitivity_sweep(
+                           mean_state, variances, axes, reference_orbit, end_seconds, recorded_times, thresh_min,
+                           thresh_max, samples, sampler, 0, workers, control, model, drag_alpha),
+                       lambda result: self.heatmap_tab.show_sensitivity(result, reference_orbit, end_seconds))
 
     @pyqtSlot()
     def when_heatmap_to_relloc_button_clicked(self):
-        self.relloc_tab.specify_trajectory(self.heatmap_tab.current_trajectory,
-                                           self.heatmap_tab.end_seconds, self.reference_orbit,
-                                           self.minimum_distance_threshold_value,
-                                           self.maximum_distance_threshold_value)
+        self.start_trajectory_job(self.heatmap_tab.current_trajectory, self.heatmap_tab.end_seconds)
 
     @pyqtSlot()
     def when_targeted_trajectory_to_relloc_button_clicked(self):
         print(self.target_tab.targeted_state)
         self.get_initial_info()
-        self.relloc_tab.specify_trajectory(self.target_tab.targeted_state,
-                                           self.target_tab.end_seconds, self.reference_orbit,
-                                           self.minimum_distance_threshold_value,
-                                           self.maximum_distance_threshold_value)
+        self.start_trajectory_job(self.target_tab.targeted_state, self.target_tab.end_seconds)
 
 
 if __name__ == '__main__':
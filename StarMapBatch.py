@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import OrbitalElements
+import HeatMapEngine
+import J2RelativeMotion
+import StationKeeping
+import DispersionEngine
+import SensitivityEngine
+import Trajectory
+import TrajectoryStore
+import Instrumentation
+
+# same defaults as the initial conditions tab of the GUI
+default_parameters = {
+    "name": "case",
+    "reference_orbit": {"a": 6678136.6, "e": 0.0001, "i": 0.52},
+    "state": [0.1, 0.1, 0.01, -0.02, 0.0, 0.01],
+    "variances": [0.1, 0.1, 0.1, 0.1, 0.1, 0.1],
+    "target_state": [1.41421, 14.1421, 1.41421, 0.0, 0.0, 0.0],
+    "propagation_time": 10000,
+    "values_record": 1000,
+    "threshold_min": 0.0,
+    "threshold_max": 30.0,
+    "trajectory_step": 1.0,
+    # propagation of the trajectory, passes, stream and store modes, one of J2RelativeMotion.fidelity_presets
+    "fidelity": "analytic",
+    "store_path": None,  # where the store mode writes the trajectory, <output>/<name>.trj by default
+    "heatmap": {"x_axis": 3, "y_axis": 4, "resolution": 3, "workers": 1, "adaptive": False,
+                "max_evaluations": None, "model": "j2", "drag_alpha": 0.2},
+    # Monte Carlo over the "variances" dispersions, see DispersionEngine.sample_states
+    "dispersion": {"samples": 10000, "distribution": "uniform", "seed": 0, "workers": 1, "model": "j2",
+                   "drag_alpha": 0.2, "confidence": 0.95},
+    # space-filling sweep of the listed state components within their "variances" bounds
+    "sensitivity": {"axes": [0, 1, 2, 3, 4, 5], "samples": 1024, "sampler": "sobol", "seed": 0, "workers": 1,
+                    "model": "j2", "drag_alpha": 0.2},
+}
+
+
+# ############################## HEADLESS STARMAP RUNS ############################## #
+
+def load_parameters(path):
+    # a parameter file holds one case or a list of cases, each overriding default_parameters
+    with open(path) as parameter_file:
+        cases = json.load(parameter_file)
+    if isinstance(cases, dict):
+        cases = [cases]
+    return [complete_parameters(case, index) for index, case in enumerate(cases)]
+
+
+def complete_parameters(case, index=0):
+    parameters = dict(default_parameters)
+    parameters["name"] = "case_" + str(index)
+    parameters.update(case)
+    parameters["reference_orbit"] = dict(default_parameters["reference_orbit"], **case.get("reference_orbit", {}))
+    parameters["heatmap"] = dict(default_parameters["heatmap"], **case.get("heatmap", {}))
+    parameters["dispersion"] = dict(default_parameters["dispersion"], **case.get("dispersion", {}))
+    parameters["sensitivity"] = dict(default_parameters["sensitivity"], **case.get("sensitivity", {}))
+    return parameters
+
+
+def get_reference_orbit(parameters):
+    orbit = parameters["reference_orbit"]
+    return OrbitalElements.OrbitalElements(orbit["a"], orbit["e"], orbit["i"], 0.0, 0.0, 0.0,
+                                           J2RelativeMotion.mu)
+
+
+def run_heatmap(parameters, control=None):
+    heatmap = parameters["heatmap"]
+    x_axis = heatmap["x_axis"]
+    y_axis = heatmap["y_axis"]
+    x_values, y_values, success_level = HeatMapEngine.heat_map_xy(
+        parameters["variances"][x_axis], parameters["variances"][y_axis], parameters["state"],
+        get_reference_orbit(parameters), parameters["propagation_time"], parameters["values_record"],
+        x_axis, y_axis, parameters["threshold_min"], parameters["threshold_max"], heatmap["resolution"],
+        heatmap["workers"], heatmap["adaptive"], heatmap["max_evaluations"], control, heatmap["model"],
+        heatmap["drag_alpha"])
+    best_x, best_y = np.unravel_index(np.argmax(success_level), success_level.shape)
+    best_state = list(parameters["state"])
+    best_state[x_axis] = float(x_values[best_x])
+    best_state[y_axis] = float(y_values[best_y])
+    summary = {"best_state": best_state, "best_success_level": float(success_level[best_x, best_y])}
+    return summary, {"x_values": x_values, "y_values": y_values, "success_level": success_level}
+
+
+def propagate(parameters):
+    step = parameters["trajectory_step"]
+    times = np.arange(int(parameters["propagation_time"] / step) + 1) * step
+    return Trajectory.Trajectory(parameters["state"], get_reference_orbit(parameters), times, step,
+                                 parameters["threshold_min"], parameters["threshold_max"], cache=None,
+                                 method=parameters["fidelity"])
+
+
+def run_trajectory(parameters, control=None):
+    trajectory = propagate(parameters)
+    summary = {"samples": len(trajectory.get_t()), "samples_in_range": trajectory.get_success_count(),
+               "final_state": trajectory.get_states()[-1].tolist(),
+               "position_error": trajectory.get_propagation_error()}
+    return summary, {"t": trajectory.get_t(), "states": trajectory.get_states(),
+                     "magnitudes": trajectory.get_magnitudes()}
+
+
+def run_pass_times(parameters, control=None):
+    trajectory = propagate(parameters)
+    pass_lengths = trajectory.get_pass_lengths()
+    starts, ends = trajectory.get_pass_times()
+    summary = {"passes": len(starts), "time_in_range": trajectory.get_time_in_range(),
+               "pass_starts": starts.tolist(), "pass_ends": ends.tolist(), "pass_lengths": pass_lengths,
+               "position_error": trajectory.get_propagation_error()}
+    return summary, {"pass_lengths": np.asarray(pass_lengths, dtype=float), "pass_starts": starts, "pass_ends": ends}
+
+
+def run_stream(parameters, control=None):
+    # counts, passes and range statistics without holding the trajectory, for very long horizons
+    step = parameters["trajectory_step"]
+    reduction = J2RelativeMotion.j2_sedwick_stream_reduce(
+        parameters["state"], get_reference_orbit(parameters), 0.0, step,
+        int(parameters["propagation_time"] / step) + 1, parameters["threshold_min"], parameters["threshold_max"],
+        method=parameters["fidelity"], control=control)
+    summary = reduction.get_summary()
+    return summary, {"pass_lengths": np.asarray(summary["pass_lengths"], dtype=float)}
+
+
+def run_store(parameters, control=None):
+    # the whole trajectory in a memory-mapped file that TrajectoryStore can reopen window by window
+    step = parameters["trajectory_step"]
+    store = TrajectoryStore.write_trajectory_store(
+        parameters["store_path"], parameters["state"], get_reference_orbit(parameters), 0.0, step,
+        int(parameters["propagation_time"] / step) + 1, parameters["threshold_min"], parameters["threshold_max"],
+        method=parameters["fidelity"], control=control)
+    summary = dict(store.reduce().get_summary(), store_path=store.path, store_bytes=os.path.getsize(store.path))
+    return summary, {"pass_lengths": np.asarray(summary["pass_lengths"], dtype=float)}
+
+
+def run_dispersion(parameters, control=None):
+    dispersion = parameters["dispersion"]
+    result = DispersionEngine.dispersion_analysis(
+        parameters["state"], parameters["variances"], get_reference_orbit(parameters), parameters["propagation_time"],
+        parameters["values_record"], parameters["threshold_min"], parameters["threshold_max"], dispersion["samples"],
+        dispersion["distribution"], dispersion["seed"], dispersion["workers"], control, dispersion["model"],
+        dispersion["drag_alpha"])
+    return result.get_summary(dispersion["confidence"]), {
+        "states": result.get_states(), "time_in_constraint": result.get_time_in_constraint(),
+        "first_exit_time": result.get_first_exit_time(), "pass_counts": result.get_pass_counts()}
+
+
+def run_sensitivity(parameters, control=None):
+    sweep = parameters["sensitivity"]
+    result = SensitivityEngine.sensitivity_sweep(
+        parameters["state"], parameters["variances"], sweep["axes"], get_reference_orbit(parameters),
+        parameters["propagation_time"], parameters["values_record"], parameters["threshold_min"],
+        parameters["threshold_max"], sweep["samples"], sweep["sampler"], sweep["seed"], sweep["workers"], control,
+        sweep["model"], sweep["drag_alpha"])
+    summary = dict(result.get_summary(), pairs=[list(pair) for pair in result.get_pairs()])
+    arrays = {"states": result.get_states(), "success_level": result.get_success_level()}
+    # every 2-D marginal in heatmap layout, marginal_<x>_<y> with axes marginal_<x>_<y>_x and _y
+    for x_axis, y_axis in result.get_pairs():
+        name = "marginal_" + str(x_axis) + "_" + str(y_axis)
+        arrays[name + "_x"], arrays[name + "_y"], arrays[name] = result.get_marginal(x_axis, y_axis)
+    return summary, arrays
+
+
+def run_targeting(parameters, control=None):
+    end_seconds = parameters["propagation_time"]
+    times = np.linspace(0.0, end_seconds, int(end_seconds))
+    best_state, best_trajectory, closest_time = J2RelativeMotion.j2_sedwick_target_trajectory(
+        parameters["state"], parameters["target_state"], get_reference_orbit(parameters), times,
+        times[1] - times[0], end_seconds, parameters["threshold_min"], parameters["threshold_max"], control=control)
+    summary = {"targeted_state": [float(value) for value in best_state[:6]], "time_in_range": float(closest_time)}
+    return summary, {"trajectory": np.asarray(best_trajectory), "state_transition": np.reshape(best_state[6:], (6, 6))}
+
+
+def run_station_keeping(parameters, control=None):
+    campaign = StationKeeping.simulate_station_keeping(
+        parameters["state"], parameters["target_state"], get_reference_orbit(parameters),
+        parameters["trajectory_step"], parameters["propagation_time"], parameters["threshold_min"],
+        parameters["threshold_max"], control=control)
+    maneuvers = campaign.get_maneuvers()
+    summary = {"maneuvers": len(maneuvers), "delta_v_budget": campaign.get_delta_v_budget(),
+               "final_arc_state": campaign.get_final_arc_state().tolist(),
+               "maneuver_log": [{"time": time, "state": state.tolist(), "delta_v": delta_v.tolist()}
+                                for time, state, delta_v in maneuvers]}
+    return summary, {"t": campaign.get_t(), "states": campaign.get_states(),
+                     "maneuver_times": np.array([time for time, _, _ in maneuvers]),
+                     "delta_v": np.reshape([delta_v for _, _, delta_v in maneuvers], (-1, 3))}
+
+
+runs = {
+    "heatmap": run_heatmap,
+    "trajectory": run_trajectory,
+    "passes": run_pass_times,
+    "stream": run_stream,
+    "store": run_store,
+    "target": run_targeting,
+    "station-keeping": run_station_keeping,
+    "dispersion": run_dispersion,
+    "sensitivity": run_sensitivity,
+}
+
+
+def write_results(output_directory, name, mode, summary, arrays):
+    # <name>_<mode>.json holds the summary, <name>_<mode>.npz the numeric arrays
+    os.makedirs(output_directory, exist_ok=True)
+    base = os.path.join(output_directory, name + "_" + mode)
+    with open(base + ".json", "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    np.savez(base + ".npz", **arrays)
+    return base
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run STARMAP computations without the GUI.")
+    parser.add_argument("mode", choices=sorted(runs))
+    parser.add_argument("parameters", help="JSON parameter file with one case or a list of cases")
+    parser.add_argument("-o", "--output", default="starmap_results", help="directory for the result files")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="override the heatmap, dispersion and sensitivity worker counts")
+    parser.add_argument("-f", "--fidelity", choices=J2RelativeMotion.fidelity_presets,
+                        help="override the propagation fidelity of the trajectory, passes, stream and store modes")
+    parser.add_argument("-i", "--instrument", action="store_true",
+                        help="add phase times, integrator counters and peak memory to each summary")
+    arguments = parser.parse_args(argv)
+
+    for parameters in load_parameters(arguments.parameters):
+        if parameters["store_path"] is None:
+            os.makedirs(arguments.output, exist_ok=True)
+            parameters["store_path"] = os.path.join(arguments.output, parameters["name"] + ".trj")
+        if arguments.workers is not None:
+            parameters["heatmap"]["workers"] = arguments.workers
+            parameters["dispersion"]["workers"] = arguments.workers
+            parameters["sensitivity"]["workers"] = arguments.workers
+        if arguments.fidelity is not None:
+            parameters["fidelity"] = arguments.fidelity
+        if arguments.instrument:
+            Instrumentation.start()
+        summary, arrays = runs[arguments.mode](parameters)
+        if arguments.instrument:
+            summary["instrumentation"] = Instrumentation.stop().get_summary()
+        base = write_results(arguments.output, parameters["name"], arguments.mode, summary, arrays)
+        print("wrote " + base + ".json and " + base + ".npz")
+    return 0
+
+# ################################################################################## #
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# seconds allowed for a cold start, and modules that must not be loaded by it
+budgets = {
+    "gui": {"seconds": 1.0, "deferred_modules": ["matplotlib", "scipy", "mpmath", "HeatMap", "RelativeLocator",
+                                                 "Targeter", "GraphWidgets"]},
+    "batch": {"seconds": 0.5, "deferred_modules": ["PyQt5", "matplotlib", "scipy", "mpmath"]},
+}
+
+# run in a fresh interpreter so nothing is already imported
+probes = {
+    "gui": "import os, sys, time\n"
+           "begin = time.perf_counter()\n"
+           "os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')\n"
+           "from PyQt5.QtWidgets import QApplication\n"
+           "app = QApplication(sys.argv)\n"
+           "import StarMap\n"
+           "window = StarMap.App()\n"
+           "app.processEvents()\n",
+    "batch": "import sys, time\n"
+             "begin = time.perf_counter()\n"
+             "import StarMapBatch\n",
+}
+probe_report = "import json\n" \
+               "print(json.dumps({'seconds': time.perf_counter() - begin, 'modules': sorted(sys.modules)}))\n"
+
+
+# ############################## STARTUP BUDGET CHECK ############################## #
+
+def measure_startup(target, repeats=3):
+    # best of several cold starts, and the modules loaded by the last one
+    directory = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    modules = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", probes[target] + probe_report], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout
+        measurement = json.loads(output.strip().splitlines()[-1])
+        best = measurement["seconds"] if best is None else min(best, measurement["seconds"])
+        modules = measurement["modules"]
+    return best, modules
+
+
+def check_startup(target, repeats=3):
+    seconds, modules = measure_startup(target, repeats)
+    budget = budgets[target]
+    loaded = [name for name in budget["deferred_modules"] if name in modules]
+    return {"target": target, "seconds": seconds, "budget_seconds": budget["seconds"],
+            "eagerly_loaded": loaded, "passed": seconds <= budget["seconds"] and not loaded}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check STARMAP cold start time against its budget.")
+    parser.add_argument("targets", nargs="*", help="any of " + ", ".join(sorted(budgets)) + " (default: all)")
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    arguments = parser.parse_args(argv)
+    for target in arguments.targets:
+        if target not in budgets:
+            parser.error("unknown target: " + target)
+
+    results = [check_startup(target, arguments.repeats) for target in arguments.targets or sorted(budgets)]
+    print(json.dumps(results, indent=2))
+    return 0 if all(result["passed"] for result in results) else 1
+
+# ################################################################################## #
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import numpy as np
+import J2RelativeMotion
+import JobControl
+import Instrumentation
+
+chunk_samples = 2 ** 16  # most samples propagated at a time while looking for the next violation
+
+
+# ############################## STATION-KEEPING CAMPAIGN ############################## #
+
+class StationKeepingCampaign:
+
+    def __init__(self, t, states, maneuvers):
+
+        self._t = t
+        self._states = states
+        self._maneuvers = maneuvers  # (time, state before the burn, delta-v vector) per maneuver
+
+    def get_t(self):
+        return self._t
+
+    def get_states(self):
+        return self._states
+
+    def get_maneuvers(self):
+        return self._maneuvers
+
+    def get_delta_v_budget(self):
+        return float(sum(np.linalg.norm(delta_v) for _, _, delta_v in self._maneuvers))
+
+    def get_final_arc_state(self):
+        # state right after the last maneuver, or the initial state when none was needed
+        if not self._maneuvers:
+            return self._states[0].copy()
+        maneuver_time, state, delta_v = self._maneuvers[-1]
+        return np.concatenate((state[:3], state[3:6] + delta_v))
+
+
+def default_transfer_time(reference_orbit):
+    # a quarter orbit keeps the position-from-velocity block of the STM well conditioned
+    n, _, _, _, _ = J2RelativeMotion.evaluate_j2_constants_batch(reference_orbit, np.zeros((1, 6)))
+    return np.pi / (2 * n)
+
+
+def station_keeping_burn(state, desired_state, constants, transfer_time):
+    # velocity change that reaches the nominal formation position transfer_time after the burn
+    n, c, _, q, _ = constants
+    stm = J2RelativeMotion.sedwick_stm_at(float(transfer_time), n, c, q)
+    target = np.asarray(desired_state[:3], dtype=float) - np.matmul(stm[0:3, 0:3], state[:3])
+    return np.linalg.solve(stm[0:3, 3:6], target) - state[3:6]
+
+
+def simulate_station_keeping(state, desired_state, reference_orbit, step, end_seconds, thresh_min, thresh_max,
+                             transfer_time=None, max_maneuvers=None, control=None):
+    # propagate until the range exceeds thresh_max, burn towards the nominal formation at that epoch and continue
+    # from there. after a burn the next violation is only looked for once the transfer has completed.
+    # each arc is a fresh Sedwick problem with J2 constants from its own initial state
+    if transfer_time is None:
+        transfer_time = default_transfer_time(reference_orbit)
+    current = np.asarray(state[:6], dtype=float)
+    arc_start = 0.0
+    coast = 0.0
+    t_pieces = [np.zeros(1)]
+    state_pieces = [current[np.newaxis, :]]
+    maneuvers = []
+
+    while arc_start < end_seconds:
+        with Instrumentation.phase("setup"):
+            constants = J2RelativeMotion.evaluate_j2_constants(reference_orbit, current)
+        if not np.all(np.isfinite(constants)):
+            raise RuntimeError("station keeping failed: the arc from t = " + str(arc_start) +
+                               " s has non-finite J2 constants")
+        n, c, l, q, phi = constants
+        arc_samples = int(np.ceil((end_seconds - arc_start) / step - 1e-9))
+        burn = None
+        first = 1
+        # violations usually come within a few orbits, so start with about one orbit and grow from there
+        chunk = int(min(chunk_samples, max(16, np.ceil(2 * np.pi / (n * step)))))
+        while burn is None and first <= arc_samples:
+            JobControl.report(control, min(1.0, (arc_start + first * step) / end_seconds))
+            tau = step * np.arange(first, min(first + chunk, arc_samples + 1))
+            with Instrumentation.phase("propagate"):
+                states = J2RelativeMotion.sedwick_closed_form(tau, current, n, c, l, q, phi)
+            if not np.all(np.isfinite(states)):
+                raise RuntimeError("station keeping failed: the arc from t = " + str(arc_start) +
+                                   " s propagated to non-finite states")
+            with Instrumentation.phase("reduce"):
+                exceeded = np.flatnonzero((J2RelativeMotion.range_magnitudes(states) > thresh_max) & (tau >= coast))
+            if len(exceeded):
+                states = states[:exceeded[0] + 1]
+                tau = tau[:len(states)]
+                burn = exceeded[0]
+            t_pieces.append(arc_start + tau)
+            state_pieces.append(states)
+            first += chunk
+            chunk = min(2 * chunk, chunk_samples)
+
+        if burn is None or (max_maneuvers is not None and len(maneuvers) >= max_maneuvers):
+            break
+
+        before = state_pieces[-1][-1]
+        delta_v = station_keeping_burn(before, desired_state, constants, transfer_time)
+        arc_start = t_pieces[-1][-1]
+        if not np.all(np.isfinite(delta_v)):
+            raise RuntimeError("station keeping failed: non-finite burn at t = " + str(arc_start) + " s")
+        maneuvers.append((float(arc_start), before.copy(), delta_v))
+        current = np.concatenate((before[:3], before[3:6] + delta_v))
+        coast = transfer_time
+
+    return StationKeepingCampaign(np.concatenate(t_pieces), np.concatenate(state_pieces), maneuvers)
+
+# ################################################################################### #
@@ -0,0 +1,89 @@
+import numpy as np
+import J2RelativeMotion
+import TrajectoryCache
+
+
+# ############################## PROPAGATED TRAJECTORY ############################## #
+
+class Trajectory:
+
+    def __init__(self, state, reference_orbit, times, step, thresh_min, thresh_max,
+                 cache=TrajectoryCache.default_cache, samples=None, method='analytic', t_0=None):
+
+        self.state = state
+        self.reference_orbit = reference_orbit
+        self.thresh_min = thresh_min
+        self.thresh_max = thresh_max
+        self.method = method  # 'analytic' or one of J2RelativeMotion.numerical_methods, e.g. a fidelity preset
+        if samples is not None:
+            # (t, states) already propagated from state at t_0 with method, e.g. a window of a TrajectoryStore
+            self._t, self._states = samples
+        elif cache is None:
+            self._t, self._states = J2RelativeMotion.j2_sedwick_trajectory(state, reference_orbit, times, step,
+                                                                           method)
+        else:
+            self._t, self._states = cache.get_trajectory(state, reference_orbit, times, step, method)
+        self.t_0 = self._t[0] if t_0 is None else t_0
+
+        # derived views, filled in on first use
+        self._magnitudes = None
+        self._regions = None
+        self._pass_lengths = None
+        self._pass_times = None
+        self._propagation_error = None
+
+    def get_t(self):
+        return self._t
+
+    def get_states(self):
+        return self._states
+
+    def get_positions(self):
+        return [self._states[:, 0], self._states[:, 1], self._states[:, 2]]
+
+    def get_magnitudes(self):
+        # like the threshold modes of j2_sedwick_propagator, skip the initial state
+        if self._magnitudes is None:
+            self._magnitudes = J2RelativeMotion.range_magnitudes(self._states[1:])
+        return self._magnitudes
+
+    def get_in_range(self):
+        return J2RelativeMotion.in_range_mask(self.get_magnitudes(), self.thresh_min, self.thresh_max)
+
+    def get_regions(self):
+        if self._regions is None:
+            self._regions = J2RelativeMotion.split_by_range(self._t[1:], self._states[1:], self.get_magnitudes(),
+                                                            self.thresh_min, self.thresh_max)
+        return self._regions
+
+    def get_pass_lengths(self):
+        if self._pass_lengths is None:
+            self._pass_lengths = J2RelativeMotion.pass_lengths_from_mask(self.get_in_range())
+        return self._pass_lengths
+
+    def get_pass_times(self):
+        # exact (starts, ends) of each pass in seconds, independent of the output step
+        if self._pass_times is None:
+            constants = J2RelativeMotion.evaluate_j2_constants(self.reference_orbit, self.state)
+            self._pass_times = J2RelativeMotion.range_pass_times(self._t, self._states, self._states[0], constants,
+                                                                 self.thresh_min, self.thresh_max)
+        return self._pass_times
+
+    def get_time_in_range(self):
+        starts, ends = self.get_pass_times()
+        return float(np.sum(ends - starts))
+
+    def get_success_count(self):
+        return int(np.count_nonzero(self.get_in_range()))
+
+    def get_propagation_error(self):
+        # largest position difference (m) from the closed form, 0 for the closed form itself
+        if self._propagation_error is None:
+            self._propagation_error = 0.0
+            if self.method != 'analytic' and len(self._t):
+                constants = J2RelativeMotion.evaluate_j2_constants(self.reference_orbit, self.state)
+                self._propagation_error = J2RelativeMotion.propagation_error(self._t, self._states, self.state,
+                                                                             constants, self.t_0)
+        return self._propagation_error
+
+# ################################################################################## #
@@ -0,0 +1,83 @@
+import numpy as np
+from collections import OrderedDict
+import J2RelativeMotion
+import Instrumentation
+
+
+# ############################## TRAJECTORY CACHE ############################## #
+
+class TrajectoryCache:
+
+    def __init__(self, max_bytes=256 * 2 ** 20):
+
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # least recently used first
+        self._bytes = 0
+        self.hits = 0
+        self.extensions = 0
+        self.misses = 0
+
+    def get_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    @staticmethod
+    def make_key(delta_state_0, reference_orbit, time, step, method):
+        # the grid is identified by its start and step, so a longer grid shares the key of a shorter one
+        return (tuple(float(value) for value in delta_state_0[:6]),
+                float(reference_orbit.get_a()), float(reference_orbit.get_e()), float(reference_orbit.get_i()),
+                float(time[0]), float(step), method)
+
+    def get_trajectory(self, delta_state_0, reference_orbit, time, step, method='analytic'):
+        # same result as J2RelativeMotion.j2_sedwick_trajectory, returned as read-only arrays
+        key = self.make_key(delta_state_0, reference_orbit, time, step, method)
+        num_samples = len(time)
+        entry = self._entries.pop(key, None)
+
+        if entry is None:
+            self.misses += 1
+            with Instrumentation.phase("setup"):
+                constants = J2RelativeMotion.evaluate_j2_constants(reference_orbit, delta_state_0)
+                t = J2RelativeMotion.sample_times(time, step)
+            with Instrumentation.phase("propagate"):
+                states = J2RelativeMotion.sedwick_resume(delta_state_0, t, constants, method)
+        else:
+            constants, t, states = entry
+            self._bytes -= t.nbytes + states.nbytes
+            if len(t) >= num_samples:
+                self.hits += 1
+            else:
+                # only the horizon grew: continue from the cached end state
+                self.extensions += 1
+                with Instrumentation.phase("setup"):
+                    t_extension = J2RelativeMotion.sample_times(time, step)[len(t) - 1:]
+                with Instrumentation.phase("propagate"):
+                    extension = J2RelativeMotion.sedwick_resume(states[-1], t_extension, constants, method)
+                t = np.concatenate((t, t_extension[1:]))
+                states = np.concatenate((states, extension[1:]))
+
+        t.setflags(write=False)
+        states.setflags(write=False)
+        self._store(key, (constants, t, states))
+        return t[:num_samples], states[:num_samples]
+
+    def _store(self, key, entry):
+        size = entry[1].nbytes + entry[2].nbytes
+        if size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[1].nbytes + evicted[2].nbytes
+
+
+default_cache = TrajectoryCache()
+
+# ############################################################################# #
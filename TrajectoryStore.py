@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import OrbitalElements
+import J2RelativeMotion
+import Trajectory
+import JobControl
+
+magic = b"SMTRAJ01"
+header_bytes = 4096  # the states start on a page boundary, so windows map cleanly
+state_dtype = np.dtype("<f8")
+columns = ["x", "y", "z", "xd", "yd", "zd"]
+
+
+# ############################## ON-DISK TRAJECTORY STORE ############################## #
+
+# file layout: magic, JSON header padded with spaces to header_bytes, then num_samples x 6 little-endian
+# float64 states on the grid t_0 + step * k. the header is rewritten in place once every sample is on disk
+
+def orbit_to_header(reference_orbit):
+    return {"a": float(reference_orbit.get_a()), "e": float(reference_orbit.get_e()),
+            "i": float(reference_orbit.get_i()), "w": float(reference_orbit.get_w()),
+            "o": float(reference_orbit.get_o()), "nu": float(reference_orbit.get_nu()),
+            "mu": float(reference_orbit.mu)}
+
+
+def write_header(store_file, header):
+    text = json.dumps(header).encode("utf-8")
+    if len(magic) + len(text) > header_bytes:
+        raise ValueError("trajectory store header does not fit in " + str(header_bytes) + " bytes")
+    store_file.seek(0)
+    store_file.write(magic + text.ljust(header_bytes - len(magic)))
+
+
+def read_header(path):
+    with open(path, "rb") as store_file:
+        block = store_file.read(header_bytes)
+    if not block.startswith(magic) or len(block) < header_bytes:
+        raise ValueError(path + " is not a trajectory store")
+    return json.loads(block[len(magic):].decode("utf-8"))
+
+
+def write_trajectory_store(path, delta_state_0, reference_orbit, t_0, step, num_samples, thresh_min, thresh_max,
+                           chunk_samples=None, method='analytic', control=None):
+    # propagate num_samples samples chunk by chunk straight to path, so the run never sits in memory
+    header = {"version": 1, "state": [float(value) for value in delta_state_0[:6]],
+              "reference_orbit": orbit_to_header(reference_orbit), "t_0": float(t_0), "step": float(step),
+              "num_samples": int(num_samples), "thresh_min": float(thresh_min), "thresh_max": float(thresh_max),
+              "method": method, "dtype": state_dtype.str, "columns": columns, "complete": False}
+    with open(path, "wb") as store_file:
+        write_header(store_file, header)
+        for t, states in J2RelativeMotion.j2_sedwick_stream(delta_state_0, reference_orbit, t_0, step, num_samples,
+                                                            chunk_samples, method):
+            store_file.write(np.ascontiguousarray(states, dtype=state_dtype).tobytes())
+            JobControl.report(control, (t[-1] - t_0) / (step * max(1, num_samples - 1)))
+        header["complete"] = True
+        write_header(store_file, header)
+    return TrajectoryStore(path)
+
+
+class TrajectoryStore:
+
+    def __init__(self, path):
+
+        self.path = path
+        self._header = read_header(path)
+        if not self._header["complete"]:
+            raise ValueError(path + " was not completely written")
+        shape = (self._header["num_samples"], len(columns))
+        expected = header_bytes + shape[0] * shape[1] * state_dtype.itemsize
+        if os.path.getsize(path) != expected:
+            raise ValueError(path + " has " + str(os.path.getsize(path)) + " bytes, expected " + str(expected))
+        # read-only, so any number of viewers and processes can map the same file
+        self._states = np.memmap(path, dtype=state_dtype, mode="r", offset=header_bytes, shape=shape)
+
+    def __len__(self):
+        return self._header["num_samples"]
+
+    def get_header(self):
+        return dict(self._header)
+
+    def get_state(self):
+        return np.array(self._header["state"])
+
+    def get_reference_orbit(self):
+        orbit = self._header["reference_orbit"]
+        return OrbitalElements.OrbitalElements(orbit["a"], orbit["e"], orbit["i"], orbit["w"], orbit["o"],
+                                               orbit["nu"], orbit["mu"])
+
+    def get_thresholds(self):
+        return self._header["thresh_min"], self._header["thresh_max"]
+
+    def get_step(self):
+        return self._header["step"]
+
+    def get_method(self):
+        return self._header["method"]
+
+    def get_times(self, first=0, last=None):
+        if last is None:
+            last = len(self)
+        return self._header["t_0"] + self._header["step"] * np.arange(first, last)
+
+    def get_time(self, index):
+        return self._header["t_0"] + self._header["step"] * index
+
+    def get_end_time(self):
+        return self.get_time(len(self) - 1)
+
+    def sample_range(self, start_time=None, end_time=None):
+        # indices [first, last) of the samples inside [start_time, end_time]
+        t_0, step = self._header["t_0"], self._header["step"]
+        first = 0 if start_time is None else int(np.ceil((start_time - t_0) / step - 1e-9))
+        last = len(self) if end_time is None else int(np.floor((end_time - t_0) / step + 1e-9)) + 1
+        return min(max(first, 0), len(self)), min(max(last, 0), len(self))
+
+    def get_window(self, start_time=None, end_time=None):
+        # (t, states) inside [start_time, end_time], the states are a read-only view of the mapped file
+        first, last = self.sample_range(start_time, end_time)
+        return self.get_times(first, last), self._states[first:last]
+
+    def iterate_chunks(self, chunk_samples=None, start_time=None, end_time=None):
+        return self._chunks(*self.sample_range(start_time, end_time), chunk_samples)
+
+    def _chunks(self, first, last, chunk_samples=None):
+        if chunk_samples is None:
+            chunk_samples = J2RelativeMotion.stream_chunk_samples
+        for begin in range(first, last, chunk_samples):
+            end = min(begin + chunk_samples, last)
+            yield self.get_times(begin, end), self._states[begin:end]
+
+    def reduce(self, chunk_samples=None, control=None):
+        # J2RelativeMotion.RangeReduction over the stored run, skipping the initial state like the threshold modes
+        reference = None
+        if self.get_method() != 'analytic':
+            constants = J2RelativeMotion.evaluate_j2_constants(self.get_reference_orbit(), self.get_state())
+            reference = (self.get_state(), constants, self._header["t_0"])
+        reduction = J2RelativeMotion.RangeReduction(*self.get_thresholds(), reference)
+        for t, states in self._chunks(1, len(self), chunk_samples):
+            reduction.update(t, states)
+            JobControl.report(control, (t[-1] - self._header["t_0"]) / (self.get_step() * max(1, len(self) - 1)))
+        return reduction
+
+    def get_trajectory(self, start_time=None, end_time=None):
+        # a Trajectory over one window, its derived views only ever touch that window
+        thresh_min, thresh_max = self.get_thresholds()
+        return Trajectory.Trajectory(self.get_state(), self.get_reference_orbit(), None, self.get_step(),
+                                     thresh_min, thresh_max, samples=self.get_window(start_time, end_time),
+                                     method=self.get_method(), t_0=self._header["t_0"])
+
+# ################################################################################### #
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Describe a STARMAP trajectory store or one window of it.")
+    parser.add_argument("path")
+    parser.add_argument("-s", "--start", type=float, help="window start time (s)")
+    parser.add_argument("-e", "--end", type=float, help="window end time (s)")
+    arguments = parser.parse_args(argv)
+
+    store = TrajectoryStore(arguments.path)
+    header = store.get_header()
+    summary = {"header": header, "end_time": store.get_end_time()}
+    if arguments.start is not None or arguments.end is not None:
+        first, last = store.sample_range(arguments.start, arguments.end)
+        t, states = store.get_window(arguments.start, arguments.end)
+        magnitudes = J2RelativeMotion.range_magnitudes(states)
+        summary["window"] = {"first_sample": first, "samples": last - first,
+                             "samples_in_range": int(np.count_nonzero(J2RelativeMotion.in_range_mask(
+                                 magnitudes, header["thresh_min"], header["thresh_max"]))),
+                             "min_range": float(np.min(magnitudes)) if len(magnitudes) else None,
+                             "max_range": float(np.max(magnitudes)) if len(magnitudes) else None}
+    else:
+        summary["reduction"] = store.reduce().get_summary()
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
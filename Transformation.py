@@ -11,3 +11,40 @@ def t_2(angle):
 
 def t_1(angle):
     return [[1, 0, 0], [0, np.cos(angle), np.sin(angle)], [0, -np.sin(angle), np.cos(angle)]]
+
+
+def t_3_array(angles):
+    # t_3 for every entry of angles, as (N, 3, 3)
+    angles = np.asarray(angles, dtype=float)
+    cos, sin = np.cos(angles), np.sin(angles)
+    matrices = np.zeros(angles.shape + (3, 3))
+    matrices[..., 0, 0] = cos
+    matrices[..., 0, 1] = sin
+    matrices[..., 1, 0] = -sin
+    matrices[..., 1, 1] = cos
+    matrices[..., 2, 2] = 1
+    return matrices
+
+
+def t_2_array(angles):
+    angles = np.asarray(angles, dtype=float)
+    cos, sin = np.cos(angles), np.sin(angles)
+    matrices = np.zeros(angles.shape + (3, 3))
+    matrices[..., 0, 0] = cos
+    matrices[..., 0, 2] = -sin
+    matrices[..., 1, 1] = 1
+    matrices[..., 2, 0] = sin
+    matrices[..., 2, 2] = cos
+    return matrices
+
+
+def t_1_array(angles):
+    angles = np.asarray(angles, dtype=float)
+    cos, sin = np.cos(angles), np.sin(angles)
+    matrices = np.zeros(angles.shape + (3, 3))
+    matrices[..., 0, 0] = 1
+    matrices[..., 1, 1] = cos
+    matrices[..., 1, 2] = sin
+    matrices[..., 2, 1] = -sin
+    matrices[..., 2, 2] = cos
+    return matrices
@@ -0,0 +1,79 @@
+import numpy as np
+from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+import JobControl
+
+
+# ############################## BACKGROUND COMPUTE WORKERS ############################## #
+
+class ComputeWorker(QObject):
+
+    progress = pyqtSignal(float)
+    partial = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, job):
+        super(QObject, self).__init__()
+        self.job = job  # called with a JobControl on the worker thread
+        self.control = JobControl.JobControl(self.progress.emit, self.emit_partial)
+
+    def emit_partial(self, partial):
+        self.partial.emit(np.array(partial))  # copy, the job keeps filling its own array
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            result = self.job(self.control)
+        except JobControl.JobCancelled:
+            self.cancelled.emit()
+        except Exception as error:
+            self.failed.emit(str(error))
+        else:
+            self.finished.emit(result)
+
+    def cancel(self):
+        self.control.cancel()
+
+
+class BackgroundJob(QObject):
+
+    # re-emitted on the thread that created the job, so slots may touch widgets
+    progress = pyqtSignal(float)
+    partial = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    done = pyqtSignal()
+
+    def __init__(self, job, parent=None):
+        super(QObject, self).__init__(parent)
+        self.thread = QThread()
+        self.worker = ComputeWorker(job)
+        self.worker.moveToThread(self.thread)
+        self.thread.started.connect(self.worker.run)
+
+        self.worker.progress.connect(self.progress)
+        self.worker.partial.connect(self.partial)
+        self.worker.finished.connect(self.finished)
+        self.worker.failed.connect(self.failed)
+        self.worker.cancelled.connect(self.cancelled)
+
+    def start(self):
+        # connected last so result handlers run before done
+        for signal in (self.finished, self.failed, self.cancelled):
+            signal.connect(self.when_worker_stopped)
+        self.thread.start()
+
+    def cancel(self):
+        self.worker.cancel()
+
+    def is_running(self):
+        return self.thread.isRunning()
+
+    def when_worker_stopped(self, *args):
+        self.thread.quit()
+        self.thread.wait()
+        self.done.emit()
+
+# ####################################################################################### #
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+import OrbitalElements
+import J2RelativeMotion
+import DragRelativeMotion
+
+reference_orbit = OrbitalElements.OrbitalElements(6678136.6, 0.0, 0.52, 0.0, 0.0, 0.0, J2RelativeMotion.mu)
+basis_states = list(np.identity(6) * [10.0, 10.0, 10.0, 0.01, 0.01, 0.01])
+
+
+@pytest.mark.parametrize("delta_state_0", basis_states)
+def test_drag_free_limit_matches_hcw(delta_state_0):
+    # without drag the Carter-Humi STM reduces to Hill-Clohessy-Wiltshire, which is the Sedwick
+    # closed form with c = 1, l = 0 and q = n
+    n = np.sqrt(reference_orbit.mu / reference_orbit.get_a() ** 3)
+    t = np.linspace(0.0, 20000.0, 201)
+    hcw = J2RelativeMotion.sedwick_closed_form(t, delta_state_0, n, 1.0, 0.0, n, 0.0)
+    drag = DragRelativeMotion.drag_propagate_batch([delta_state_0], t, reference_orbit, 1e-9)[0]
+    assert np.allclose(drag[:, :3], hcw[:, :3], rtol=1e-6, atol=1e-6)
+
+    magnitudes = DragRelativeMotion.drag_ensemble([delta_state_0], reference_orbit, t, t[1] - t[0], 4, 0.0, 1.0,
+                                                  1e-9)[0]
+    assert np.allclose(magnitudes, J2RelativeMotion.range_magnitudes(hcw[np.newaxis, 1:])[0], rtol=1e-6, atol=1e-6)
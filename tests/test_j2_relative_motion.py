@@ -0,0 +1,224 @@
+import numpy as np
+import pytest
+from scipy.integrate import solve_ivp
+import OrbitalElements
+import J2RelativeMotion
+import Instrumentation
+
+reference_orbits = [OrbitalElements.OrbitalElements(6678136.6, 0.0001, 0.52, 0.0, 0.0, 0.0, J2RelativeMotion.mu),
+                    OrbitalElements.OrbitalElements(7000000.0, 0.0, 1.0, 0.0, 0.0, 0.0, J2RelativeMotion.mu),
+                    OrbitalElements.OrbitalElements(42164000.0, 0.0, 0.1, 0.0, 0.0, 0.0, J2RelativeMotion.mu)]
+states = [[0.1, 0.1, 0.01, -0.02, 0.0, 0.01],
+          [100.0, -50.0, 20.0, 0.05, -0.1, 0.02],
+          [0.0, 0.0, 300.0, 0.0, 0.0, 0.3]]
+
+
+def integrate_sedwick(delta_state_0, t, n, c, l, q, phi):
+    # the Sedwick equations written out independently of the module, integrated tightly
+    def rhs(time, x):
+        return [x[3], x[4], x[5],
+                2 * n * c * x[4] + (5 * c ** 2 - 2) * n ** 2 * x[0],
+                -2 * n * c * x[3],
+                -q ** 2 * x[2] + 2 * l * q * np.cos(q * time + phi)]
+    solution = solve_ivp(rhs, (t[0], t[-1]), delta_state_0, method='DOP853', t_eval=t, rtol=1e-13, atol=1e-13)
+    return solution.y.T
+
+
+@pytest.mark.parametrize("reference_orbit", reference_orbits)
+@pytest.mark.parametrize("delta_state_0", states)
+def test_closed_form_matches_integration(reference_orbit, delta_state_0):
+    constants = J2RelativeMotion.evaluate_j2_constants(reference_orbit, delta_state_0)
+    t = np.linspace(0.0, 20000.0, 2001)
+    exact = J2RelativeMotion.sedwick_closed_form(t, delta_state_0, *constants)
+    numerical = integrate_sedwick(delta_state_0, t, *constants)
+    scale = max(1.0, np.max(np.abs(numerical)))
+    np.testing.assert_allclose(exact, numerical, rtol=0, atol=1e-8 * scale)
+
+
+@pytest.mark.parametrize("reference_orbit", reference_orbits)
+def test_stm_matches_unforced_closed_form(reference_orbit):
+    n, c, _, q, _ = J2RelativeMotion.evaluate_j2_constants(reference_orbit, states[1])
+    t = np.linspace(0.0, 10000.0, 101)
+    stm = J2RelativeMotion.sedwick_stm(t, n, c, q)
+    exact = J2RelativeMotion.sedwick_closed_form(t, states[1], n, c, 0.0, q, 0.0)
+    np.testing.assert_allclose(stm @ np.asarray(states[1]), exact, rtol=0, atol=1e-9 * np.max(np.abs(exact)))
+    np.testing.assert_allclose(stm[0], np.identity(6), atol=1e-15)
+
+
+def test_ensemble_matches_single_trajectories():
+    reference_orbit = reference_orbits[0]
+    times = np.linspace(0.0, 10000.0, 1001)
+    step = times[1] - times[0]
+    trajectories = J2RelativeMotion.j2_sedwick_ensemble(states, reference_orbit, times, step, 0, 0.0, 30.0)
+    magnitudes = J2RelativeMotion.j2_sedwick_ensemble(states, reference_orbit, times, step, 4, 0.0, 30.0)
+    counts = J2RelativeMotion.j2_sedwick_ensemble(states, reference_orbit, times, step, 1, 0.0, 30.0)
+    for member, delta_state_0 in enumerate(states):
+        _, single = J2RelativeMotion.j2_sedwick_trajectory(delta_state_0, reference_orbit, times, step)
+        np.testing.assert_allclose(trajectories[member], single, rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(magnitudes[member],
+                                   J2RelativeMotion.j2_sedwick_propagator(delta_state_0, reference_orbit, times,
+                                                                          step, 4, 0.0, 30.0, False),
+                                   rtol=1e-12, atol=1e-12)
+        assert counts[member] == J2RelativeMotion.j2_sedwick_propagator(delta_state_0, reference_orbit, times,
+                                                                        step, 1, 0.0, 30.0, False)
+
+
+def test_ensemble_masks_match_single_split():
+    # type 2 counts samples exactly on a threshold as in range, in the ensemble as in the single propagation
+    reference_orbit = reference_orbits[0]
+    times = np.linspace(0.0, 10000.0, 1001)
+    step = times[1] - times[0]
+    magnitudes = J2RelativeMotion.j2_sedwick_ensemble(states, reference_orbit, times, step, 4, 0.0, 1.0)
+    for member, delta_state_0 in enumerate(states):
+        thresh_min, thresh_max = sorted(magnitudes[member, [100, 500]])
+        mask = J2RelativeMotion.j2_sedwick_ensemble(states, reference_orbit, times, step, 2, thresh_min,
+                                                    thresh_max)[member]
+        in_range_times = J2RelativeMotion.j2_sedwick_propagator(delta_state_0, reference_orbit, times, step, 2,
+                                                                thresh_min, thresh_max, False)[0]
+        assert mask[100] and mask[500]
+        np.testing.assert_array_equal(times[1:][mask], in_range_times)
+
+
+def test_element_set_ensemble_chunking():
+    # one reference orbit per member, so n and c vary per member and must follow the chunks
+    rng = np.random.default_rng(3)
+    members = 50
+    reference_orbit = OrbitalElements.OrbitalElementSet(rng.uniform(6.7e6, 7.5e6, members), 0.0,
+                                                        rng.uniform(0.1, 1.5, members), 0.0,
+                                                        rng.uniform(0.0, 6.0, members), 0.0, J2RelativeMotion.mu)
+    delta_states_0 = rng.normal(0.0, [10.0, 10.0, 10.0, 0.01, 0.01, 0.01], (members, 6))
+    times = np.linspace(0.0, 10000.0, 1001)
+    step = times[1] - times[0]
+    whole = J2RelativeMotion.j2_sedwick_ensemble(delta_states_0, reference_orbit, times, step, 4, 0.0, 30.0,
+                                                 chunk_size=members)
+    chunked = J2RelativeMotion.j2_sedwick_ensemble(delta_states_0, reference_orbit, times, step, 4, 0.0, 30.0,
+                                                   chunk_size=7)
+    np.testing.assert_allclose(chunked, whole, rtol=1e-12, atol=1e-12)
+    for member in (0, 24, 49):
+        single = J2RelativeMotion.j2_sedwick_propagator(delta_states_0[member], reference_orbit.get_orbit(member),
+                                                        times, step, 4, 0.0, 30.0, False)
+        np.testing.assert_allclose(chunked[member], single, rtol=1e-10, atol=1e-10)
+
+
+@pytest.mark.parametrize("chunk_samples", [1, 2, 7, 100, 4096, 10000])
+def test_range_reduction_carries_passes_across_chunks(chunk_samples):
+    # runs starting in range, single-sample passes, chunks fully in or out of range and a pass ending on the
+    # last sample, against the whole-trajectory reduction
+    pattern = [(1, 10), (0, 3), (1, 1), (0, 200), (1, 300), (0, 1), (1, 1), (0, 4200), (1, 5000)]
+    in_range = np.concatenate([np.full(count, value, dtype=bool) for value, count in pattern])
+    states = np.zeros((len(in_range), 6))
+    states[:, 0] = np.where(in_range, 5.0, 50.0)
+    t = np.arange(1.0, len(in_range) + 1.0)
+    reduction = J2RelativeMotion.RangeReduction(0.0, 30.0)
+    for first in range(0, len(t), chunk_samples):
+        reduction.update(t[first:first + chunk_samples], states[first:first + chunk_samples])
+    assert reduction.get_pass_lengths() == J2RelativeMotion.pass_lengths_from_mask(in_range)
+    assert reduction.in_range_count == np.count_nonzero(in_range)
+    assert reduction.samples == len(t)
+
+
+@pytest.mark.parametrize("chunk_samples", [7, 100, 4096, 30000])
+def test_streamed_reduction_matches_whole_trajectory(chunk_samples):
+    # a drift-free state, in range at the first and last samples with several passes in between
+    reference_orbit = reference_orbits[0]
+    n, c, _, _, _ = J2RelativeMotion.evaluate_j2_constants(reference_orbit, states[1])
+    delta_state_0 = [100.0, 0.0, 20.0, 0.05, -2 * n * c * 100.0, 0.02]
+    times = np.arange(0.0, 20001.0)
+    _, trajectory = J2RelativeMotion.j2_sedwick_trajectory(delta_state_0, reference_orbit, times, 1.0)
+    magnitudes = J2RelativeMotion.range_magnitudes(trajectory[1:])
+    in_range = J2RelativeMotion.in_range_mask(magnitudes, 100.0, 160.0)
+    reduction = J2RelativeMotion.j2_sedwick_stream_reduce(delta_state_0, reference_orbit, 0.0, 1.0, len(times),
+                                                          100.0, 160.0, chunk_samples)
+    assert in_range[0] and in_range[-1] and len(reduction.get_pass_lengths()) > 2
+    assert reduction.get_pass_lengths() == J2RelativeMotion.pass_lengths_from_mask(in_range)
+    assert reduction.in_range_count == np.count_nonzero(in_range)
+    assert reduction.max_range == pytest.approx(magnitudes.max(), rel=1e-12)
+
+
+@pytest.mark.parametrize("thresh_min, thresh_max, end_seconds, inside_at_start, inside_at_end",
+                         [(100.0, 160.0, 20000.0, True, True), (120.0, 200.0, 20000.0, False, False),
+                          (120.0, 200.0, 15000.0, False, True)])
+def test_pass_times_do_not_depend_on_the_sample_step(thresh_min, thresh_max, end_seconds, inside_at_start,
+                                                     inside_at_end):
+    # pass starts and ends are root-found on the closed form, so a 100 s grid finds the same instants as 1 s
+    reference_orbit = reference_orbits[0]
+    n, c, _, _, _ = J2RelativeMotion.evaluate_j2_constants(reference_orbit, states[1])
+    delta_state_0 = [100.0, 0.0, 20.0, 0.05, -2 * n * c * 100.0, 0.02]
+    fine = J2RelativeMotion.j2_sedwick_propagator(delta_state_0, reference_orbit, np.arange(0.0, end_seconds + 1.0),
+                                                  1.0, 5, thresh_min, thresh_max, False)
+    coarse = J2RelativeMotion.j2_sedwick_propagator(delta_state_0, reference_orbit,
+                                                    np.arange(0.0, end_seconds + 1.0, 100.0), 100.0, 5, thresh_min,
+                                                    thresh_max, False)
+    starts, ends = fine
+    assert len(starts) > 2 and len(coarse[0]) == len(starts) and len(coarse[1]) == len(ends)
+    np.testing.assert_allclose(coarse, fine, atol=1e-4)
+    assert (starts[0] == 0.0) == inside_at_start
+    assert (ends[-1] == end_seconds) == inside_at_end
+
+
+@pytest.mark.parametrize("method", ["dopri5", "precise"])
+def test_numerical_methods_match_closed_form(method):
+    reference_orbit = reference_orbits[0]
+    constants = J2RelativeMotion.evaluate_j2_constants(reference_orbit, states[0])
+    t = np.arange(0.0, 5001.0)
+    numerical = J2RelativeMotion.sedwick_resume(states[0], t, constants, method)
+    assert J2RelativeMotion.propagation_error(t, numerical, states[0], constants) < 1e-8
+
+
+@pytest.mark.parametrize("method", ["screening", "precise"])
+def test_numerical_steps_are_counted(method):
+    reference_orbit = reference_orbits[0]
+    constants = J2RelativeMotion.evaluate_j2_constants(reference_orbit, states[1])
+    t = np.arange(0.0, 20001.0)
+    Instrumentation.start(track_memory=False)
+    try:
+        J2RelativeMotion.sedwick_resume(states[1], t, constants, method)
+    finally:
+        counters = Instrumentation.stop()
+    solver, rtol, atol = J2RelativeMotion.numerical_methods[method]
+    solution = solve_ivp(J2RelativeMotion.sedwick_eom(*constants), (t[0], t[-1]), states[1], method=solver,
+                         rtol=rtol, atol=atol, dense_output=True)
+    assert counters.accepted_steps == len(solution.sol.ts) - 1
+    assert counters.rejected_steps >= 0
+    assert counters.rhs_evaluations > 0
+
+
+# (a, i), initial state, (n, c, l, q, phi) of the original mpmath implementation, and the relative tolerance.
+# the original arccos form of the plane angle phi_0 loses about 1e-16 / phi_0^2 of it, which the haversine form
+# fixes, so the closer the orbits the looser the agreement
+baseline_constants = [
+    ((6678136.6, 0.52), [0.1, 0.1, 0.01, -0.02, 0.0, 0.01],
+     [0.0011568736794848626, 1.0004659872457524, -4.228614203322963e-09, 0.0011582797736131416,
+      0.001158742122541585], 1e-4),
+    ((7000000.0, 1.0), [0.0, 0.0, 3e5, 0.0, 0.0, 300.0],
+     [0.0010780076124668337, 0.9999581542320198, -0.20308149024407504, 0.0010779299535692629,
+      0.7384557018894635], 1e-10),
+    ((7000000.0, 1.0), [10.0, -5.0, 2000.0, 0.1, 0.0, -1.5],
+     [0.0010780076124668337, 0.9999581542320198, 0.0011746777346314124, 0.0010780511577630715,
+      0.8209348356271127], 1e-8),
+    ((42164000.0, 0.1), [0.0, 0.0, 50.0, 0.0, 0.0, 0.01],
+     [7.292159859051883e-05, 1.0000182913929865, -1.267865815304976e-09, 7.292558980054142e-05,
+      0.3425657570961071], 1e-5),
+]
+
+
+@pytest.mark.parametrize("orbit, delta_state_0, expected, tolerance", baseline_constants)
+def test_j2_constants_match_original_implementation(orbit, delta_state_0, expected, tolerance):
+    reference_orbit = OrbitalElements.OrbitalElements(orbit[0], 0.0, orbit[1], 0.0, 0.0, 0.0, J2RelativeMotion.mu)
+    np.testing.assert_allclose(J2RelativeMotion.evaluate_j2_constants(reference_orbit, delta_state_0), expected,
+                               rtol=tolerance)
+
+
+@pytest.mark.parametrize("delta_state_0", [[10.0, 0.0, 1e-160, 0.0, 0.0, 0.0], [10.0, 0.0, 0.0, 0.0, 0.0, 1e-160],
+                                           [10.0, 0.0, 1e-160, 0.0, 0.0, -1e-160], [10.0, 0.0, 1e-20, 0.0, 0.0, 0.0]])
+def test_nearly_coplanar_states_stay_finite(delta_state_0):
+    # squares of such z_0 and zd_0 underflow, so these must take the coplanar limit rather than divide by zero
+    reference_orbit = reference_orbits[0]
+    constants = J2RelativeMotion.evaluate_j2_constants(reference_orbit, delta_state_0)
+    assert np.all(np.isfinite(constants))
+    times = np.linspace(0.0, 10000.0, 101)
+    magnitudes = J2RelativeMotion.j2_sedwick_propagator(delta_state_0, reference_orbit, times, times[1], 4, 0.0,
+                                                        30.0, False)
+    coplanar = J2RelativeMotion.j2_sedwick_propagator([10.0, 0.0, 0.0, 0.0, 0.0, 0.0], reference_orbit, times,
+                                                      times[1], 4, 0.0, 30.0, False)
+    np.testing.assert_allclose(magnitudes, coplanar, rtol=1e-12)
@@ -0,0 +1,37 @@
+import numpy as np
+import OrbitalElements
+
+mu = 3.986004415E14
+
+
+def test_element_set_round_trip():
+    rng = np.random.default_rng(7)
+    size = 200
+    elements = OrbitalElements.OrbitalElementSet(rng.uniform(6.7e6, 4.3e7, size), rng.uniform(0.001, 0.7, size),
+                                                 rng.uniform(0.01, 3.1, size), rng.uniform(0.0, 6.28, size),
+                                                 rng.uniform(0.0, 6.28, size), rng.uniform(0.0, 6.28, size), mu)
+    r, v = elements.to_cartesian()
+    round_trip = OrbitalElements.from_cartesian_set(r, v, mu)
+    np.testing.assert_allclose(round_trip.get_a(), elements.get_a(), rtol=1e-9)
+    np.testing.assert_allclose(round_trip.get_e(), elements.get_e(), atol=1e-9)
+    for name in ('get_i', 'get_w', 'get_o', 'get_nu'):
+        difference = getattr(round_trip, name)() - getattr(elements, name)()
+        np.testing.assert_allclose(np.angle(np.exp(1j * difference)), 0.0, atol=1e-7)
+
+
+def test_element_set_matches_single_orbits():
+    elements = OrbitalElements.OrbitalElementSet([7.0e6, 8.0e6], [0.01, 0.2], [0.5, 1.2], [0.3, 2.0], [1.0, 4.0],
+                                                 [0.2, 5.0], mu)
+    r, v = elements.to_cartesian()
+    for index in range(len(elements)):
+        r_single, v_single = elements.get_orbit(index).get_cartesian()
+        np.testing.assert_allclose(r[index], r_single, rtol=1e-12)
+        np.testing.assert_allclose(v[index], v_single, rtol=1e-12)
+
+    # circular and equatorial orbits come back in the conventions of to_cartesian
+    special = OrbitalElements.OrbitalElementSet([7.0e6, 7.0e6, 7.0e6], [0.0, 0.1, 0.0], [0.7, 0.0, 0.0],
+                                                [0.0, 1.0, 0.0], [2.0, 0.0, 0.0], [1.5, 0.5, 3.0], mu)
+    r, v = special.to_cartesian()
+    round_trip = OrbitalElements.from_cartesian_set(r, v, mu)
+    np.testing.assert_allclose(round_trip.to_cartesian()[0], r, atol=1e-6)
+    np.testing.assert_allclose(round_trip.to_cartesian()[1], v, atol=1e-9)
@@ -0,0 +1,11 @@
+import pytest
+import StartupBudget
+
+
+@pytest.mark.parametrize("target", sorted(StartupBudget.budgets))
+def test_cold_start_defers_heavy_modules(target):
+    # only the deferred imports are checked here, start times depend on the machine
+    if target == "gui":
+        pytest.importorskip("PyQt5")
+    _, modules = StartupBudget.measure_startup(target, repeats=1)
+    assert [name for name in StartupBudget.budgets[target]["deferred_modules"] if name in modules] == []
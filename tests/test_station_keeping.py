@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+import OrbitalElements
+import J2RelativeMotion
+import StationKeeping
+
+reference_orbit = OrbitalElements.OrbitalElements(6678136.6, 0.0, 0.52, 0.0, 0.0, 0.0, J2RelativeMotion.mu)
+state = [0.1, 0.1, 0.01, -0.02, 0.0, 0.01]
+desired_state = [1.41421, 14.1421, 1.41421, 0.0, 0.0, 0.0]
+
+
+def test_campaign_stays_finite():
+    campaign = StationKeeping.simulate_station_keeping(state, [0.0, 14.1421, 0.0, 0.0, 0.0, 0.0], reference_orbit,
+                                                       10.0, 10 * 86400, 0.0, 30.0)
+    assert len(campaign.get_maneuvers()) > 0
+    assert np.all(np.isfinite(campaign.get_states()))
+    assert np.isfinite(campaign.get_delta_v_budget())
+
+
+def test_non_finite_arc_stops_the_campaign(monkeypatch):
+    # an arc with non-finite constants must not be stitched into the campaign
+    evaluate = J2RelativeMotion.evaluate_j2_constants
+    arcs = []
+
+    def failing_after_first_arc(orbit, delta_state_0):
+        arcs.append(delta_state_0)
+        constants = evaluate(orbit, delta_state_0)
+        return constants if len(arcs) == 1 else constants[:2] + (np.nan, np.nan, np.inf)
+
+    monkeypatch.setattr(J2RelativeMotion, "evaluate_j2_constants", failing_after_first_arc)
+    with pytest.raises(RuntimeError):
+        StationKeeping.simulate_station_keeping(state, desired_state, reference_orbit, 10.0, 10 * 86400, 0.0, 30.0)
+    assert len(arcs) == 2